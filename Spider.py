@@ -8,6 +8,7 @@ import time
 import requests
 import os
 import base64
+import binascii
 import hashlib
 from PIL import Image
 import io
@@ -17,6 +18,11 @@ from concurrent.futures import ThreadPoolExecutor
 import imagehash
 import json
 
+from hash_store import CompactHashSet
+from content_index import get_content_index
+from crawl_concurrency import AIMDController
+from image_quality import QualityGate, make_preview
+
 
 # 初始化浏览器
 options = webdriver.ChromeOptions()
@@ -41,11 +47,14 @@ def load_checkpoint():
         with open(CHECKPOINT_FILE, 'r') as f:
             data = json.load(f)
             return {
-                "processed_hashes": set(data["processed_hashes"]),
+                "processed_hashes": CompactHashSet(data["processed_hashes"]),
+                # 质量不合格或无法解码的内容，之后不再下载与解码
+                "rejected_hashes": CompactHashSet(data.get("rejected_hashes", [])),
                 "last_index": data["last_index"]
             }
     return {
-        "processed_hashes": set(),
+        "processed_hashes": CompactHashSet(),
+        "rejected_hashes": CompactHashSet(),
         "last_index": 0
     }
 
@@ -54,12 +63,16 @@ def save_checkpoint(checkpoint):
     with open(CHECKPOINT_FILE, 'w') as f:
         json.dump({
             "processed_hashes": list(checkpoint["processed_hashes"]),
+            "rejected_hashes": list(checkpoint["rejected_hashes"]),
             "last_index": checkpoint["last_index"]
         }, f)
 
 # 加载进度
 checkpoint = load_checkpoint()
-processed_hashes = set(checkpoint["processed_hashes"])
+# 检查点与去重共用同一个哈希集合实例
+processed_hashes = checkpoint["processed_hashes"]
+rejected_hashes = checkpoint["rejected_hashes"]
+print(f"已加载 {len(processed_hashes)} 个哈希，占用 {processed_hashes.memory_footprint()} 字节")
 last_index = checkpoint["last_index"]
 
 
@@ -84,14 +97,36 @@ while True:
 print(f"找到 {len(thumbnails)} 张缩略图，从索引 {last_index} 开始处理")
 
 # 创建保存目录
-if not os.path.exists("高清图片"):
-    os.makedirs("高清图片")
+SAVE_DIR = "高清图片"
+if not os.path.exists(SAVE_DIR):
+    os.makedirs(SAVE_DIR)
 
 # 线程安全数据结构
 hash_lock = threading.Lock()
 image_lock = threading.Lock()
 phash_set = set()
 
+# 下载并发由AIMD控制器在上下限之间动态调整
+MAX_DOWNLOAD_WORKERS = 16
+concurrency = AIMDController(min_limit=2, max_limit=MAX_DOWNLOAD_WORKERS)
+# 保存前的质量过滤，阈值与spider.py一致
+quality_gate = QualityGate()
+
+
+def fetch_image(img_url, headers, timeout=15):
+    """下载图片，并把延迟、错误与限流情况反馈给并发控制器"""
+    with concurrency.slot():
+        start = time.monotonic()
+        try:
+            response = requests.get(img_url, headers=headers, timeout=timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            status = getattr(e.response, "status_code", None)
+            concurrency.record(time.monotonic() - start, ok=False, throttled=status in (429, 503))
+            raise
+        concurrency.record(time.monotonic() - start, nbytes=len(response.content))
+        return response.content
+
 
 def calculate_phash(image):
     """计算感知哈希"""
@@ -114,9 +149,40 @@ def is_duplicate(img_pil):
         return False
 
 
+def place_known_content(current_hash, img_url=None):
+    """内容已被其他任务保存时，直接链接到当前目录"""
+    content_index = get_content_index()
+    placed = content_index.place(current_hash, SAVE_DIR)
+    if placed is None:
+        return False
+    content_index.record_url(img_url, current_hash)
+    with hash_lock:
+        processed_hashes.add(current_hash)
+        save_checkpoint(checkpoint)
+    print(f"复用已有内容: {placed}")
+    return True
+
+
+def reject_content(current_hash, img_url):
+    """记住被拒绝的内容；URL登记到全局索引，下次无需再下载"""
+    get_content_index().record_url(img_url, current_hash)
+    with hash_lock:
+        rejected_hashes.add(current_hash)
+        save_checkpoint(checkpoint)
+
+
 def download_image(img_url):
     # 下载图片数据
     try:
+        # 全局索引中已知的URL无需再次下载
+        known_hash = get_content_index().lookup_url(img_url)
+        if known_hash is not None:
+            with hash_lock:
+                if known_hash in processed_hashes or known_hash in rejected_hashes:
+                    return
+            if place_known_content(known_hash):
+                return
+
         headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
         }
@@ -130,9 +196,7 @@ def download_image(img_url):
                 return
         else:
             try:
-                response = requests.get(img_url, headers=headers, timeout=15)
-                response.raise_for_status()
-                img_data = response.content
+                img_data = fetch_image(img_url, headers)
             except Exception as e:
                 print(f"下载失败: {str(e)}")
                 return
@@ -148,7 +212,11 @@ def download_image(img_url):
             if current_hash in processed_hashes:
                 print(f"重复哈希: {current_hash[:8]}...")
                 return
+            if current_hash in rejected_hashes:
+                return
 
+        if place_known_content(current_hash, img_url):
+            return
 
         # 验证图片完整性
         try:
@@ -157,32 +225,44 @@ def download_image(img_url):
             img_pil = Image.open(io.BytesIO(img_data))  # 重新打开
         except Exception as e:
             print(f"图片验证失败: {str(e)}")
+            reject_content(current_hash, img_url)
             return
 
+        # 解码一次缩小的灰度图，供相似性检查与质量评分共用
+        original_size = img_pil.size
+        preview = make_preview(img_pil)
+
         # 相似性检查
-        if is_duplicate(img_pil):
+        if is_duplicate(preview):
             print(f"发现相似图片")
             return
 
+        # 质量检查
+        reason, scores = quality_gate.check(preview, original_size)
+        if reason is not None:
+            print(f"质量不合格({reason}): {scores}")
+            reject_content(current_hash, img_url)
+            return
+
         # 保存图片
-        filename = f"高清图片/{current_hash}.jpg"
+        filename = f"{SAVE_DIR}/{current_hash}.jpg"
         with open(filename, "wb") as f:
             f.write(img_data)
+        get_content_index().register(current_hash, filename, img_url)
 
 
         with hash_lock:
             processed_hashes.add(current_hash)
-            checkpoint["processed_hashes"].add(current_hash)
             save_checkpoint(checkpoint)
         with image_lock:
-            phash_set.add(calculate_phash(img_pil))
+            phash_set.add(calculate_phash(preview))
 
         print(f"成功保存: {filename}")
     except Exception as e:
         print(f"下载失败: {str(e)}")
 
 # 使用线程池管理并发
-with ThreadPoolExecutor(max_workers=4) as executor:
+with ThreadPoolExecutor(max_workers=MAX_DOWNLOAD_WORKERS) as executor:
     for offset, thumbnail in enumerate(thumbnails[last_index:]):
         current_index = last_index + offset
         print(f"正在处理第 {current_index + 1}/{len(thumbnails)} 张缩略图")
@@ -228,4 +308,7 @@ with ThreadPoolExecutor(max_workers=4) as executor:
 try:
     browser.quit()
 except:
-    pass
\ No newline at end of file
+    pass
+
+print(f"下载并发上限: {concurrency.limit}，调整记录 {len(concurrency.history)} 条")
+print(f"质量过滤: {quality_gate.stats()}")
\ No newline at end of file
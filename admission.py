@@ -0,0 +1,277 @@
+"""视觉模型请求的准入控制与公平排队
+
+多个巡检小组同时上传时，请求全部直接转发给模型服务，Ollama在内部排队，所有人的延迟一起变长直至超时。
+这里按模型限制同时进行的请求数，超出的请求在本地排队：
+- 交互对话优先于批量巡检、批量标注；批量请求不占用为交互对话保留的槽位；
+- 同一优先级内按用户轮流放行，单个用户的大量请求不会挡住其他人；
+- 队列已满或等待超时时立即返回429，并按当前的平均处理时间给出Retry-After。
+"""
+
+import asyncio
+import json
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from starlette.background import BackgroundTask
+from starlette.responses import StreamingResponse
+
+PRIORITIES = ("interactive", "batch")
+PRIORITY_HEADER = "X-Request-Priority"
+
+ADMISSION_MAX_CONCURRENCY = int(os.environ.get("ADMISSION_MAX_CONCURRENCY", "4"))
+# 按模型覆盖并发上限，如 {"qwen2.5vl:72b": 1}；0表示该模型不限制
+ADMISSION_MAX_CONCURRENCY_BY_MODEL = json.loads(
+    os.environ.get("ADMISSION_MAX_CONCURRENCY_BY_MODEL", "{}")
+)
+# 每个模型的排队上限，超出后直接返回429
+ADMISSION_MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", "32"))
+ADMISSION_MAX_WAIT = float(os.environ.get("ADMISSION_MAX_WAIT", "60"))
+# 为交互对话保留的槽位数，批量请求最多使用其余的槽位
+ADMISSION_INTERACTIVE_RESERVED = int(os.environ.get("ADMISSION_INTERACTIVE_RESERVED", "1"))
+
+
+class QueueFull(Exception):
+    """排队已满或等待超时；status_code与批量接口的重试判断一致"""
+
+    status_code = 429
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def priority_of(value):
+    """未知或缺省的优先级按交互对话处理"""
+    return value if value in PRIORITIES else "interactive"
+
+
+class Ticket:
+    """已获得的槽位，release可重复调用"""
+
+    def __init__(self, lane, priority, waited):
+        self.lane = lane
+        self.priority = priority
+        self.waited = waited
+        self.started = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.lane.release(self)
+
+
+class ModelLane:
+    """单个模型的槽位与按优先级、按用户分组的等待队列"""
+
+    def __init__(self, limit, max_queue, reserved):
+        self.limit = limit
+        self.max_queue = max_queue
+        # 至少给批量请求留一个槽位
+        self.batch_limit = max(limit - reserved, 1)
+        self.active = {priority: 0 for priority in PRIORITIES}
+        # 优先级 -> 用户 -> 等待中的future；OrderedDict的顺序即轮转顺序
+        self.waiting = {priority: OrderedDict() for priority in PRIORITIES}
+        self.queued = 0
+
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.recent_waits = deque(maxlen=1000)
+        # 槽位占用时长的滑动平均，用于估算Retry-After
+        self.mean_hold = None
+
+    def has_room(self, priority):
+        total = sum(self.active.values())
+        if total >= self.limit:
+            return False
+        return priority == "interactive" or self.active["batch"] < self.batch_limit
+
+    def retry_after(self):
+        hold = self.mean_hold or 10.0
+        return max(1, math.ceil(hold * (self.queued + 1) / self.limit))
+
+    def _grant(self, priority):
+        self.active[priority] += 1
+        self.admitted += 1
+
+    def _dispatch(self):
+        """有空闲槽位时按优先级、用户轮转放行等待中的请求"""
+        for priority in PRIORITIES:
+            users = self.waiting[priority]
+            while users and self.has_room(priority):
+                user_id, futures = next(iter(users.items()))
+                future = futures.popleft()
+                self.queued -= 1
+                if futures:
+                    users.move_to_end(user_id)
+                else:
+                    del users[user_id]
+                if not future.done():
+                    self._grant(priority)
+                    future.set_result(None)
+
+    def _remove(self, priority, user_id, future):
+        futures = self.waiting[priority].get(user_id)
+        if futures and future in futures:
+            futures.remove(future)
+            self.queued -= 1
+            if not futures:
+                del self.waiting[priority][user_id]
+
+    async def acquire(self, user_id, priority, max_wait):
+        start = time.monotonic()
+        # 同级或更高优先级已有人排队时不插队
+        ahead = PRIORITIES[: PRIORITIES.index(priority) + 1]
+        if not any(self.waiting[p] for p in ahead) and self.has_room(priority):
+            self._grant(priority)
+            return self._observe_wait(priority, 0.0)
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise QueueFull("模型繁忙，请稍后重试", self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[priority].setdefault(user_id, deque()).append(future)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), max_wait)
+        except asyncio.TimeoutError:
+            self._remove(priority, user_id, future)
+            if not future.done():
+                future.cancel()
+                self.timed_out += 1
+                raise QueueFull("排队等待超时，请稍后重试", self.retry_after())
+        except asyncio.CancelledError:
+            # 客户端断开：已分到的槽位要归还，否则从队列中移除
+            self._remove(priority, user_id, future)
+            if future.done() and not future.cancelled():
+                self.active[priority] -= 1
+                self._dispatch()
+            else:
+                future.cancel()
+            raise
+        return self._observe_wait(priority, time.monotonic() - start)
+
+    def _observe_wait(self, priority, waited):
+        self.wait_seconds += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        self.recent_waits.append(waited)
+        return Ticket(self, priority, waited)
+
+    def release(self, ticket):
+        hold = time.monotonic() - ticket.started
+        self.mean_hold = hold if self.mean_hold is None else 0.8 * self.mean_hold + 0.2 * hold
+        self.active[ticket.priority] -= 1
+        self._dispatch()
+
+    def stats(self):
+        waits = sorted(self.recent_waits)
+        return {
+            "limit": self.limit,
+            "batch_limit": self.batch_limit,
+            "active": dict(self.active),
+            "queued": {
+                priority: sum(len(futures) for futures in self.waiting[priority].values())
+                for priority in PRIORITIES
+            },
+            "queued_users": {priority: len(self.waiting[priority]) for priority in PRIORITIES},
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "mean_wait_ms": round(self.wait_seconds / self.admitted * 1000, 1) if self.admitted else None,
+            "p95_wait_ms": round(waits[int(len(waits) * 0.95)] * 1000, 1) if waits else None,
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 1),
+            "mean_hold_ms": round(self.mean_hold * 1000, 1) if self.mean_hold is not None else None,
+        }
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_concurrency=ADMISSION_MAX_CONCURRENCY,
+        max_concurrency_by_model=None,
+        max_queue=ADMISSION_MAX_QUEUE,
+        max_wait=ADMISSION_MAX_WAIT,
+        interactive_reserved=ADMISSION_INTERACTIVE_RESERVED,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_concurrency_by_model = (
+            ADMISSION_MAX_CONCURRENCY_BY_MODEL
+            if max_concurrency_by_model is None
+            else max_concurrency_by_model
+        )
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.interactive_reserved = interactive_reserved
+        self._lanes = {}
+
+    def lane(self, model_id):
+        """不限制并发的模型返回None"""
+        if model_id not in self._lanes:
+            limit = self.max_concurrency_by_model.get(model_id, self.max_concurrency)
+            self._lanes[model_id] = (
+                ModelLane(limit, self.max_queue, self.interactive_reserved) if limit > 0 else None
+            )
+        return self._lanes[model_id]
+
+    async def acquire(self, model_id, user_id, priority="interactive"):
+        """等待槽位并返回Ticket；模型不限制并发时返回None"""
+        lane = self.lane(model_id)
+        if lane is None:
+            return None
+        return await lane.acquire(user_id, priority_of(priority), self.max_wait)
+
+    @asynccontextmanager
+    async def slot(self, model_id, user_id, priority="batch"):
+        ticket = await self.acquire(model_id, user_id, priority)
+        try:
+            yield ticket
+        finally:
+            if ticket:
+                ticket.release()
+
+    @staticmethod
+    def hold(response, ticket):
+        """流式响应在输出结束后才归还槽位，其他响应立即归还
+
+        流式响应的输出从未开始（客户端在响应头发出前断开）时，由后台任务兜底归还。
+        """
+        if ticket is None:
+            return response
+        if not isinstance(response, StreamingResponse):
+            ticket.release()
+            return response
+
+        original = response.body_iterator
+
+        async def body():
+            try:
+                async for chunk in original:
+                    yield chunk
+            finally:
+                ticket.release()
+
+        previous = response.background
+
+        async def release():
+            ticket.release()
+            if previous is not None:
+                await previous()
+
+        response.body_iterator = body()
+        response.background = BackgroundTask(release)
+        return response
+
+    def stats(self):
+        return {
+            "max_queue": self.max_queue,
+            "max_wait_s": self.max_wait,
+            "models": {
+                model_id: lane.stats() for model_id, lane in self._lanes.items() if lane is not None
+            },
+        }
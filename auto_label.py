@@ -0,0 +1,352 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import mimetypes
+import os
+import random
+import tarfile
+import time
+import zipfile
+
+import aiohttp
+
+from road_prompts import PROMPT_TEMPLATES, SCENE_LABELS
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+ARCHIVE_EXTENSIONS = (".tar.gz", ".tgz", ".tar", ".zip")
+LABELS_FILE = "labels.jsonl"
+CHECKPOINT_FILE = "./temp/auto_label_checkpoint.json"
+DEFAULT_ENDPOINT = os.environ.get("LABEL_ENDPOINT", "http://localhost:8080/api/chat/completions")
+
+# 提示词要求模型在没有异常时明确回答“未发现”
+NOT_FOUND_MARK = "未发现"
+
+
+def labels_path_for(path):
+    """标注记录写在图片旁边：目录内的labels.jsonl，或与归档分片同名的.labels.jsonl"""
+    if os.path.isdir(path):
+        return os.path.join(path, LABELS_FILE)
+    for ext in ARCHIVE_EXTENSIONS:
+        if path.lower().endswith(ext):
+            return path[:-len(ext)] + ".labels.jsonl"
+    return path + ".labels.jsonl"
+
+
+def file_stamp(path):
+    stat = os.stat(path)
+    return stat.st_mtime, stat.st_size
+
+
+def iter_images(path, min_age=0.0, seen=None):
+    """产出(图片名称, 图片数据)；path可以是爬取输出目录或tar/zip归档分片
+
+    min_age用于跟随模式，跳过刚写入、可能还不完整的文件。
+    seen为dict时记录已读取的目录内文件或归档的(修改时间, 大小)，未变化的不再读取。
+    """
+    if os.path.isdir(path):
+        now = time.time()
+        for name in sorted(os.listdir(path)):
+            full = os.path.join(path, name)
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            stamp = file_stamp(full)
+            if min_age and now - stamp[0] < min_age:
+                continue
+            if seen is not None:
+                if seen.get(full) == stamp:
+                    continue
+                seen[full] = stamp
+            with open(full, "rb") as f:
+                yield name, f.read()
+        return
+
+    if seen is not None:
+        stamp = file_stamp(path)
+        if seen.get(path) == stamp:
+            return
+        seen[path] = stamp
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                    yield info.filename, zf.read(info)
+    elif tarfile.is_tarfile(path):
+        # 按成员顺序流式读取，压缩的tar也无需解压到磁盘
+        with tarfile.open(path) as tf:
+            for member in tf:
+                if member.isfile() and member.name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield member.name, tf.extractfile(member).read()
+    else:
+        raise ValueError(f"不支持的输入: {path}")
+
+
+def load_labeled(labels_path):
+    """已写入标注文件的图片MD5，用于断点续标时跳过"""
+    labeled = set()
+    if os.path.exists(labels_path):
+        with open(labels_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    labeled.add(json.loads(line)["md5"])
+                except (ValueError, KeyError):
+                    continue
+    return labeled
+
+
+def data_uri(name, data):
+    mime = mimetypes.guess_type(name)[0] or "image/jpeg"
+    return f"data:{mime};base64,{base64.b64encode(data).decode()}"
+
+
+class RetryableError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AutoLabeler:
+    """把爬取的图片批量送入巡检模型，按场景生成结构化标注
+
+    每张图片对每个场景（抛洒物、标志线、坑槽）各请求一次，请求并发受限，
+    遇到限流、超时或服务端错误时按指数退避重试。
+    """
+
+    def __init__(
+        self,
+        model,
+        endpoint=DEFAULT_ENDPOINT,
+        api_key=None,
+        scenes=("pao", "biao", "keng"),
+        concurrency=4,
+        retries=3,
+        timeout=120,
+        max_failures=3,
+        send_system_prompt=False,
+        checkpoint_path=CHECKPOINT_FILE,
+    ):
+        unknown = [scene for scene in scenes if scene not in SCENE_LABELS]
+        if unknown:
+            raise ValueError(f"未知的标注场景: {', '.join(unknown)}")
+        self.model = model
+        self.endpoint = endpoint
+        self.api_key = api_key
+        self.scenes = list(scenes)
+        self.concurrency = concurrency
+        self.retries = retries
+        self.timeout = timeout
+        self.max_failures = max_failures
+        # 通过WebUI的对话接口调用时服务端会按关键词插入系统提示词，直连模型服务时需自行发送
+        self.send_system_prompt = send_system_prompt
+        self.checkpoint_path = checkpoint_path
+
+        self.done = set()
+        self.failed = {}
+        self._loaded_inputs = set()
+        # 跟随模式下已读取的文件 -> (修改时间, 大小)，每轮只读取和计算新文件的MD5
+        self._seen = {}
+        self.labeled = 0
+        self.skipped = 0
+        self.requests = 0
+        self.retried = 0
+        self.request_seconds = 0.0
+        self.load_checkpoint()
+
+    def load_checkpoint(self):
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, "r") as f:
+                data = json.load(f)
+            self.done = set(data.get("done", []))
+            self.failed = data.get("failed", {})
+
+    def save_checkpoint(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.checkpoint_path)), exist_ok=True)
+        with open(self.checkpoint_path, "w") as f:
+            json.dump({"done": sorted(self.done), "failed": self.failed}, f)
+
+    def build_messages(self, scene, image_url):
+        label = SCENE_LABELS[scene]
+        messages = [dict(PROMPT_TEMPLATES[scene])] if self.send_system_prompt else []
+        messages.append({
+            "role": "user",
+            "content": [
+                # 文本中带上场景关键词，WebUI据此选择对应的系统提示词
+                {"type": "text", "text": f"请识别图片中的{label}"},
+                {"type": "image_url", "image_url": {"url": image_url}},
+            ],
+        })
+        return messages
+
+    async def request(self, session, scene, image_url):
+        payload = {
+            "model": self.model,
+            "messages": self.build_messages(scene, image_url),
+            "stream": False,
+        }
+        attempt = 0
+        while True:
+            try:
+                async with self._slots:
+                    self.requests += 1
+                    start = time.monotonic()
+                    try:
+                        async with session.post(self.endpoint, json=payload) as response:
+                            if response.status == 429 or response.status >= 500:
+                                retry_after = response.headers.get("Retry-After")
+                                raise RetryableError(
+                                    f"HTTP {response.status}",
+                                    float(retry_after) if retry_after and retry_after.isdigit() else None,
+                                )
+                            response.raise_for_status()
+                            data = await response.json()
+                    finally:
+                        self.request_seconds += time.monotonic() - start
+                return data["choices"][0]["message"]["content"]
+            except (RetryableError, aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+                delay = getattr(e, "retry_after", None)
+                if delay is None:
+                    delay = min(2 ** attempt, 30) + random.random()
+                self.retried += 1
+                print(f"[{SCENE_LABELS[scene]}] 请求失败({str(e) or type(e).__name__})，{delay:.1f}秒后重试")
+                await asyncio.sleep(delay)
+
+    async def label_image(self, session, name, md5, data):
+        image_url = data_uri(name, data)
+        start = time.monotonic()
+        answers = await asyncio.gather(*(self.request(session, scene, image_url) for scene in self.scenes))
+        return {
+            "image": name,
+            "md5": md5,
+            "model": self.model,
+            "labels": {
+                SCENE_LABELS[scene]: {
+                    "found": NOT_FOUND_MARK not in answer,
+                    "description": answer.strip(),
+                }
+                for scene, answer in zip(self.scenes, answers)
+            },
+            "elapsed_s": round(time.monotonic() - start, 2),
+            "created": time.time(),
+        }
+
+    async def _worker(self, session, queue):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            labels_path, name, data, source = item
+            md5 = hashlib.md5(data).hexdigest()
+            if md5 in self.done or self.failed.get(md5, {}).get("attempts", 0) >= self.max_failures:
+                self.skipped += 1
+                continue
+
+            # 先登记，避免同一内容的副本被并发重复标注
+            self.done.add(md5)
+            try:
+                record = await self.label_image(session, name, md5, data)
+            except Exception as e:
+                self.done.discard(md5)
+                # 下一轮扫描时重新读取，失败次数未达上限时再试
+                self._seen.pop(source, None)
+                attempts = self.failed.get(md5, {}).get("attempts", 0) + 1
+                self.failed[md5] = {"image": name, "error": str(e), "attempts": attempts}
+                print(f"标注失败: {name} {str(e)}")
+                continue
+
+            self.failed.pop(md5, None)
+            with open(labels_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.labeled += 1
+            if self.labeled % 20 == 0:
+                self.save_checkpoint()
+                print(f"已标注 {self.labeled} 张图片")
+
+    async def run_once(self, session, inputs, min_age=0.0, follow=False):
+        # 标注文件中已有的记录也视为完成，检查点落后时不会重复标注
+        for path in inputs:
+            if path not in self._loaded_inputs:
+                self.done |= load_labeled(labels_path_for(path))
+                self._loaded_inputs.add(path)
+
+        # 读取在线程中进行，队列有界，读取速度不会超过标注速度太多
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        loop = asyncio.get_running_loop()
+
+        def produce():
+            for path in inputs:
+                labels_path = labels_path_for(path)
+                is_dir = os.path.isdir(path)
+                for name, data in iter_images(path, min_age, self._seen if follow else None):
+                    source = os.path.join(path, name) if is_dir else path
+                    asyncio.run_coroutine_threadsafe(queue.put((labels_path, name, data, source)), loop).result()
+
+        workers = [asyncio.create_task(self._worker(session, queue)) for _ in range(self.concurrency)]
+        try:
+            await asyncio.to_thread(produce)
+        finally:
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+            self.save_checkpoint()
+
+    async def run(self, inputs, follow=False, interval=30.0, min_age=5.0):
+        """标注所有输入；follow为True时持续扫描爬取目录中的新图片"""
+        self._slots = asyncio.Semaphore(self.concurrency)
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        # 标注请求在服务端按批量优先级排队，不挤占交互对话
+        headers["X-Request-Priority"] = "batch"
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        started = time.monotonic()
+        async with aiohttp.ClientSession(timeout=timeout, headers=headers) as session:
+            while True:
+                await self.run_once(session, inputs, min_age if follow else 0.0, follow)
+                if not follow:
+                    break
+                await asyncio.sleep(interval)
+        return self.stats(time.monotonic() - started)
+
+    def stats(self, elapsed=None):
+        return {
+            "labeled": self.labeled,
+            "skipped": self.skipped,
+            "failed": len(self.failed),
+            "requests": self.requests,
+            "retried": self.retried,
+            "mean_request_s": round(self.request_seconds / self.requests, 2) if self.requests else None,
+            "images_per_min": round(self.labeled / elapsed * 60, 2) if elapsed else None,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="用巡检模型批量标注爬取的图片")
+    parser.add_argument("inputs", nargs="+", help="爬取输出目录或tar/zip归档分片")
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--endpoint", default=DEFAULT_ENDPOINT)
+    parser.add_argument("--api-key", default=os.environ.get("LABEL_API_KEY"))
+    parser.add_argument("--scenes", default="pao,biao,keng")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE)
+    parser.add_argument("--system-prompt", action="store_true", help="直连模型服务时自行发送系统提示词")
+    parser.add_argument("--follow", action="store_true", help="持续标注爬取目录中新增的图片")
+    parser.add_argument("--interval", type=float, default=30.0)
+    args = parser.parse_args()
+
+    labeler = AutoLabeler(
+        args.model,
+        endpoint=args.endpoint,
+        api_key=args.api_key,
+        scenes=[scene for scene in args.scenes.split(",") if scene],
+        concurrency=args.concurrency,
+        retries=args.retries,
+        send_system_prompt=args.system_prompt,
+        checkpoint_path=args.checkpoint,
+    )
+    try:
+        print(json.dumps(asyncio.run(labeler.run(args.inputs, args.follow, args.interval)), ensure_ascii=False))
+    except KeyboardInterrupt:
+        labeler.save_checkpoint()
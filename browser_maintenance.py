@@ -0,0 +1,177 @@
+import bisect
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+MB = 1024 * 1024
+
+# 可由任务配置的维护参数；选择器由搜索来源决定
+MAINTENANCE_OPTIONS = ("prune_every", "memory_limit_mb")
+
+# 删除已处理缩略图所在的结果卡片；卡片内有多张缩略图时只删除图片本身；返回实际删除的元素在参数中的位置
+PRUNE_THUMBNAILS_JS = """
+const removed = [];
+arguments[0].forEach((img, i) => {
+    if (!img || !img.isConnected) return;
+    const card = img.closest('[data-ri], [data-id], [data-lpage]');
+    const target = card && card.querySelectorAll(arguments[1]).length === 1 ? card : img;
+    target.remove();
+    removed.push(i);
+});
+return removed;
+"""
+
+# 删除不可见的旧预览大图，保留最近一张；结果列表中的缩略图（匹配arguments[1]或在其内部）不删除
+PRUNE_PREVIEWS_JS = """
+const previews = Array.from(document.querySelectorAll(arguments[0]));
+let removed = 0;
+previews.slice(0, -1).forEach(img => {
+    if (img.closest(arguments[1])) return;
+    if (img.offsetParent === null) {
+        img.removeAttribute('src');
+        img.remove();
+        removed += 1;
+    }
+});
+return removed;
+"""
+
+
+def browser_process_rss(browser):
+    """chromedriver启动的浏览器进程树（主进程、渲染、GPU等）的常驻内存MB
+
+    图片解码与GPU占用不计入JS堆，只有进程内存能反映图片网格页面的增长；
+    远程WebDriver或未安装psutil时返回None。
+    """
+    if psutil is None:
+        return None
+    try:
+        root = psutil.Process(browser.service.process.pid)
+        processes = root.children(recursive=True)
+    except (AttributeError, psutil.Error):
+        return None
+    total = 0
+    for process in processes:
+        try:
+            total += process.memory_info().rss
+        except psutil.Error:
+            continue
+    return total / MB
+
+
+def browser_memory(browser):
+    """读取浏览器进程内存，并通过CDP读取页面JS堆大小与DOM节点数；都无法读取时返回None"""
+    rss_mb = browser_process_rss(browser)
+    try:
+        browser.execute_cdp_cmd("Performance.enable", {})
+        metrics = browser.execute_cdp_cmd("Performance.getMetrics", {})["metrics"]
+    except Exception:
+        metrics = None
+    if metrics is None and rss_mb is None:
+        return None
+    values = {m["name"]: m["value"] for m in metrics or []}
+    return {
+        "rss_mb": rss_mb,
+        "js_heap_mb": values.get("JSHeapUsedSize", 0) / MB,
+        "nodes": int(values.get("Nodes", 0)),
+    }
+
+
+class BrowserMaintainer:
+    """长时间爬取时定期清理DOM，内存超限时提示重启浏览器会话
+
+    登记缩略图时给出结果索引，可记录当前页面上已被删除的结果，
+    重新收集结果后用position()把原始索引换算为页面中的位置。
+    """
+
+    def __init__(
+        self,
+        prune_every=50,
+        memory_limit_mb=2048,
+        thumbnail_selector="img.YQ4gaf",
+        preview_selector="img[jsname='kn3ccd']",
+    ):
+        self.prune_every = prune_every
+        self.memory_limit_mb = memory_limit_mb
+        self.thumbnail_selector = thumbnail_selector
+        self.preview_selector = preview_selector
+        self._pending = []
+        # 当前页面上已删除的结果索引，有序
+        self.pruned = []
+        self.prunes = 0
+        self.thumbnails_removed = 0
+        self.previews_removed = 0
+        self.restarts = 0
+        self.memory_samples = []
+
+    def processed(self, thumbnail, index=None):
+        """登记已处理完的缩略图元素及其结果索引"""
+        self._pending.append((index, thumbnail))
+
+    def position(self, index):
+        """原始结果索引在当前页面结果列表中的位置；该结果已被删除时返回None"""
+        pos = bisect.bisect_left(self.pruned, index)
+        if pos < len(self.pruned) and self.pruned[pos] == index:
+            return None
+        return index - pos
+
+    def pruned_between(self, start, end=None):
+        """[start, end)内是否有已从页面删除的结果"""
+        pos = bisect.bisect_left(self.pruned, start)
+        return pos < len(self.pruned) and (end is None or self.pruned[pos] < end)
+
+    def new_page(self):
+        """重新打开搜索页后，页面上的结果完整，不再需要换算"""
+        self._pending = []
+        self.pruned = []
+
+    def maintain(self, browser):
+        """处理满prune_every张后清理一次，返回是否需要重启会话"""
+        if len(self._pending) < self.prune_every:
+            return False
+
+        pending, self._pending = self._pending, []
+        try:
+            removed = browser.execute_script(
+                PRUNE_THUMBNAILS_JS, [thumbnail for _, thumbnail in pending], self.thumbnail_selector
+            ) or []
+            self.thumbnails_removed += len(removed)
+            for i in removed:
+                if pending[i][0] is not None:
+                    bisect.insort(self.pruned, pending[i][0])
+            # 不打开预览面板的来源没有预览选择器
+            if self.preview_selector:
+                self.previews_removed += browser.execute_script(
+                    PRUNE_PREVIEWS_JS, self.preview_selector, self.thumbnail_selector
+                ) or 0
+        except Exception as e:
+            print(f"DOM清理失败: {str(e)}")
+        self.prunes += 1
+
+        memory = browser_memory(browser)
+        if memory is None:
+            return False
+        rss_mb = round(memory["rss_mb"], 1) if memory["rss_mb"] is not None else None
+        self.memory_samples.append((time.time(), rss_mb, round(memory["js_heap_mb"], 1), memory["nodes"]))
+        # 能读取进程内存时以其为准，否则退回JS堆大小
+        used_mb = memory["rss_mb"] if memory["rss_mb"] is not None else memory["js_heap_mb"]
+        return used_mb >= self.memory_limit_mb
+
+    def restarted(self):
+        self.new_page()
+        self.restarts += 1
+
+    def stats(self):
+        return {
+            "prunes": self.prunes,
+            "thumbnails_removed": self.thumbnails_removed,
+            "previews_removed": self.previews_removed,
+            "restarts": self.restarts,
+            "memory": [
+                {"time": t, "rss_mb": rss, "js_heap_mb": heap, "nodes": nodes}
+                for t, rss, heap, nodes in self.memory_samples[-50:]
+            ],
+        }
@@ -0,0 +1,158 @@
+"""多轮对话中历史内联图片的压缩
+
+前端每一轮都会把之前上传的base64图片随messages重新发送，请求体和视觉token随轮次线性增长，
+而追问通常只针对最近一张图片。转发前只保留最近几轮的图片，更早的图片替换为文字引用，
+summary策略下同时附上该图片之后助手回复的摘要，模型仍能知道之前的结论。
+"""
+
+import logging
+import os
+import threading
+
+from defect_report import parse_defects
+
+log = logging.getLogger(__name__)
+
+CHAT_HISTORY_IMAGE_POLICIES = ("keep", "reference", "summary")
+CHAT_HISTORY_IMAGE_POLICY = os.environ.get("CHAT_HISTORY_IMAGE_POLICY", "summary")
+# 保留图片的最近用户消息数（只计带图片的消息）
+CHAT_HISTORY_KEEP_IMAGES = int(os.environ.get("CHAT_HISTORY_KEEP_IMAGES", "1"))
+CHAT_HISTORY_SUMMARY_CHARS = int(os.environ.get("CHAT_HISTORY_SUMMARY_CHARS", "200"))
+
+
+def payload_bytes(value):
+    """请求体大小的估计：各字符串的UTF-8字节数之和
+
+    不做JSON序列化，数MB的base64图片只需检查一遍是否为ASCII，不再在事件循环上复制整个请求体。
+    """
+    if isinstance(value, str):
+        return len(value) if value.isascii() else len(value.encode("utf-8"))
+    if isinstance(value, dict):
+        return sum(payload_bytes(v) for v in value.values())
+    if isinstance(value, list):
+        return sum(payload_bytes(v) for v in value)
+    return 0
+
+
+def is_image_part(part):
+    return isinstance(part, dict) and part.get("type") == "image_url"
+
+
+def summarize_reply(text, limit=CHAT_HISTORY_SUMMARY_CHARS):
+    """助手回复的简短摘要；综合巡检的JSON结果按缺陷列表概括"""
+    try:
+        defects = parse_defects(text)
+    except ValueError:
+        defects = None
+    if defects is not None:
+        if not defects:
+            return "未发现缺陷"
+        return "；".join(
+            f"{d['type']}（{d['lane']}，{d['location']}）" if d["location"] else f"{d['type']}（{d['lane']}）"
+            for d in defects
+        )[:limit]
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+class HistoryCompactor:
+    """按策略替换较早轮次的内联图片，统计压缩前后的请求体大小"""
+
+    def __init__(
+        self,
+        get_text,
+        policy=CHAT_HISTORY_IMAGE_POLICY,
+        keep_images=CHAT_HISTORY_KEEP_IMAGES,
+        summary_chars=CHAT_HISTORY_SUMMARY_CHARS,
+    ):
+        if policy not in CHAT_HISTORY_IMAGE_POLICIES:
+            raise ValueError(f"未知的历史图片策略: {policy}")
+        self.get_text = get_text
+        self.policy = policy
+        self.keep_images = max(keep_images, 0)
+        self.summary_chars = summary_chars
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.compacted = 0
+        self.images_removed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def _reply_after(self, messages, index):
+        """图片所在用户消息之后的第一条助手回复"""
+        for message in messages[index + 1:]:
+            if message.get("role") == "assistant":
+                return self.get_text(message.get("content", ""))
+            if message.get("role") == "user":
+                break
+        return ""
+
+    def _placeholder(self, messages, index, count, turn):
+        text = f"[第{turn}轮上传的{count}张图片已省略]"
+        if self.policy == "summary":
+            reply = self._reply_after(messages, index)
+            if reply:
+                text += f" 当时的分析结论：{summarize_reply(reply, self.summary_chars)}"
+        return {"type": "text", "text": text}
+
+    def compact(self, messages):
+        """原地替换messages中较早的图片，返回本次请求的统计；无需处理时返回None"""
+        if self.policy == "keep":
+            return None
+        image_messages = [
+            i
+            for i, message in enumerate(messages)
+            if message.get("role") == "user"
+            and isinstance(message.get("content"), list)
+            and any(is_image_part(part) for part in message["content"])
+        ]
+        stale = image_messages[: max(len(image_messages) - self.keep_images, 0)]
+        if not stale:
+            return None
+
+        bytes_in = payload_bytes(messages)
+        removed = 0
+        turns = {
+            i: turn
+            for turn, i in enumerate(
+                (i for i, message in enumerate(messages) if message.get("role") == "user"), 1
+            )
+        }
+        for index in stale:
+            content = messages[index]["content"]
+            images = [part for part in content if is_image_part(part)]
+            # 替换为新的消息对象，不修改调用方可能共用的原始内容
+            messages[index] = {
+                **messages[index],
+                "content": [
+                    self._placeholder(messages, index, len(images), turns[index]),
+                    *(part for part in content if not is_image_part(part)),
+                ],
+            }
+            removed += len(images)
+        bytes_out = payload_bytes(messages)
+
+        with self._lock:
+            self.requests += 1
+            self.compacted += len(stale)
+            self.images_removed += removed
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+        return {
+            "policy": self.policy,
+            "images_removed": removed,
+            "bytes_in": bytes_in,
+            "bytes_out": bytes_out,
+        }
+
+    def stats(self):
+        return {
+            "policy": self.policy,
+            "keep_images": self.keep_images,
+            "requests": self.requests,
+            "messages_compacted": self.compacted,
+            "images_removed": self.images_removed,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "bytes_saved": self.bytes_in - self.bytes_out,
+        }
@@ -0,0 +1,160 @@
+"""对话请求中内联图片的预处理
+
+检查员上传的行车记录仪、手机照片多为千万像素级，原样转发会让请求体达到数MB。
+转发前按模型限制最长边并重新压缩，转码在线程池中进行，不阻塞事件循环。
+"""
+
+import asyncio
+import base64
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from image_normalize import normalize_bytes
+
+log = logging.getLogger(__name__)
+
+CHAT_IMAGE_MAX_SIDE = int(os.environ.get("CHAT_IMAGE_MAX_SIDE", "1536"))
+CHAT_IMAGE_QUALITY = int(os.environ.get("CHAT_IMAGE_QUALITY", "85"))
+CHAT_IMAGE_WORKERS = int(os.environ.get("CHAT_IMAGE_WORKERS", "4"))
+# 按模型覆盖最长边，如 {"qwen2.5vl:7b": 1024}；0表示该模型不做处理
+CHAT_IMAGE_MAX_SIDE_BY_MODEL = json.loads(os.environ.get("CHAT_IMAGE_MAX_SIDE_BY_MODEL", "{}"))
+# 估算节省的上传时间所用的上行带宽
+CHAT_IMAGE_UPLINK_MBPS = float(os.environ.get("CHAT_IMAGE_UPLINK_MBPS", "20"))
+
+
+def iter_image_parts(messages):
+    """产出消息中带内联数据的image_url片段"""
+    for message in messages:
+        content = message.get("content")
+        if not isinstance(content, list):
+            continue
+        for part in content:
+            if not isinstance(part, dict) or part.get("type") != "image_url":
+                continue
+            image_url = part.get("image_url")
+            url = image_url.get("url") if isinstance(image_url, dict) else None
+            if isinstance(url, str) and url.startswith("data:image/"):
+                yield image_url
+
+
+def decode_data_uri(url):
+    header, _, payload = url.partition(",")
+    if ";base64" not in header:
+        raise ValueError("不是base64编码的图片")
+    return base64.b64decode(payload, validate=True)
+
+
+class ChatImagePreprocessor:
+    """缩小并重新压缩对话中的内联图片，统计节省的字节数与上传时间"""
+
+    def __init__(
+        self,
+        max_side=CHAT_IMAGE_MAX_SIDE,
+        quality=CHAT_IMAGE_QUALITY,
+        workers=CHAT_IMAGE_WORKERS,
+        max_side_by_model=None,
+        uplink_mbps=CHAT_IMAGE_UPLINK_MBPS,
+    ):
+        self.max_side = max_side
+        self.quality = quality
+        self.max_side_by_model = (
+            CHAT_IMAGE_MAX_SIDE_BY_MODEL if max_side_by_model is None else max_side_by_model
+        )
+        self.uplink_mbps = uplink_mbps
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="chat-image"
+        )
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.images = 0
+        self.failed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.process_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    def max_side_for(self, model_id):
+        return self.max_side_by_model.get(model_id, self.max_side)
+
+    def _transcode(self, url, max_side):
+        """在工作线程中解码一次、缩放并重新编码；结果不比原图小时保留原图"""
+        data = decode_data_uri(url)
+        out, _ = normalize_bytes(data, max_side, "JPEG", self.quality)
+        # base64编码后的长度才是实际传输的字节数
+        size_in = len(url)
+        if len(out) >= len(data):
+            return url, size_in, size_in
+        new_url = f"data:image/jpeg;base64,{base64.b64encode(out).decode()}"
+        return new_url, size_in, len(new_url)
+
+    async def process(self, messages, model_id=None):
+        """原地替换messages中的内联图片，返回本次请求的统计"""
+        max_side = self.max_side_for(model_id)
+        parts = list(iter_image_parts(messages)) if max_side else []
+        if not parts:
+            return None
+
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *(
+                loop.run_in_executor(self._executor, self._transcode, part["url"], max_side)
+                for part in parts
+            ),
+            return_exceptions=True,
+        )
+
+        bytes_in = bytes_out = failed = 0
+        for part, result in zip(parts, results):
+            if isinstance(result, Exception):
+                # 无法解码的图片原样转发，由模型服务报错
+                log.warning(f"Failed to preprocess chat image: {result}")
+                failed += 1
+                continue
+            part["url"], size_in, size_out = result
+            bytes_in += size_in
+            bytes_out += size_out
+
+        elapsed = time.perf_counter() - start
+        upload_saved = (bytes_in - bytes_out) * 8 / (self.uplink_mbps * 1e6)
+        report = {
+            "images": len(parts),
+            "failed": failed,
+            "bytes_in": bytes_in,
+            "bytes_out": bytes_out,
+            "bytes_saved": bytes_in - bytes_out,
+            "process_ms": round(elapsed * 1000, 1),
+            # 按上行带宽估算的上传时间节省，扣除转码耗时
+            "latency_saved_ms": round((upload_saved - elapsed) * 1000, 1),
+        }
+        with self._lock:
+            self.requests += 1
+            self.images += len(parts)
+            self.failed += failed
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.process_seconds += elapsed
+            self.saved_seconds += upload_saved - elapsed
+        return report
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "images": self.images,
+            "failed": self.failed,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "bytes_saved": self.bytes_in - self.bytes_out,
+            "ratio": round(self.bytes_out / self.bytes_in, 3) if self.bytes_in else None,
+            "mean_process_ms": round(self.process_seconds / self.requests * 1000, 1)
+            if self.requests
+            else None,
+            "latency_saved_s": round(self.saved_seconds, 2),
+        }
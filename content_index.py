@@ -0,0 +1,126 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# 全局内容索引，同一主机上所有任务与进程共享
+CONTENT_INDEX_PATH = os.environ.get(
+    "CRAWL_CONTENT_INDEX",
+    os.path.join(os.path.expanduser("~"), ".cache", "road_care_crawler", "content_index.sqlite3"),
+)
+MANIFEST_FILE = "content_manifest.jsonl"
+
+
+class ContentIndex:
+    """跨保存目录的内容去重索引（SQLite，支持多进程并发访问）"""
+
+    def __init__(self, path=CONTENT_INDEX_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        self._manifest_lock = threading.Lock()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS content (
+                md5 TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                size INTEGER,
+                created REAL
+            );
+            CREATE TABLE IF NOT EXISTS source_url (
+                url TEXT PRIMARY KEY,
+                md5 TEXT NOT NULL
+            );
+            """
+        )
+        conn.commit()
+
+    def _conn(self):
+        # sqlite连接不能跨线程共享，每个线程各自持有一个
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def lookup(self, md5):
+        """返回已存储内容的规范路径，文件已丢失时清理记录"""
+        conn = self._conn()
+        row = conn.execute("SELECT path FROM content WHERE md5 = ?", (md5,)).fetchone()
+        if row is None:
+            return None
+        if not os.path.exists(row[0]):
+            with conn:
+                conn.execute("DELETE FROM content WHERE md5 = ? AND path = ?", (md5, row[0]))
+            return None
+        return row[0]
+
+    def lookup_url(self, url):
+        """根据来源URL查找已知内容的MD5，避免重复下载"""
+        if not url or url.startswith("data:"):
+            return None
+        row = self._conn().execute("SELECT md5 FROM source_url WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else None
+
+    def record_url(self, url, md5):
+        if not url or url.startswith("data:"):
+            return
+        conn = self._conn()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO source_url (url, md5) VALUES (?, ?)", (url, md5))
+
+    def register(self, md5, path, url=None):
+        """登记新内容，返回规范路径；其他进程已抢先登记时返回其路径"""
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO content (md5, path, size, created) VALUES (?, ?, ?, ?)",
+                (md5, os.path.abspath(path), os.path.getsize(path), time.time()),
+            )
+        self.record_url(url, md5)
+        return self.lookup(md5)
+
+    def place(self, md5, save_dir):
+        """把已有内容放入save_dir：优先硬链接，失败时写入清单引用"""
+        source = self.lookup(md5)
+        if source is None:
+            return None
+
+        # 沿用规范文件的扩展名（转码后可能不是.jpg）
+        target = os.path.join(save_dir, md5 + os.path.splitext(source)[1])
+        if os.path.exists(target):
+            return target
+
+        os.makedirs(save_dir, exist_ok=True)
+        try:
+            os.link(source, target)
+            return target
+        except OSError:
+            # 跨文件系统等无法硬链接的情况，记录引用而不复制文件
+            with self._manifest_lock:
+                with open(os.path.join(save_dir, MANIFEST_FILE), "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"md5": md5, "path": source}) + "\n")
+            return source
+
+
+_content_index = None
+_content_index_lock = threading.Lock()
+
+
+def get_content_index():
+    """进程内共享的全局索引实例"""
+    global _content_index
+    with _content_index_lock:
+        if _content_index is None:
+            _content_index = ContentIndex()
+        return _content_index
+
+
+def reset_content_index(path=None):
+    """替换进程内的全局索引实例；path为None时下次使用默认路径重新创建，供基准测试隔离索引"""
+    global _content_index
+    with _content_index_lock:
+        _content_index = ContentIndex(path) if path else None
@@ -0,0 +1,175 @@
+import argparse
+import json
+import os
+import resource
+import tempfile
+import threading
+import time
+
+from content_index import reset_content_index
+from fixture_site import FixtureSite
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+class ResourceSampler:
+    """采样进程树（含Chrome子进程）的CPU与内存；未安装psutil时只用getrusage"""
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.peak_tree_rss = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        root = psutil.Process()
+        while not self._stop.is_set():
+            rss = 0
+            for proc in [root] + root.children(recursive=True):
+                try:
+                    rss += proc.memory_info().rss
+                except psutil.Error:
+                    pass
+            self.peak_tree_rss = max(self.peak_tree_rss, rss)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._start_self = resource.getrusage(resource.RUSAGE_SELF)
+        self._start_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self._start = time.monotonic()
+        if psutil is not None:
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.monotonic() - self._start
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        end_self = resource.getrusage(resource.RUSAGE_SELF)
+        end_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.cpu_seconds = (
+            end_self.ru_utime - self._start_self.ru_utime
+            + end_self.ru_stime - self._start_self.ru_stime
+            + end_children.ru_utime - self._start_children.ru_utime
+            + end_children.ru_stime - self._start_children.ru_stime
+        )
+        # Linux下ru_maxrss单位为KB
+        self.peak_rss_mb = end_self.ru_maxrss / 1024
+
+    def report(self):
+        return {
+            "elapsed_s": round(self.elapsed, 2),
+            "cpu_s": round(self.cpu_seconds, 2),
+            "cpu_util": round(self.cpu_seconds / self.elapsed, 2) if self.elapsed else 0.0,
+            "peak_rss_mb": round(self.peak_rss_mb, 1),
+            "peak_tree_rss_mb": round(self.peak_tree_rss / (1024 * 1024), 1) if psutil else None,
+        }
+
+
+def dedup_report(site, save_dir):
+    """按文件名中的原始MD5映射回仿真站点的内容分组，统计去重准确率"""
+    saved = [
+        name for name in os.listdir(save_dir)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    ]
+    groups_seen = set()
+    duplicates = 0
+    unknown = 0
+    for name in saved:
+        group = site.md5_groups.get(os.path.splitext(name)[0])
+        if group is None:
+            unknown += 1
+        elif group in groups_seen:
+            duplicates += 1
+        else:
+            groups_seen.add(group)
+    return {
+        "saved": len(saved),
+        "expected_unique": site.expected_unique,
+        "unique_saved": len(groups_seen),
+        "duplicates_saved": duplicates,
+        "unknown_saved": unknown,
+        "recall": round(len(groups_seen) / site.expected_unique, 3) if site.expected_unique else 0.0,
+        "precision": round(len(groups_seen) / len(saved), 3) if saved else 0.0,
+    }
+
+
+def bench_spider(site, work_dir, query):
+    import spider
+
+    save_dir = os.path.join(work_dir, "spider")
+    spider.CHECKPOINT_FILE = os.path.join(work_dir, "spider_checkpoint.json")
+    if "--headless=new" not in spider.CHROME_ARGUMENTS:
+        spider.CHROME_ARGUMENTS.append("--headless=new")
+
+    with ResourceSampler() as sampler:
+        metrics = spider.spider(save_dir, query, search_url=site.search_url)
+    return save_dir, sampler, metrics
+
+
+def bench_crawler_task(site, work_dir, query):
+    import spider_api
+
+    save_dir = os.path.join(work_dir, "crawler_task")
+    os.makedirs(save_dir, exist_ok=True)
+    with ResourceSampler() as sampler:
+        job = spider_api.crawler_task(save_dir, search_url=site.search_url, search_word=query)
+    metrics = {
+        "concurrency": job.concurrency.metrics(),
+        "quality": job.quality_gate.stats(),
+    }
+    return save_dir, sampler, metrics
+
+
+TARGETS = {"spider": bench_spider, "crawler_task": bench_crawler_task}
+
+
+def run(targets, total=200, latency=0.05, query="road accident", seed=0):
+    work_dir = tempfile.mkdtemp(prefix="crawl_bench_")
+
+    results = {}
+    with FixtureSite(total=total, latency=latency, seed=seed) as site:
+        for name in targets:
+            # 每个目标使用独立的全局内容索引：共用时后一个目标会直接链接前一个目标保存的内容，
+            # 吞吐与去重结果失去意义；也避免与真实数据互相影响
+            reset_content_index(os.path.join(work_dir, f"{name}_content_index.sqlite3"))
+            requests_before = site.requests
+            save_dir, sampler, metrics = TARGETS[name](site, work_dir, query)
+            dedup = dedup_report(site, save_dir)
+            report = sampler.report()
+            report.update({
+                "images_per_s": round(dedup["saved"] / sampler.elapsed, 2) if sampler.elapsed else 0.0,
+                "results_per_s": round(total / sampler.elapsed, 2) if sampler.elapsed else 0.0,
+                "http_requests": site.requests - requests_before,
+                "dedup": dedup,
+                "concurrency_limit": metrics["concurrency"]["limit"],
+                "quality": metrics["quality"],
+            })
+            results[name] = report
+    reset_content_index()
+    return {"work_dir": work_dir, "total": total, "latency": latency, "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="基于本地仿真站点的爬虫性能基准")
+    parser.add_argument("--target", choices=["spider", "crawler_task", "all"], default="all")
+    parser.add_argument("--total", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="报告输出路径（JSON）")
+    args = parser.parse_args()
+
+    targets = list(TARGETS) if args.target == "all" else [args.target]
+    report = run(targets, total=args.total, latency=args.latency, seed=args.seed)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
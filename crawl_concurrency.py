@@ -0,0 +1,186 @@
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AIMDController:
+    """下载并发自适应控制：加性增、乘性减（AIMD）"""
+
+    def __init__(
+        self,
+        min_limit=1,
+        max_limit=16,
+        initial=4,
+        increase=1,
+        decrease=0.5,
+        window=8,
+        error_threshold=0.2,
+        latency_factor=2.0,
+        history_size=200,
+    ):
+        if not 1 <= min_limit <= max_limit:
+            raise ValueError("并发上下限配置无效")
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.window = window
+        self.error_threshold = error_threshold
+        self.latency_factor = latency_factor
+        self.history_size = history_size
+
+        self._limit = min(max(initial, min_limit), max_limit)
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        # 协程等待者：(事件循环, future)，可与线程等待者共存
+        self._async_waiters = []
+
+        self._samples = []
+        self._window_start = time.monotonic()
+        self._baseline_latency = None
+        self._last_throughput = None
+        self._last_action = None
+
+        self.total_requests = 0
+        self.total_errors = 0
+        self.total_throttled = 0
+        self.total_bytes = 0
+        self.history = [(time.time(), self._limit, "init")]
+
+    @property
+    def limit(self):
+        return self._limit
+
+    def acquire(self):
+        with self._cond:
+            while self._in_flight >= self._limit:
+                self._cond.wait()
+            self._in_flight += 1
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._notify_locked()
+
+    def _notify_locked(self):
+        self._cond.notify_all()
+        waiters, self._async_waiters = self._async_waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire_async(self):
+        """协程版本的acquire，等待时不阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self._in_flight < self._limit:
+                    self._in_flight += 1
+                    return
+                future = loop.create_future()
+                self._async_waiters.append((loop, future))
+            await future
+
+    @asynccontextmanager
+    async def async_slot(self):
+        await self.acquire_async()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def record(self, latency, ok=True, throttled=False, nbytes=0):
+        """记录一次请求结果，窗口满时调整并发上限"""
+        with self._cond:
+            self.total_requests += 1
+            self.total_errors += 0 if ok else 1
+            self.total_throttled += 1 if throttled else 0
+            self.total_bytes += nbytes
+            self._samples.append((latency, ok, throttled))
+            if len(self._samples) >= self.window:
+                self._adjust()
+
+    def _adjust(self):
+        samples = self._samples
+        now = time.monotonic()
+        elapsed = max(now - self._window_start, 1e-6)
+        self._samples = []
+        self._window_start = now
+
+        ok_latencies = [latency for latency, ok, _ in samples if ok]
+        error_rate = sum(1 for _, ok, _ in samples if not ok) / len(samples)
+        throttled = any(t for _, _, t in samples)
+        throughput = len(ok_latencies) / elapsed
+        mean_latency = sum(ok_latencies) / len(ok_latencies) if ok_latencies else None
+
+        if mean_latency is not None:
+            # 基准延迟取历史窗口的最小平均值
+            if self._baseline_latency is None or mean_latency < self._baseline_latency:
+                self._baseline_latency = mean_latency
+
+        if throttled:
+            reason = "throttled"
+        elif error_rate > self.error_threshold:
+            reason = "errors"
+        elif (
+            mean_latency is not None
+            and mean_latency > self._baseline_latency * self.latency_factor
+        ):
+            reason = "latency"
+        else:
+            reason = None
+
+        if reason is not None:
+            new_limit = max(self.min_limit, int(self._limit * self.decrease))
+            self._last_action = "decrease"
+        elif (
+            self._last_action == "increase"
+            and self._last_throughput is not None
+            and throughput < self._last_throughput * 0.9
+        ):
+            # 加并发后吞吐反而下降，保持当前上限
+            new_limit = self._limit
+            reason = "plateau"
+            self._last_action = "hold"
+        else:
+            new_limit = min(self.max_limit, self._limit + self.increase)
+            reason = "increase"
+            self._last_action = "increase"
+
+        self._last_throughput = throughput
+        if new_limit != self._limit:
+            self._limit = new_limit
+            self.history.append((time.time(), new_limit, reason))
+            del self.history[:-self.history_size]
+            self._notify_locked()
+
+    def metrics(self):
+        with self._cond:
+            return {
+                "limit": self._limit,
+                "in_flight": self._in_flight,
+                "min_limit": self.min_limit,
+                "max_limit": self.max_limit,
+                "requests": self.total_requests,
+                "errors": self.total_errors,
+                "throttled": self.total_throttled,
+                "bytes": self.total_bytes,
+                "baseline_latency": self._baseline_latency,
+                "history": [
+                    {"time": t, "limit": limit, "reason": reason}
+                    for t, limit, reason in self.history
+                ],
+            }
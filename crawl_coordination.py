@@ -0,0 +1,271 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from urllib.parse import urlsplit
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+def node_id():
+    """当前爬虫节点标识：主机名与进程号"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def index_range_units(query, source, total, size):
+    """把一个查询的结果列表按索引区间切分成工作单元，单元ID可重复生成，重复添加不会产生重复任务"""
+    return [
+        {
+            "id": f"{source}|{query}|{start}",
+            "query": query,
+            "source": source,
+            "start": start,
+            "end": min(start + size, total),
+        }
+        for start in range(0, total, size)
+    ]
+
+
+def url_units(urls):
+    """待下载的前沿URL，每个URL一个工作单元"""
+    return [{"id": f"url|{url}", "source": "url", "url": url} for url in urls]
+
+
+class Coordinator(ABC):
+    """多节点协调：租约分配工作单元，原子地检查并写入去重键"""
+
+    @abstractmethod
+    def add_units(self, units):
+        pass
+
+    @abstractmethod
+    def lease(self, owner, ttl=300, source=None):
+        """租用一个待处理（或租约已过期）的工作单元，没有时返回None"""
+
+    @abstractmethod
+    def renew(self, unit_id, owner, ttl=300):
+        """续租，租约已被他人接管时返回False"""
+
+    @abstractmethod
+    def complete(self, unit_id, owner):
+        pass
+
+    @abstractmethod
+    def has_key(self, key):
+        """去重键是否已存在"""
+
+    @abstractmethod
+    def check_and_insert(self, key):
+        """键不存在时写入并返回True，已存在返回False"""
+
+    @abstractmethod
+    def stats(self):
+        pass
+
+
+class SQLiteCoordinator(Coordinator):
+    """基于SQLite文件锁的实现，适合单机多进程与测试"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS units (
+                id TEXT PRIMARY KEY,
+                source TEXT,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                owner TEXT,
+                lease_expires REAL
+            );
+            CREATE INDEX IF NOT EXISTS units_state ON units (state, source);
+            CREATE TABLE IF NOT EXISTS dedup_keys (key TEXT PRIMARY KEY);
+            """
+        )
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None 以便手动 BEGIN IMMEDIATE 获取写锁
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def add_units(self, units):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO units (id, source, payload) VALUES (?, ?, ?)",
+                [(u["id"], u.get("source"), json.dumps(u)) for u in units],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def lease(self, owner, ttl=300, source=None):
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            sql = (
+                "SELECT id, payload FROM units WHERE "
+                "(state = 'pending' OR (state = 'leased' AND lease_expires < ?))"
+            )
+            params = [now]
+            if source is not None:
+                sql += " AND source = ?"
+                params.append(source)
+            row = conn.execute(sql + " ORDER BY rowid LIMIT 1", params).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE units SET state = 'leased', owner = ?, lease_expires = ? WHERE id = ?",
+                (owner, now + ttl, row[0]),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return json.loads(row[1])
+
+    def renew(self, unit_id, owner, ttl=300):
+        cur = self._conn().execute(
+            "UPDATE units SET lease_expires = ? WHERE id = ? AND owner = ? AND state = 'leased'",
+            (time.time() + ttl, unit_id, owner),
+        )
+        return cur.rowcount == 1
+
+    def complete(self, unit_id, owner):
+        self._conn().execute(
+            "UPDATE units SET state = 'done', lease_expires = NULL WHERE id = ? AND owner = ?",
+            (unit_id, owner),
+        )
+
+    def has_key(self, key):
+        return self._conn().execute("SELECT 1 FROM dedup_keys WHERE key = ?", (key,)).fetchone() is not None
+
+    def check_and_insert(self, key):
+        cur = self._conn().execute("INSERT OR IGNORE INTO dedup_keys (key) VALUES (?)", (key,))
+        return cur.rowcount == 1
+
+    def stats(self):
+        conn = self._conn()
+        counts = dict(conn.execute("SELECT state, COUNT(*) FROM units GROUP BY state").fetchall())
+        expired = conn.execute(
+            "SELECT COUNT(*) FROM units WHERE state = 'leased' AND lease_expires < ?", (time.time(),)
+        ).fetchone()[0]
+        keys = conn.execute("SELECT COUNT(*) FROM dedup_keys").fetchone()[0]
+        return {"units": counts, "expired_leases": expired, "dedup_keys": keys}
+
+
+# 原子地回收过期租约并租出一个单元
+_REDIS_LEASE_SCRIPT = """
+local pending, leases, units = KEYS[1], KEYS[2], KEYS[3]
+local now, ttl, owner = tonumber(ARGV[1]), tonumber(ARGV[2]), ARGV[3]
+local expired = redis.call('ZRANGEBYSCORE', leases, '-inf', now)
+for _, id in ipairs(expired) do
+    redis.call('ZREM', leases, id)
+    redis.call('RPUSH', pending, id)
+end
+local id = redis.call('LPOP', pending)
+if not id then return nil end
+redis.call('ZADD', leases, now + ttl, id)
+redis.call('HSET', units .. ':owner', id, owner)
+return {id, redis.call('HGET', units, id)}
+"""
+
+_REDIS_RENEW_SCRIPT = """
+if redis.call('HGET', KEYS[2] .. ':owner', ARGV[1]) ~= ARGV[2] then return 0 end
+if not redis.call('ZSCORE', KEYS[1], ARGV[1]) then return 0 end
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+return 1
+"""
+
+
+class RedisCoordinator(Coordinator):
+    """基于Redis协议的实现，供多台主机共享前沿与去重键"""
+
+    def __init__(self, url, prefix="road_care_crawler"):
+        if redis is None:
+            raise RuntimeError("使用Redis协调需要安装redis包")
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self._lease = self.client.register_script(_REDIS_LEASE_SCRIPT)
+        self._renew = self.client.register_script(_REDIS_RENEW_SCRIPT)
+
+    def _keys(self, source):
+        p = self.prefix
+        return (
+            f"{p}:pending:{source or 'all'}",
+            f"{p}:leases:{source or 'all'}",
+            f"{p}:units",
+        )
+
+    def add_units(self, units):
+        pipe = self.client.pipeline()
+        for unit in units:
+            # 以ID去重：只有首次写入的单元进入待处理队列
+            pipe.hsetnx(f"{self.prefix}:units", unit["id"], json.dumps(unit))
+        created = pipe.execute()
+        pipe = self.client.pipeline()
+        for unit, is_new in zip(units, created):
+            if is_new:
+                pipe.rpush(self._keys(unit.get("source"))[0], unit["id"])
+        pipe.execute()
+
+    def lease(self, owner, ttl=300, source=None):
+        result = self._lease(keys=self._keys(source), args=[time.time(), ttl, owner])
+        if not result:
+            return None
+        return json.loads(result[1])
+
+    def renew(self, unit_id, owner, ttl=300):
+        source = json.loads(self.client.hget(f"{self.prefix}:units", unit_id) or "{}").get("source")
+        _, leases, units = self._keys(source)
+        return bool(self._renew(keys=[leases, units], args=[unit_id, owner, time.time() + ttl]))
+
+    def complete(self, unit_id, owner):
+        source = json.loads(self.client.hget(f"{self.prefix}:units", unit_id) or "{}").get("source")
+        _, leases, units = self._keys(source)
+        if self.client.hget(f"{units}:owner", unit_id) == owner:
+            pipe = self.client.pipeline()
+            pipe.zrem(leases, unit_id)
+            pipe.sadd(f"{self.prefix}:done", unit_id)
+            pipe.execute()
+
+    def has_key(self, key):
+        return bool(self.client.sismember(f"{self.prefix}:dedup", key))
+
+    def check_and_insert(self, key):
+        return self.client.sadd(f"{self.prefix}:dedup", key) == 1
+
+    def stats(self):
+        return {
+            "units": self.client.hlen(f"{self.prefix}:units"),
+            "done": self.client.scard(f"{self.prefix}:done"),
+            "dedup_keys": self.client.scard(f"{self.prefix}:dedup"),
+        }
+
+
+def make_coordinator(url):
+    """根据URL创建协调后端：redis://... 或 sqlite:///path/to/file"""
+    scheme = urlsplit(url).scheme
+    if scheme in ("redis", "rediss", "unix"):
+        return RedisCoordinator(url)
+    if scheme == "sqlite":
+        return SQLiteCoordinator(url[len("sqlite://"):])
+    raise ValueError(f"不支持的协调后端: {url}")
@@ -0,0 +1,122 @@
+import base64
+import io
+import json
+import os
+import threading
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import imagehash
+import requests
+from PIL import Image
+
+KNOWN_RESULTS_FILE = "known_results.json"
+
+# 不影响图片内容的跟踪参数
+TRACKING_PARAMS = {"ved", "usg", "sa", "source", "ei", "fbclid", "gclid", "ref", "spm"}
+
+
+def normalize_url(url):
+    """规范化来源URL：小写协议与主机、去掉默认端口、片段和跟踪参数，参数排序"""
+    if not url or url.startswith("data:"):
+        return None
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+    query = sorted(
+        (k, v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k.lower() not in TRACKING_PARAMS and not k.lower().startswith("utm_")
+    )
+    return urlunsplit((scheme, host, parts.path or "/", urlencode(query), ""))
+
+
+def thumbnail_phash(src, timeout=5):
+    """计算缩略图的感知哈希，缩略图通常是data URI或很小的图片"""
+    if not src:
+        return None
+    try:
+        if src.startswith("data:image"):
+            data = base64.b64decode(src.split(",", 1)[1])
+        else:
+            response = requests.get(src, timeout=timeout)
+            response.raise_for_status()
+            data = response.content
+        return imagehash.phash(Image.open(io.BytesIO(data)).convert("L"))
+    except Exception:
+        return None
+
+
+class KnownResults:
+    """增量爬取时已见过的结果：规范化URL与缩略图pHash"""
+
+    def __init__(self, save_dir, phash_threshold=4):
+        self.path = os.path.join(save_dir, KNOWN_RESULTS_FILE)
+        self.phash_threshold = phash_threshold
+        self.urls = set()
+        self.thumb_hashes = []
+        self._lock = threading.Lock()
+        self._dirty = 0
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            self.urls = set(data.get("urls", []))
+            self.thumb_hashes = [imagehash.hex_to_hash(h) for h in data.get("thumb_hashes", [])]
+
+    def is_known_thumbnail(self, phash):
+        if phash is None:
+            return False
+        with self._lock:
+            return any(phash - known <= self.phash_threshold for known in self.thumb_hashes)
+
+    def is_known_url(self, url):
+        key = normalize_url(url)
+        with self._lock:
+            return key is not None and key in self.urls
+
+    def add(self, url=None, thumb_phash=None):
+        key = normalize_url(url)
+        with self._lock:
+            if key is not None:
+                self.urls.add(key)
+            if thumb_phash is not None:
+                self.thumb_hashes.append(thumb_phash)
+            self._dirty += 1
+            if self._dirty >= 20:
+                self._save_locked()
+
+    def save(self):
+        with self._lock:
+            self._save_locked()
+
+    def _save_locked(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump({
+                "urls": sorted(self.urls),
+                "thumb_hashes": [str(h) for h in self.thumb_hashes],
+            }, f)
+        self._dirty = 0
+
+
+class EarlyStop:
+    """连续遇到K个已知结果时提前结束"""
+
+    def __init__(self, k):
+        self.k = k
+        self.consecutive = 0
+        self.known = 0
+        self.new = 0
+
+    def mark(self, known):
+        if known:
+            self.consecutive += 1
+            self.known += 1
+        else:
+            self.consecutive = 0
+            self.new += 1
+        return self.should_stop()
+
+    def should_stop(self):
+        return self.k > 0 and self.consecutive >= self.k
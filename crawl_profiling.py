@@ -0,0 +1,182 @@
+import cProfile
+import contextvars
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+# None关闭；spans只计时各阶段；cprofile额外对调用start()的线程做确定性分析；stack定时采样所有线程的调用栈
+PROFILE_MODES = (None, "spans", "cprofile", "stack")
+# 作用于整个进程而非单个任务的模式：cprofile挂在事件循环线程上，stack采样所有线程，同一进程内同时只能有一个
+PROCESS_WIDE_MODES = ("cprofile", "stack")
+
+_NULL_SPAN = nullcontext()
+
+
+def _thread_label(name):
+    # 线程池中的线程名形如 ThreadPoolExecutor-0_3，合并为同一个根节点
+    return re.sub(r"_\d+$", "", name)
+
+
+class StackSampler:
+    """后台线程定时采样所有线程的调用栈，按folded格式累计次数"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.counts = defaultdict(int)
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+                    frame = frame.f_back
+                stack.append(_thread_label(names.get(ident, str(ident))))
+                self.counts[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.counts.items()))
+
+
+class CrawlProfiler:
+    """爬取任务的分阶段计时，可选挂载cProfile或栈采样器
+
+    阶段以嵌套的span记录，同一线程或协程内的span组成调用路径，结束后写出
+    汇总报告与flamegraph.pl/speedscope可读取的folded文件。未开启时span为空操作。
+    """
+
+    def __init__(self, mode=None, interval=0.005):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"不支持的分析模式: {mode}")
+        self.mode = mode
+        self.enabled = mode is not None
+        # 用上下文变量保存span栈，线程与asyncio任务各自独立
+        self._stack = contextvars.ContextVar(f"crawl_profiler_{id(self)}", default=())
+        self._lock = threading.Lock()
+        # 调用路径 -> [次数, 总耗时, 最大耗时]
+        self._spans = {}
+        self._sampler = StackSampler(interval) if mode == "stack" else None
+        self._cprofile = cProfile.Profile() if mode == "cprofile" else None
+        self._started = None
+        self.wall_time = 0.0
+
+    def span(self, name):
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._span(name)
+
+    @contextmanager
+    def _span(self, name):
+        stack = self._stack.get() + (name,)
+        token = self._stack.set(stack)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._stack.reset(token)
+            path = ";".join(stack)
+            with self._lock:
+                entry = self._spans.setdefault(path, [0, 0.0, 0.0])
+                entry[0] += 1
+                entry[1] += elapsed
+                entry[2] = max(entry[2], elapsed)
+
+    def start(self):
+        self._started = time.perf_counter()
+        if self._sampler is not None:
+            self._sampler.start()
+        if self._cprofile is not None:
+            self._cprofile.enable()
+
+    def stop(self):
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        if self._sampler is not None:
+            self._sampler.stop()
+        if self._started is not None:
+            self.wall_time = time.perf_counter() - self._started
+
+    def report(self):
+        """按阶段名（调用路径的最后一段）汇总耗时"""
+        with self._lock:
+            spans = {path: list(entry) for path, entry in self._spans.items()}
+        stages = {}
+        for path, (count, total, longest) in spans.items():
+            stage = stages.setdefault(path.rsplit(";", 1)[-1], [0, 0.0, 0.0])
+            stage[0] += count
+            stage[1] += total
+            stage[2] = max(stage[2], longest)
+        return {
+            "mode": self.mode,
+            "wall_s": round(self.wall_time, 3),
+            "stages": {
+                name: {
+                    "count": count,
+                    "total_s": round(total, 3),
+                    "mean_ms": round(total / count * 1000, 2),
+                    "max_ms": round(longest * 1000, 2),
+                }
+                for name, (count, total, longest) in sorted(stages.items(), key=lambda kv: -kv[1][1])
+            },
+            "spans": {path: {"count": count, "total_s": round(total, 3)} for path, (count, total, _) in spans.items()},
+            "samples": self._sampler.samples if self._sampler is not None else None,
+        }
+
+    def folded_spans(self):
+        """span调用路径的folded格式，权重为扣除子span后的自身耗时（微秒）"""
+        with self._lock:
+            totals = {path: entry[1] for path, entry in self._spans.items()}
+        children = defaultdict(float)
+        for path, total in totals.items():
+            if ";" in path:
+                children[path.rsplit(";", 1)[0]] += total
+        lines = []
+        for path, total in sorted(totals.items()):
+            self_us = int(max(total - children[path], 0.0) * 1e6)
+            if self_us:
+                lines.append(f"{path} {self_us}\n")
+        return "".join(lines)
+
+    def dump(self, save_dir):
+        """把报告和folded文件写入保存目录，返回各文件路径"""
+        os.makedirs(save_dir, exist_ok=True)
+        paths = {
+            "report": os.path.join(save_dir, "profile_report.json"),
+            "spans": os.path.join(save_dir, "profile_spans.folded"),
+        }
+        with open(paths["report"], "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+        with open(paths["spans"], "w", encoding="utf-8") as f:
+            f.write(self.folded_spans())
+        if self._sampler is not None:
+            paths["stack"] = os.path.join(save_dir, "profile_stack.folded")
+            with open(paths["stack"], "w", encoding="utf-8") as f:
+                f.write(self._sampler.folded())
+        if self._cprofile is not None:
+            paths["cprofile"] = os.path.join(save_dir, "profile.pstats")
+            self._cprofile.dump_stats(paths["cprofile"])
+        return paths
@@ -0,0 +1,91 @@
+"""综合巡检模式的JSON结果解析与校验
+
+综合提示词（road_prompts中的all模板）让模型在一次调用中报告所有类别的缺陷，
+这里把模型输出解析为统一结构，不符合格式时抛出ValueError，由调用方决定是否重试。
+"""
+
+import json
+import re
+
+from road_prompts import SCENE_LABELS
+
+COMBINED_SCENE = "all"
+DEFECT_TYPES = tuple(SCENE_LABELS.values())
+LANES = ("左侧车道", "中间车道", "右侧车道", "应急车道", "路肩", "未知")
+
+# 模型偶尔仍会包上Markdown代码块
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def extract_json(text):
+    text = _FENCE.sub("", text.strip())
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start:
+        raise ValueError("输出中没有JSON对象")
+    try:
+        return json.loads(text[start:end + 1])
+    except ValueError as e:
+        raise ValueError(f"JSON格式错误: {e}")
+
+
+def parse_defects(text):
+    """解析并校验模型输出，返回缺陷列表"""
+    data = extract_json(text)
+    if not isinstance(data, dict) or not isinstance(data.get("defects"), list):
+        raise ValueError("缺少defects列表")
+
+    defects = []
+    for i, item in enumerate(data["defects"]):
+        if not isinstance(item, dict):
+            raise ValueError(f"第{i + 1}项不是对象")
+        # 也接受场景代号，如pao
+        defect_type = SCENE_LABELS.get(item.get("type"), item.get("type"))
+        if defect_type not in DEFECT_TYPES:
+            raise ValueError(f"第{i + 1}项类型无效: {item.get('type')}")
+
+        lane = item.get("lane") or "未知"
+        if lane not in LANES:
+            raise ValueError(f"第{i + 1}项车道无效: {lane}")
+
+        confidence = item.get("confidence")
+        if isinstance(confidence, bool) or not isinstance(confidence, (int, float)):
+            raise ValueError(f"第{i + 1}项置信度无效: {confidence}")
+        # 按百分比给出的置信度
+        if 1 < confidence <= 100:
+            confidence /= 100
+        if not 0 <= confidence <= 1:
+            raise ValueError(f"第{i + 1}项置信度无效: {confidence}")
+
+        defect = {
+            "type": defect_type,
+            "lane": lane,
+            "location": str(item.get("location") or ""),
+            "confidence": round(float(confidence), 3),
+            "description": str(item.get("description") or ""),
+        }
+        # 外接框可选，给出时必须是合法的归一化坐标
+        if item.get("bbox") is not None:
+            defect["bbox"] = parse_bbox(item["bbox"], i)
+        defects.append(defect)
+    return defects
+
+
+def parse_bbox(bbox, i=0):
+    if (
+        not isinstance(bbox, (list, tuple))
+        or len(bbox) != 4
+        or not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in bbox)
+    ):
+        raise ValueError(f"第{i + 1}项外接框无效: {bbox}")
+    x1, y1, x2, y2 = (min(max(float(v), 0.0), 1.0) for v in bbox)
+    if x2 <= x1 or y2 <= y1:
+        raise ValueError(f"第{i + 1}项外接框无效: {bbox}")
+    return [round(x1, 4), round(y1, 4), round(x2, 4), round(y2, 4)]
+
+
+def repair_message(error):
+    """输出不合格时追加的纠正提示"""
+    return {
+        "role": "user",
+        "content": f"上次的输出无法解析（{error}）。请只输出一个符合OutputFormat的JSON对象，不要包含其他文字。",
+    }
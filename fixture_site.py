@@ -0,0 +1,240 @@
+import hashlib
+import io
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+from PIL import Image
+
+SEARCH_PAGE = """<!DOCTYPE html>
+<html><body>
+<form action="/search" method="get"><input name="q" type="text"></form>
+</body></html>"""
+
+# 仿照图片搜索结果页：滚动到底部加载下一批，点击缩略图延迟显示预览大图
+RESULTS_PAGE = """<!DOCTYPE html>
+<html><head><style>
+#results div { display: inline-block; margin: 8px; }
+#preview { position: fixed; right: 0; top: 0; width: 400px; }
+#preview img { max-width: 400px; }
+</style></head>
+<body>
+<div id="results"></div>
+<div id="preview"></div>
+<script>
+const ITEMS = __ITEMS__;
+const PAGE_SIZE = __PAGE_SIZE__;
+const PREVIEW_DELAY = __PREVIEW_DELAY__;
+let loaded = 0;
+
+function loadMore() {
+    const results = document.getElementById("results");
+    ITEMS.slice(loaded, loaded + PAGE_SIZE).forEach(item => {
+        const card = document.createElement("div");
+        card.setAttribute("data-ri", item.index);
+        card.innerHTML = `<img class="YQ4gaf" src="/thumb/${item.index}.jpg" width="160" height="120">`;
+        card.firstChild.addEventListener("click", () => showPreview(item.index));
+        results.appendChild(card);
+    });
+    loaded = Math.min(loaded + PAGE_SIZE, ITEMS.length);
+    document.body.style.minHeight = (results.scrollHeight + 3000) + "px";
+}
+
+function showPreview(index) {
+    setTimeout(() => {
+        const img = document.createElement("img");
+        img.setAttribute("jsname", "kn3ccd");
+        img.src = `/image/${index}.jpg`;
+        const preview = document.getElementById("preview");
+        if (preview.firstChild) preview.firstChild.style.display = "none";
+        preview.insertBefore(img, preview.firstChild);
+    }, PREVIEW_DELAY);
+}
+
+window.addEventListener("scroll", () => {
+    if (window.innerHeight + window.scrollY >= document.body.scrollHeight - 2500) loadMore();
+});
+loadMore();
+</script>
+</body></html>"""
+
+
+def _render_image(rng, width=640, height=480):
+    """生成带纹理的测试图片，能通过质量过滤"""
+    base = rng.integers(0, 256, size=(height // 16, width // 16, 3), dtype=np.uint8)
+    img = Image.fromarray(base).resize((width, height), Image.NEAREST)
+    noise = rng.integers(0, 40, size=(height, width, 3), dtype=np.uint8)
+    return Image.fromarray(np.clip(np.asarray(img, dtype=np.int16) + noise, 0, 255).astype(np.uint8))
+
+
+def _encode(img, quality=90):
+    out = io.BytesIO()
+    img.save(out, "JPEG", quality=quality)
+    return out.getvalue()
+
+
+class FixtureSite:
+    """本地的图片搜索仿真站点，用于离线测量爬虫吞吐与去重准确率
+
+    结果中按比例混入完全重复（字节相同）、近似重复（重新编码）和损坏的图片。
+    """
+
+    def __init__(
+        self,
+        total=200,
+        page_size=40,
+        latency=0.05,
+        preview_delay=0.2,
+        duplicate_rate=0.1,
+        near_duplicate_rate=0.05,
+        corrupt_rate=0.05,
+        seed=0,
+        host="127.0.0.1",
+        port=0,
+    ):
+        self.total = total
+        self.page_size = page_size
+        self.latency = latency
+        self.preview_delay = preview_delay
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._build(seed, duplicate_rate, near_duplicate_rate, corrupt_rate)
+
+    def _build(self, seed, duplicate_rate, near_duplicate_rate, corrupt_rate):
+        rnd = random.Random(seed)
+        rng = np.random.default_rng(seed)
+        self.images = []
+        # 每个结果所属的内容分组，同组视为同一张图片；损坏图片分组为None
+        self.groups = []
+        originals = []
+        for index in range(self.total):
+            roll = rnd.random()
+            if originals and roll < duplicate_rate:
+                group = rnd.randrange(len(originals))
+                data = originals[group][1]
+            elif originals and roll < duplicate_rate + near_duplicate_rate:
+                group = rnd.randrange(len(originals))
+                data = _encode(originals[group][0], quality=75)
+            elif roll < duplicate_rate + near_duplicate_rate + corrupt_rate:
+                group = None
+                data = _encode(_render_image(rng))[:4096]
+            else:
+                img = _render_image(rng)
+                group = len(originals)
+                data = _encode(img)
+                originals.append((img, data))
+            self.images.append(data)
+            self.groups.append(group)
+
+        self.thumbnails = [
+            _encode(Image.open(io.BytesIO(data)).convert("RGB").resize((160, 120)), quality=70)
+            if group is not None
+            else _encode(Image.new("RGB", (160, 120), "gray"))
+            for data, group in zip(self.images, self.groups)
+        ]
+        self.md5_groups = {}
+        for data, group in zip(self.images, self.groups):
+            if group is not None:
+                self.md5_groups[hashlib.md5(data).hexdigest()] = group
+        self.expected_unique = len(originals)
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def search_url(self):
+        return f"{self.url}/imghp"
+
+    def _handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, body, content_type, status=200):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                with site._lock:
+                    site.requests += 1
+                parts = urlsplit(self.path)
+                path = parts.path
+
+                if path in ("/", "/imghp"):
+                    return self._send(SEARCH_PAGE.encode(), "text/html; charset=utf-8")
+
+                if path == "/search":
+                    query = parse_qs(parts.query).get("q", [""])[0]
+                    items = [{"index": i, "query": query} for i in range(site.total)]
+                    page = (
+                        RESULTS_PAGE.replace("__ITEMS__", json.dumps(items))
+                        .replace("__PAGE_SIZE__", str(site.page_size))
+                        .replace("__PREVIEW_DELAY__", str(int(site.preview_delay * 1000)))
+                    )
+                    return self._send(page.encode(), "text/html; charset=utf-8")
+
+                for prefix, source in (("/thumb/", site.thumbnails), ("/image/", site.images)):
+                    if path.startswith(prefix):
+                        try:
+                            index = int(path[len(prefix):].split(".")[0])
+                            data = source[index]
+                        except (ValueError, IndexError):
+                            break
+                        if prefix == "/image/" and site.latency:
+                            time.sleep(site.latency)
+                        return self._send(data, "image/jpeg")
+
+                self._send(b"not found", "text/plain", status=404)
+
+        return Handler
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="本地图片搜索仿真站点")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--total", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    site = FixtureSite(total=args.total, latency=args.latency, port=args.port).start()
+    print(f"仿真站点已启动: {site.search_url}，预期唯一图片 {site.expected_unique} 张")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        site.stop()
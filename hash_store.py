@@ -0,0 +1,117 @@
+import threading
+
+import numpy as np
+
+
+class CompactHashSet:
+    """紧凑的MD5集合：以16字节摘要存放在NumPy开放寻址表中"""
+
+    _EMPTY = np.uint64(0)
+
+    def __init__(self, hashes=None, capacity=1024, max_load=0.5):
+        capacity = max(16, 1 << (int(capacity) - 1).bit_length())
+        self._table = np.zeros((capacity, 2), dtype=np.uint64)
+        self._mask = capacity - 1
+        self._max_load = max_load
+        self._size = 0
+        # 全零摘要与空槽位冲突，单独记录
+        self._has_zero = False
+        self._lock = threading.Lock()
+        if hashes is not None:
+            self.update(hashes)
+
+    @staticmethod
+    def _to_words(digest):
+        if isinstance(digest, str):
+            digest = bytes.fromhex(digest)
+        if len(digest) != 16:
+            raise ValueError(f"需要16字节MD5摘要，实际为{len(digest)}字节")
+        words = np.frombuffer(digest, dtype=np.uint64)
+        return words[0], words[1]
+
+    def _find_slot(self, hi, lo):
+        """线性探测，返回(槽位, 是否已存在)"""
+        table = self._table
+        mask = self._mask
+        # MD5本身分布均匀，直接取低位作为起始槽位
+        slot = int(hi) & mask
+        while True:
+            s_hi, s_lo = table[slot]
+            if s_hi == hi and s_lo == lo:
+                return slot, True
+            if s_hi == self._EMPTY and s_lo == self._EMPTY:
+                return slot, False
+            slot = (slot + 1) & mask
+
+    def _grow(self):
+        old = self._table
+        used = old[(old[:, 0] != 0) | (old[:, 1] != 0)]
+        capacity = len(old) * 2
+        self._table = np.zeros((capacity, 2), dtype=np.uint64)
+        self._mask = capacity - 1
+        for hi, lo in used:
+            slot, _ = self._find_slot(hi, lo)
+            self._table[slot] = (hi, lo)
+
+    def add(self, digest):
+        """加入摘要，返回是否为新元素"""
+        hi, lo = self._to_words(digest)
+        with self._lock:
+            if hi == self._EMPTY and lo == self._EMPTY:
+                if self._has_zero:
+                    return False
+                self._has_zero = True
+                self._size += 1
+                return True
+
+            slot, found = self._find_slot(hi, lo)
+            if found:
+                return False
+            self._table[slot] = (hi, lo)
+            self._size += 1
+            if self._size > len(self._table) * self._max_load:
+                self._grow()
+            return True
+
+    def update(self, digests):
+        for digest in digests:
+            self.add(digest)
+
+    def __contains__(self, digest):
+        try:
+            hi, lo = self._to_words(digest)
+        except ValueError:
+            return False
+        with self._lock:
+            if hi == self._EMPTY and lo == self._EMPTY:
+                return self._has_zero
+            return self._find_slot(hi, lo)[1]
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        """按十六进制字符串遍历，用于写入检查点"""
+        with self._lock:
+            used = self._table[(self._table[:, 0] != 0) | (self._table[:, 1] != 0)].copy()
+            has_zero = self._has_zero
+        if has_zero:
+            yield "0" * 32
+        for row in used:
+            yield row.tobytes().hex()
+
+    def memory_footprint(self):
+        """返回表占用的字节数"""
+        return self._table.nbytes
+
+    def stats(self):
+        footprint = self.memory_footprint()
+        return {
+            "entries": self._size,
+            "capacity": len(self._table),
+            "bytes": footprint,
+            "bytes_per_entry": round(footprint / self._size, 1) if self._size else 0.0,
+        }
+
+    def __repr__(self):
+        return f"CompactHashSet(entries={self._size}, bytes={self.memory_footprint()})"
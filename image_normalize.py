@@ -0,0 +1,92 @@
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+FORMAT_EXTENSIONS = {"JPEG": "jpg", "WEBP": "webp", "PNG": "png"}
+
+
+def normalize_bytes(img_data, max_side=2048, fmt="JPEG", quality=85):
+    """限制最长边、去除元数据并按统一格式重新编码，返回(数据, 扩展名)"""
+    fmt = fmt.upper()
+    if fmt not in FORMAT_EXTENSIONS:
+        raise ValueError(f"不支持的输出格式: {fmt}")
+
+    img = Image.open(io.BytesIO(img_data))
+    img.draft("RGB", (max_side, max_side))
+    img = ImageOps.exif_transpose(img)
+    if max(img.size) > max_side:
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    if fmt == "JPEG":
+        img = img.convert("RGB")
+    elif img.mode not in ("RGB", "RGBA", "L"):
+        img = img.convert("RGBA" if "A" in img.mode or "transparency" in img.info else "RGB")
+    # 丢弃EXIF、ICC等元数据
+    img.info = {}
+
+    out = io.BytesIO()
+    if fmt == "PNG":
+        img.save(out, fmt, optimize=True)
+    else:
+        img.save(out, fmt, quality=quality)
+    return out.getvalue(), FORMAT_EXTENSIONS[fmt]
+
+
+class ImageNormalizer:
+    """在独立线程池中完成转码，文件名保留原始数据的MD5"""
+
+    def __init__(self, max_side=2048, fmt="JPEG", quality=85, workers=2):
+        if str(fmt).upper() not in FORMAT_EXTENSIONS:
+            raise ValueError(f"不支持的输出格式: {fmt}")
+        if max_side < 1 or not 1 <= quality <= 100 or workers < 1:
+            raise ValueError("转码参数无效")
+        self.max_side = max_side
+        self.fmt = fmt
+        self.quality = quality
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._lock = threading.Lock()
+        self.images = 0
+        self.failed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def _run(self, img_data, save_dir, original_md5, on_saved):
+        try:
+            data, ext = normalize_bytes(img_data, self.max_side, self.fmt, self.quality)
+        except Exception as e:
+            print(f"转码失败，保留原始数据: {str(e)}")
+            data, ext = img_data, "jpg"
+            with self._lock:
+                self.failed += 1
+
+        filename = os.path.join(save_dir, f"{original_md5}.{ext}")
+        with open(filename, "wb") as f:
+            f.write(data)
+
+        with self._lock:
+            self.images += 1
+            self.bytes_in += len(img_data)
+            self.bytes_out += len(data)
+
+        if on_saved is not None:
+            on_saved(filename)
+        return filename
+
+    def submit(self, img_data, save_dir, original_md5, on_saved=None):
+        return self._executor.submit(self._run, img_data, save_dir, original_md5, on_saved)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "images": self.images,
+                "failed": self.failed,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "bytes_saved": self.bytes_in - self.bytes_out,
+            }
@@ -0,0 +1,90 @@
+import threading
+from collections import Counter
+
+import numpy as np
+
+PREVIEW_SIZE = 256
+
+
+def make_preview(img_pil, max_side=PREVIEW_SIZE):
+    """解码一次得到缩小的灰度图，供pHash和质量评分共用
+
+    对JPEG使用draft在解码阶段直接降采样；会就地修改传入的图像对象。
+    """
+    img_pil.draft("L", (max_side, max_side))
+    preview = img_pil.convert("L")
+    preview.thumbnail((max_side, max_side))
+    return preview
+
+
+def laplacian_variance(gray):
+    """拉普拉斯方差，数值越小越模糊"""
+    center = gray[1:-1, 1:-1]
+    lap = gray[1:-1, :-2] + gray[1:-1, 2:] + gray[:-2, 1:-1] + gray[2:, 1:-1] - 4 * center
+    return float(lap.var())
+
+
+def gray_entropy(gray):
+    """灰度直方图熵（bit），接近0表示近乎纯色"""
+    hist = np.bincount(gray.astype(np.uint8).ravel(), minlength=256).astype(np.float64)
+    p = hist[hist > 0] / hist.sum()
+    return float(-(p * np.log2(p)).sum()) + 0.0
+
+
+class QualityGate:
+    """保存前的廉价图像质量过滤，按拒绝原因计数"""
+
+    def __init__(
+        self,
+        min_sharpness=30.0,
+        min_side=200,
+        max_aspect=3.5,
+        min_entropy=3.0,
+        min_contrast=8.0,
+    ):
+        self.min_sharpness = min_sharpness
+        self.min_side = min_side
+        self.max_aspect = max_aspect
+        self.min_entropy = min_entropy
+        self.min_contrast = min_contrast
+        self.accepted = 0
+        self.rejected = Counter()
+        self._lock = threading.Lock()
+
+    def score(self, preview, size):
+        """size为原图解码尺寸(宽, 高)，preview为缩小后的灰度图"""
+        gray = np.asarray(preview, dtype=np.float32)
+        width, height = size
+        return {
+            "min_side": min(width, height),
+            "aspect": max(width, height) / max(min(width, height), 1),
+            "sharpness": laplacian_variance(gray) if min(gray.shape) >= 3 else 0.0,
+            "entropy": gray_entropy(gray),
+            "contrast": float(gray.std()),
+        }
+
+    def reject_reason(self, scores):
+        if scores["min_side"] < self.min_side:
+            return "low_resolution"
+        if scores["aspect"] > self.max_aspect:
+            return "banner"
+        if scores["entropy"] < self.min_entropy or scores["contrast"] < self.min_contrast:
+            return "near_blank"
+        if scores["sharpness"] < self.min_sharpness:
+            return "blurry"
+        return None
+
+    def check(self, preview, size):
+        """返回(拒绝原因或None, 评分)"""
+        scores = self.score(preview, size)
+        reason = self.reject_reason(scores)
+        with self._lock:
+            if reason is None:
+                self.accepted += 1
+            else:
+                self.rejected[reason] += 1
+        return reason, scores
+
+    def stats(self):
+        with self._lock:
+            return {"accepted": self.accepted, "rejected": dict(self.rejected)}
@@ -0,0 +1,362 @@
+"""道路巡检请求的语义结果缓存
+
+同一张路面图片经常被重复分析：追问、多名检查员、重复帧。缓存以
+(模型, 提示词场景, 规范化文本, 系统消息, 采样参数, 图片数量) 分桶，桶内按图片pHash的汉明距离匹配，
+命中时直接返回已有回答，并按与实时响应相同的格式流式输出。
+内存层为带TTL的LRU，可选的磁盘层使用SQLite，重启后仍可命中。
+"""
+
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import imagehash
+from PIL import Image
+from starlette.responses import StreamingResponse
+
+from chat_images import decode_data_uri, iter_image_parts
+
+log = logging.getLogger(__name__)
+
+INSPECTION_CACHE_SIZE = int(os.environ.get("INSPECTION_CACHE_SIZE", "1024"))
+INSPECTION_CACHE_TTL = float(os.environ.get("INSPECTION_CACHE_TTL", "86400"))
+# 与爬虫去重一致，pHash距离小于该值视为同一画面
+INSPECTION_CACHE_DISTANCE = int(os.environ.get("INSPECTION_CACHE_DISTANCE", "5"))
+INSPECTION_CACHE_DB = os.environ.get("INSPECTION_CACHE_DB")
+
+# 命中时每个流式分片的字符数
+STREAM_CHUNK_CHARS = 32
+
+# 影响回答内容的请求参数，取值不同的请求不共用缓存
+SAMPLING_PARAMS = (
+    "temperature",
+    "top_p",
+    "top_k",
+    "min_p",
+    "max_tokens",
+    "max_completion_tokens",
+    "num_predict",
+    "num_ctx",
+    "seed",
+    "stop",
+    "frequency_penalty",
+    "presence_penalty",
+    "repeat_penalty",
+    "response_format",
+)
+
+
+def normalize_text(text):
+    """忽略大小写、空白与句末标点的差异"""
+    text = re.sub(r"\s+", " ", text or "").strip().lower()
+    return text.rstrip("。.!！?？ ")
+
+
+def image_phash(url):
+    img = Image.open(io.BytesIO(decode_data_uri(url)))
+    img.draft("L", (256, 256))
+    return int(str(imagehash.phash(img.convert("L"))), 16)
+
+
+def sampling_options(form_data):
+    """请求中显式给出的采样参数，顶层字段与params中的都计入"""
+    params = form_data.get("params") or {}
+    options = {}
+    for name in SAMPLING_PARAMS:
+        value = form_data.get(name, params.get(name))
+        if value is not None:
+            options[name] = value
+    return options
+
+
+def cacheable_request(messages):
+    """只缓存单轮、带图片的提问；返回该用户消息，否则返回None"""
+    user_messages = []
+    for message in messages:
+        role = message.get("role")
+        if role == "assistant":
+            return None
+        if role == "user":
+            user_messages.append(message)
+    if len(user_messages) != 1:
+        return None
+    if not any(True for _ in iter_image_parts(user_messages)):
+        return None
+    return user_messages[0]
+
+
+def completion_response(answer, model_id, stream, **extra):
+    """按OpenAI格式返回本地得出的回答，流式请求同样以SSE分片输出"""
+    completion_id = f"chatcmpl-{uuid.uuid4()}"
+    created = int(time.time())
+    if not stream:
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model_id,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": answer},
+                    "finish_reason": "stop",
+                }
+            ],
+            **extra,
+        }
+
+    def chunk(delta, finish_reason=None):
+        data = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model_id,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    async def body():
+        yield chunk({"role": "assistant", "content": ""})
+        for i in range(0, len(answer), STREAM_CHUNK_CHARS):
+            yield chunk({"content": answer[i:i + STREAM_CHUNK_CHARS]})
+        yield chunk({}, "stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(body(), media_type="text/event-stream")
+
+
+class CacheKey:
+    def __init__(self, bucket, phashes):
+        self.bucket = bucket
+        self.phashes = phashes
+
+
+class InspectionCache:
+    def __init__(
+        self,
+        max_entries=INSPECTION_CACHE_SIZE,
+        ttl=INSPECTION_CACHE_TTL,
+        max_distance=INSPECTION_CACHE_DISTANCE,
+        db_path=INSPECTION_CACHE_DB,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        # 条目id -> (过期时间, 桶, pHash元组, 回答)，按最近使用排序
+        self._entries = OrderedDict()
+        # 桶 -> 条目id集合
+        self._buckets = {}
+        self._db = None
+        self._db_lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.hash_seconds = 0.0
+
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "bucket TEXT, phashes TEXT, answer TEXT, created REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS answers_bucket ON answers (bucket)")
+            self._db.commit()
+
+    def _matches(self, phashes, other):
+        return all(
+            (a ^ b).bit_count() < self.max_distance for a, b in zip(phashes, other)
+        )
+
+    async def make_key(self, model_id, scene, text, messages, options=None):
+        """计算请求的缓存键；不适合缓存的请求返回None
+
+        系统消息（客户端自带的与按场景插入的）和采样参数一并计入，
+        不同的指令或max_tokens、temperature等设置不会命中彼此的回答。
+        """
+        message = cacheable_request(messages)
+        if message is None:
+            return None
+        urls = [part["url"] for part in iter_image_parts([message])]
+        start = time.perf_counter()
+        try:
+            phashes = tuple(await asyncio.gather(*(asyncio.to_thread(image_phash, url) for url in urls)))
+        except Exception as e:
+            log.debug(f"Skipping inspection cache, failed to hash image: {e}")
+            return None
+        self.hash_seconds += time.perf_counter() - start
+        system = [
+            message.get("content")
+            for message in messages
+            if message.get("role") in ("system", "developer")
+        ]
+        digest = hashlib.sha1(
+            json.dumps(
+                [normalize_text(text), system, options or {}], ensure_ascii=False, sort_keys=True, default=str
+            ).encode("utf-8")
+        ).hexdigest()
+        return CacheKey(f"{model_id}|{scene}|{len(phashes)}|{digest}", phashes)
+
+    def _lookup_memory(self, key):
+        now = time.monotonic()
+        with self._lock:
+            for entry_id in list(self._buckets.get(key.bucket, ())):
+                expires, _, phashes, answer = self._entries[entry_id]
+                if expires <= now:
+                    self._remove(entry_id)
+                    continue
+                if self._matches(key.phashes, phashes):
+                    self._entries.move_to_end(entry_id)
+                    return answer
+        return None
+
+    def _lookup_disk(self, key):
+        if self._db is None:
+            return None
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT phashes, answer FROM answers WHERE bucket = ? AND created > ? "
+                "ORDER BY created DESC",
+                (key.bucket, time.time() - self.ttl),
+            ).fetchall()
+        for phashes, answer in rows:
+            if self._matches(key.phashes, [int(h, 16) for h in json.loads(phashes)]):
+                return answer
+        return None
+
+    async def get(self, key):
+        answer = self._lookup_memory(key)
+        if answer is not None:
+            self.hits += 1
+            return answer
+        answer = await asyncio.to_thread(self._lookup_disk, key)
+        if answer is not None:
+            # 磁盘层命中后提升到内存层
+            self.disk_hits += 1
+            self._put_memory(key, answer)
+            return answer
+        self.misses += 1
+        return None
+
+    def _remove(self, entry_id):
+        _, bucket, _, _ = self._entries.pop(entry_id)
+        ids = self._buckets[bucket]
+        ids.discard(entry_id)
+        if not ids:
+            del self._buckets[bucket]
+
+    def _put_memory(self, key, answer):
+        entry_id = uuid.uuid4().hex
+        with self._lock:
+            self._entries[entry_id] = (time.monotonic() + self.ttl, key.bucket, key.phashes, answer)
+            self._buckets.setdefault(key.bucket, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _put_disk(self, key, answer):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT INTO answers (bucket, phashes, answer, created) VALUES (?, ?, ?, ?)",
+                (key.bucket, json.dumps([f"{h:016x}" for h in key.phashes]), answer, time.time()),
+            )
+            self._db.execute("DELETE FROM answers WHERE created <= ?", (time.time() - self.ttl,))
+            self._db.commit()
+
+    async def put(self, key, answer):
+        if not answer:
+            return
+        self.stores += 1
+        self._put_memory(key, answer)
+        if self._db is not None:
+            await asyncio.to_thread(self._put_disk, key, answer)
+
+    async def record(self, key, response):
+        """在不改变响应内容的前提下截取模型回答，正常结束（finish_reason为stop）时写入缓存
+
+        因max_tokens截断（length）、中途断开或出错的回答不缓存。
+        """
+        if isinstance(response, dict):
+            try:
+                choice = response["choices"][0]
+                answer = choice["message"]["content"]
+            except (KeyError, IndexError, TypeError):
+                return response
+            if choice.get("finish_reason") == "stop":
+                await self.put(key, answer)
+            return response
+
+        if not isinstance(response, StreamingResponse) or "text/event-stream" not in (
+            response.headers.get("Content-Type") or ""
+        ):
+            return response
+
+        original = response.body_iterator
+
+        async def body():
+            parts = []
+            finished = False
+            buffer = ""
+            async for chunk in original:
+                yield chunk
+                buffer += chunk.decode("utf-8", "ignore") if isinstance(chunk, bytes) else chunk
+                lines = buffer.split("\n")
+                buffer = lines.pop()
+                for line in lines:
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        continue
+                    try:
+                        choice = json.loads(data)["choices"][0]
+                    except (ValueError, KeyError, IndexError, TypeError):
+                        continue
+                    parts.append((choice.get("delta") or {}).get("content") or "")
+                    if choice.get("finish_reason") == "stop":
+                        finished = True
+            if finished:
+                await self.put(key, "".join(parts))
+
+        response.body_iterator = body()
+        return response
+
+    def cached_response(self, answer, model_id, stream):
+        return completion_response(answer, model_id, stream, cached=True)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM answers")
+                self._db.commit()
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else None,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "mean_hash_ms": round(self.hash_seconds / lookups * 1000, 2) if lookups else None,
+            "disk": self.db_path,
+        }
@@ -351,7 +351,6 @@ from open_webui.utils.chat import (
     chat_action as chat_action_handler,
 )
 from open_webui.utils.middleware import process_chat_payload, process_chat_response
-from open_webui.utils.access_control import has_access
 
 from open_webui.utils.auth import (
     get_license_data,
@@ -366,6 +365,16 @@ from open_webui.tasks import stop_task, list_tasks  # Import from tasks.py
 
 from open_webui.utils.redis import get_sentinels_from_env
 
+from prompt_routing import PromptRouter
+from prompt_assembly import PromptAssembler, PromptEvalMetrics
+from admission import PRIORITY_HEADER, AdmissionController, QueueFull
+from chat_history import HistoryCompactor
+from chat_images import ChatImagePreprocessor, iter_image_parts
+from inspection_cache import InspectionCache, completion_response, sampling_options
+from preclassifier import PRECLASSIFIED_SCENES, PreClassifier, clean_answer
+from road_inspection import UPLOAD_PATHS as INSPECTION_UPLOAD_PATHS, router as inspection_router, upload_rejection
+from model_access import INVALIDATING_PATHS, ModelAccessCache, merge_tags
+
 
 if SAFE_MODE:
     print("SAFE MODE ENABLED")
@@ -420,6 +429,13 @@ async def lifespan(app: FastAPI):
     asyncio.create_task(periodic_usage_pool_cleanup())
     yield
 
+    # 取消仍在运行的爬取任务并关闭浏览器
+    if ENABLE_CRAWLER_API:
+        from spider_api import shutdown_jobs as shutdown_crawler_jobs
+
+        await shutdown_crawler_jobs()
+    chat_image_preprocessor.shutdown(wait=False)
+
 
 app = FastAPI(
     docs_url="/docs" if ENV == "dev" else None,
@@ -859,6 +875,22 @@ async def commit_session_after_request(request: Request, call_next):
     return response
 
 
+# 模型或访问控制修改成功后清空/api/models的按用户缓存；有Redis时通知所有worker
+model_access_cache = ModelAccessCache(redis_url=REDIS_URL)
+
+
+@app.middleware("http")
+async def invalidate_model_access_cache(request: Request, call_next):
+    response = await call_next(request)
+    if (
+        request.method != "GET"
+        and response.status_code < 400
+        and request.url.path.startswith(INVALIDATING_PATHS)
+    ):
+        await asyncio.to_thread(model_access_cache.invalidate)
+    return response
+
+
 @app.middleware("http")
 async def check_url(request: Request, call_next):
     start_time = int(time.time())
@@ -934,6 +966,35 @@ app.include_router(
 )
 app.include_router(utils.router, prefix="/api/v1/utils", tags=["utils"])
 
+# 图片爬取服务默认不挂载：它会加载selenium并与WebUI共用事件循环，cprofile/stack分析也会覆盖WebUI自身；
+# 需要时设置ENABLE_CRAWLER_API=true，或用 python spider_api.py 单独运行。挂载后仅管理员可用
+ENABLE_CRAWLER_API = os.environ.get("ENABLE_CRAWLER_API", "false").lower() == "true"
+
+if ENABLE_CRAWLER_API:
+    from spider_api import router as crawler_router
+
+    app.include_router(
+        crawler_router,
+        prefix="/api/v1/crawler",
+        tags=["crawler"],
+        dependencies=[Depends(get_admin_user)],
+    )
+
+# 道路巡检批量接口，不创建对话记录
+app.include_router(inspection_router, prefix="/api/v1/inspection", tags=["inspection"])
+
+
+@app.middleware("http")
+async def limit_inspection_uploads(request: Request, call_next):
+    # 上传在解析表单时就会整体写入临时文件，超过上限的请求在读取请求体之前拒绝
+    if request.method == "POST" and request.url.path in {
+        f"/api/v1/inspection{path}" for path in INSPECTION_UPLOAD_PATHS
+    }:
+        rejection = upload_rejection(request)
+        if rejection is not None:
+            return rejection
+    return await call_next(request)
+
 
 try:
     audit_level = AuditLevel(AUDIT_LOG_LEVEL)
@@ -957,47 +1018,14 @@ if audit_level != AuditLevel.NONE:
 
 @app.get("/api/models")
 async def get_models(request: Request, user=Depends(get_verified_user)):
-    def get_filtered_models(models, user):
-        filtered_models = []
-        for model in models:
-            if model.get("arena"):
-                if has_access(
-                    user.id,
-                    type="read",
-                    access_control=model.get("info", {})
-                    .get("meta", {})
-                    .get("access_control", {}),
-                ):
-                    filtered_models.append(model)
-                continue
-
-            model_info = Models.get_model_by_id(model["id"])
-            if model_info:
-                if user.id == model_info.user_id or has_access(
-                    user.id, type="read", access_control=model_info.access_control
-                ):
-                    filtered_models.append(model)
-
-        return filtered_models
-
     all_models = await get_all_models(request, user=user)
 
-    models = []
-    for model in all_models:
-        # Filter out filter pipelines
-        if "pipeline" in model and model["pipeline"].get("type", None) == "filter":
-            continue
-
-        model_tags = [
-            tag.get("name")
-            for tag in model.get("info", {}).get("meta", {}).get("tags", [])
-        ]
-        tags = [tag.get("name") for tag in model.get("tags", [])]
-
-        tags = list(set(model_tags + tags))
-        model["tags"] = [{"name": tag} for tag in tags]
-
-        models.append(model)
+    # Filter out filter pipelines
+    models = [
+        model
+        for model in all_models
+        if not ("pipeline" in model and model["pipeline"].get("type", None) == "filter")
+    ]
 
     model_order_list = request.app.state.config.MODEL_ORDER_LIST
     if model_order_list:
@@ -1008,8 +1036,12 @@ async def get_models(request: Request, user=Depends(get_verified_user)):
         )
 
     # Filter out models that the user does not have access to
+    # 模型记录批量查询，结果按用户缓存
     if user.role == "user" and not BYPASS_MODEL_ACCESS_CONTROL:
-        models = get_filtered_models(models, user)
+        models = await asyncio.to_thread(model_access_cache.filter, models, user)
+
+    # 只为返回的模型合并标签
+    models = [merge_tags(model) for model in models]
 
     log.debug(
         f"/api/models returned filtered models accessible to the user: {json.dumps([model['id'] for model in models])}"
@@ -1041,106 +1073,91 @@ def get_text_content(message_content) -> str:
 
     return ""
 
-def generate_dynamic_system_prompt(user_input: str) -> dict:
-    """
-        根据用户输入生成动态系统提示词
-    """
-    # 确保输入是字符串
-    if not isinstance(user_input, str):
-        user_input = str(user_input)
-
-    # 1. 分析用户输入内容
-    input_lower = user_input.lower()
-
-    # 2. 定义不同场景的提示词模板
-    prompt_templates = {
-        "pao": {
-            "role": "system",
-            "content": """  - Role: 道路抛洒物识别工程师
-                            - Background: 用户需要对公路上的抛洒物进行识别和描述，以便快速准确地了解道路状况，可能是为了道路维护、安全检查或其他相关目的。
-                            - Profile: 你是一位精通图像识别技术的道路抛洒物识别专家，能够通过图像识别技术精准地识别出公路上的各种抛洒物，并且能够结合道路工程知识对这些情况进行准确的描述和定位。你注重分析的准确性和可靠性，避免错误识别。
-                            - Skills: 你具备图像分析、模式识别、道路工程和计算机视觉等多学科的知识和技能，能够快速准确地从图像中提取关键信息，并以简洁明了的方式进行描述。同时，你能够对识别结果进行验证和筛选，以减少错误识别的可能性。
-                            - Goals: 从用户提供的图片中准确识别出公路上的抛洒物，并指出其大概位置，同时给出简要描述。避免出现错误识别的情况，提高识别的准确性和可靠性。
-                            - Constrains: 仅基于用户提供的图片进行分析，描述应简洁明了，避免冗长和复杂的解释，确保信息的准确性和实用性。在识别过程中，要进行严格的验证和筛选，避免出现错误识别的情况。
-                            - OutputFormat: 文字描述，包括异常情况的类型、大概位置和简要描述。如果没有发现异常情况，则明确说明“未发现异常情况”。
-                            - Workflow:
-                                  1. 接收用户提供的图片，对图片进行预处理，如调整亮度、对比度等，以便更好地识别其中的异常情况。
-                                  2. 运用图像识别技术，扫描图片中的公路区域，识别出可能的异常情况。
-                                  3. 对识别出的异常情况进行验证和筛选，结合道路工程知识和图像特征，判断其是否为真实的异常情况。
-                                  4. 如果确认存在异常情况，则确定其在图片中的大概位置，并给出简要描述；如果没有发现异常情况，则明确说明“未发现异常情况”。
-                            - Examples:
-                              - 例子1：图片中存在抛洒物
-                                描述：“在图片的左侧车道上，距离图片底部约三分之一处，发现有抛洒物，看起来像是散落的石块或杂物。”
-                              - 例子2：图片中存在抛洒物
-                                描述：“在图片的右侧车道上，距离图片底部约四分之一处，发现有抛洒物，看起来像是掉落的货物。”
-                              - 例子3：图片中存在抛洒物
-                                描述：“在图片的中央，距离图片底部约一半处，发现有抛洒物，看起来像是汽车的零件。”
-                              - 例子4：图片中未发现抛洒物
-                                描述：“经过仔细分析，未发现图片中有抛洒物。"""
-        },
-        "biao": {
-            "role": "system",
-            "content": """  - Role: 道路标志线识别工程师
-                            - Background: 用户需要对公路上的标志线损坏进行识别和描述，以便快速准确地了解道路状况，可能是为了道路维护、安全检查或其他相关目的。
-                            - Profile: 你是一位精通图像识别技术的道路标志线分析专家，能够通过图像识别技术精准地识别出公路上的标志线情况，并且能够进行准确的描述和定位。你注重分析的准确性和可靠性，避免错误识别。
-                            - Skills: 你具备图像分析、模式识别、道路工程和计算机视觉等多学科的知识和技能，能够快速准确地从图像中提取关键信息，并以简洁明了的方式进行描述。同时，你能够对识别结果进行验证和筛选，以减少错误识别的可能性。
-                            - Goals: 从用户提供的图片中准确识别出公路上标志线损坏情况，并指出其大概位置，同时给出简要描述。避免出现错误识别的情况，提高识别的准确性和可靠性。
-                            - Constrains: 仅基于用户提供的图片进行分析，描述应简洁明了，避免冗长和复杂的解释，确保信息的准确性和实用性。在识别过程中，要进行严格的验证和筛选，避免出现错误识别的情况。
-                            - OutputFormat: 文字描述，包括异常情况的类型、大概位置和简要描述。如果没有发现异常情况，则明确说明“未发现异常情况”。
-                            - Workflow:
-                                  1. 接收用户提供的图片，对图片进行预处理，如调整亮度、对比度等，以便更好地识别其中的异常情况。
-                                  2. 运用图像识别技术，扫描图片中的公路区域，识别出可能的异常情况。
-                                  3. 对识别出的异常情况进行验证和筛选，结合道路工程知识和图像特征，判断其是否为真实的异常情况。
-                                  4. 如果确认存在异常情况，则确定其在图片中的大概位置，并给出简要描述；如果没有发现异常情况，则明确说明“未发现异常情况”。
-                            - Examples:
-                              - 例子1：图片中存在标志线损坏
-                                描述：“在图片的中央，距离图片底部约三分之一处，发现白色标志线损坏。”
-                              - 例子2：图片中存在标志线损坏
-                                描述：“在图片的右下角，发现黄色标志线损坏。”
-                              - 例子3：图片中存在标志线损坏
-                                描述：“在图片的中央分隔线上，距离图片底部约一半处，发现标志线有损坏，可能是被车辆碾压导致。”
-                              - 例子4：图片中未发现标志线损坏
-                                描述：“经过仔细分析，未发现图片中有标志线损坏。"""
-        },
-        "keng": {
-            "role": "system",
-            "content": """  - Role: 道路坑槽识别工程师
-                            - Background: 用户需要对公路上的各种坑槽进行识别和描述，以便快速准确地了解道路状况，可能是为了道路维护、安全检查或其他相关目的。
-                            - Profile: 你是一位精通图像识别技术的道路坑槽分析专家，能够通过图像识别技术精准地识别出公路上的各种坑槽，并且能够结合道路工程知识对这些情况进行准确的描述和定位。你注重分析的准确性和可靠性，避免错误识别。
-                            - Skills: 你具备图像分析、模式识别、道路工程和计算机视觉等多学科的知识和技能，能够快速准确地从图像中提取关键信息，并以简洁明了的方式进行描述。同时，你能够对识别结果进行验证和筛选，以减少错误识别的可能性。
-                            - Goals: 从用户提供的图片中准确识别出公路上的坑槽，并指出其大概位置，同时给出简要描述。避免出现错误识别的情况，提高识别的准确性和可靠性。
-                            - Constrains: 仅基于用户提供的图片进行分析，描述应简洁明了，避免冗长和复杂的解释，确保信息的准确性和实用性。在识别过程中，要进行严格的验证和筛选，避免出现错误识别的情况。
-                            - OutputFormat: 文字描述，包括异常情况的类型、大概位置和简要描述。如果没有发现异常情况，则明确说明“未发现异常情况”。
-                            - Workflow:
-                                  1. 接收用户提供的图片，对图片进行预处理，如调整亮度、对比度等，以便更好地识别其中的异常情况。
-                                  2. 运用图像识别技术，扫描图片中的公路区域，识别出可能的异常情况。
-                                  3. 对识别出的异常情况进行验证和筛选，结合道路工程知识和图像特征，判断其是否为真实的异常情况。
-                                  4. 如果确认存在异常情况，则确定其在图片中的大概位置，并给出简要描述；如果没有发现异常情况，则明确说明“未发现异常情况”。
-                            - Examples:
-                              - 例子1：图片中存在坑槽
-                                描述：“在图片的左侧车道上，距离图片底部约三分之一处，发现有坑槽。”
-                              - 例子2：图片中存在坑槽
-                                描述：“在图片的右侧车道上，距离图片底部约四分之一处，发现一处坑槽，直径约30厘米，深度约5厘米。”
-                              - 例子3：图片中存在坑槽
-                                描述：“在图片的中央，距离图片底部约一半处，发现有坑槽。”
-                              - 例子4：图片中未发现坑槽
-                                描述：“经过仔细分析，未发现图片中有坑槽。"""
-        },
-        "general": {
-            "role": "system",
-            "content": "你是一个知识丰富、乐于助人的AI助手。请用清晰、准确的语言回答问题，并提供有用的信息。"
-        }
+# 提示词路由在启动时编译一次，配置文件修改后自动重新加载
+prompt_router = PromptRouter(os.environ.get("PROMPT_ROUTES_CONFIG"))
+prompt_assembler = PromptAssembler(prompt_router, get_text_content)
+prompt_eval_metrics = PromptEvalMetrics()
+
+# 内联图片在转发给视觉模型前缩小并重新压缩
+chat_image_preprocessor = ChatImagePreprocessor()
+# 较早轮次的图片替换为文字引用，不再重复发送
+history_compactor = HistoryCompactor(get_text_content)
+
+# 相同画面、相同问题的巡检结果缓存
+inspection_cache = InspectionCache()
+
+# 本地预分类模型，确信无缺陷的图片不再调用视觉模型；未训练模型时为None
+preclassifier = PreClassifier.load()
+
+# 按模型限制同时转发给模型服务的请求数，超出的请求在本地排队
+admission_controller = AdmissionController()
+
+# 批量巡检接口与对话接口共用提示词、图片预处理、结果缓存与准入控制
+app.state.PROMPT_ROUTER = prompt_router
+app.state.CHAT_IMAGE_PREPROCESSOR = chat_image_preprocessor
+app.state.INSPECTION_CACHE = inspection_cache
+app.state.PRECLASSIFIER = preclassifier
+app.state.ADMISSION = admission_controller
+
+
+def too_many_requests(e: QueueFull) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+@app.get("/api/prompt-routing/metrics")
+async def get_prompt_routing_metrics(user=Depends(get_admin_user)):
+    return {
+        **prompt_router.metrics(),
+        "assembly": prompt_assembler.metrics(),
+        "prompt_eval": prompt_eval_metrics.metrics(),
     }
 
-    # 3. 根据关键词匹配最合适的提示词
-    if any(word in input_lower for word in ["抛洒物"]):
-        return prompt_templates["pao"]
-    elif any(word in input_lower for word in ["标志线"]):
-        return prompt_templates["biao"]
-    elif any(word in input_lower for word in ["坑槽"]):
-        return prompt_templates["keng"]
-    else:
-        return prompt_templates["general"]
+
+@app.post("/api/prompt-routing/reload")
+async def reload_prompt_routing(user=Depends(get_admin_user)):
+    if not prompt_router.config_path:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="PROMPT_ROUTES_CONFIG is not set",
+        )
+    if not prompt_router.reload():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Failed to load prompt routes",
+        )
+    return prompt_router.metrics()
+
+
+@app.get("/api/chat-images/metrics")
+async def get_chat_image_metrics(user=Depends(get_admin_user)):
+    return {**chat_image_preprocessor.stats(), "history": history_compactor.stats()}
+
+
+@app.get("/api/inspection-cache/metrics")
+async def get_inspection_cache_metrics(user=Depends(get_admin_user)):
+    return inspection_cache.stats()
+
+
+@app.delete("/api/inspection-cache")
+async def clear_inspection_cache(user=Depends(get_admin_user)):
+    inspection_cache.clear()
+    return inspection_cache.stats()
+
+
+@app.get("/api/preclassifier/metrics")
+async def get_preclassifier_metrics(user=Depends(get_admin_user)):
+    if preclassifier is None:
+        return {"enabled": False}
+    return {"enabled": True, **preclassifier.stats()}
+
+
+@app.get("/api/admission/metrics")
+async def get_admission_metrics(user=Depends(get_admin_user)):
+    return admission_controller.stats()
 
 
 @app.post("/api/chat/completions")
@@ -1149,6 +1166,10 @@ async def chat_completion(
     form_data: dict,
     user=Depends(get_verified_user),
 ):
+    started = time.perf_counter()
+    # 只在需要调用模型时排队；缓存命中与预分类的请求不受队列长度影响
+    priority = request.headers.get(PRIORITY_HEADER)
+
     # 安全获取用户文本输入
     user_messages = [msg for msg in form_data.get("messages", []) if msg["role"] == "user"]
     last_user_message = ""
@@ -1156,17 +1177,41 @@ async def chat_completion(
         last_message_content = user_messages[-1].get("content", "")
         last_user_message = get_text_content(last_message_content)  # 使用安全提取方法
 
-    # 生成动态提示词
-    system_prompt = generate_dynamic_system_prompt(last_user_message)
-
     # 确保messages是列表格式
     if "messages" not in form_data:
         form_data["messages"] = []
     elif not isinstance(form_data["messages"], list):
         form_data["messages"] = [form_data["messages"]]
 
-    # 插入动态生成的系统提示词
-    form_data["messages"].insert(0, system_prompt)
+    # 放置动态系统提示词；stable模式下同一对话的前缀保持不变，便于后端复用前缀缓存
+    prompt_scene = prompt_assembler.assemble(form_data["messages"], form_data.get("chat_id"))
+
+    # 只保留最近几轮的图片，先于缩放执行，省略的图片不再转码
+    history_report = history_compactor.compact(form_data["messages"])
+    if history_report:
+        log.info(f"Compacted chat history: {json.dumps(history_report)}")
+
+    # 缩小内联图片，减少上传字节数与视觉token
+    image_report = await chat_image_preprocessor.process(
+        form_data["messages"], form_data.get("model")
+    )
+    if image_report:
+        log.info(f"Preprocessed chat images: {json.dumps(image_report)}")
+
+    # 工具调用、检索或联网搜索的结果随时间变化，这类请求不走缓存
+    cache_key = None
+    if not (
+        form_data.get("tool_ids")
+        or form_data.get("files")
+        or any((form_data.get("features") or {}).values())
+    ):
+        cache_key = await inspection_cache.make_key(
+            form_data.get("model"),
+            prompt_scene,
+            last_user_message,
+            form_data["messages"],
+            sampling_options(form_data),
+        )
 
     # === 结束修改 ===
     if not request.app.state.MODELS:
@@ -1209,6 +1254,8 @@ async def chat_completion(
             "variables": form_data.get("variables", None),
             "model": model,
             "direct": model_item.get("direct", False),
+            "image_preprocess": image_report,
+            "history_compaction": history_report,
             **(
                 {"function_calling": "native"}
                 if form_data.get("params", {}).get("function_calling") == "native"
@@ -1243,17 +1290,56 @@ async def chat_completion(
             detail=str(e),
         )
 
+    ticket = None
     try:
-        response = await chat_completion_handler(request, form_data, user)
+        cached_answer = await inspection_cache.get(cache_key) if cache_key else None
+        if cached_answer is not None:
+            response = inspection_cache.cached_response(
+                cached_answer, form_data.get("model"), form_data.get("stream", False)
+            )
+        elif (
+            preclassifier
+            and cache_key
+            and prompt_scene in PRECLASSIFIED_SCENES
+            and await preclassifier.check(
+                [part["url"] for part in iter_image_parts(form_data["messages"])]
+            )
+        ):
+            # 预分类确信图片无缺陷，直接给出结论
+            response = completion_response(
+                clean_answer(prompt_scene),
+                form_data.get("model"),
+                form_data.get("stream", False),
+                preclassified=True,
+            )
+        else:
+            # 按优先级与用户轮流等待模型槽位，队列已满时立即返回429
+            ticket = await admission_controller.acquire(
+                form_data.get("model"), user.id, priority
+            )
+            response = await chat_completion_handler(request, form_data, user)
+            response = admission_controller.hold(response, ticket)
+            response = prompt_eval_metrics.observe(response, started)
+            if cache_key:
+                response = await inspection_cache.record(cache_key, response)
 
-        return await process_chat_response(
+        response = await process_chat_response(
             request, response, form_data, user, metadata, model, events, tasks
         )
+        # 成功返回后由hold负责归还：流式响应在输出结束后，其他响应已立即归还
+        ticket = None
+        return response
+    except QueueFull as e:
+        raise too_many_requests(e)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e),
         )
+    finally:
+        # 出错或请求被取消（CancelledError）时立即归还；release可重复调用
+        if ticket:
+            ticket.release()
 
 
 # Alias for chat_completion (Legacy)
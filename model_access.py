@@ -0,0 +1,180 @@
+"""/api/models 的模型访问权限过滤
+
+模型记录与用户所属的组各用一次查询批量取出，不再对每个模型单独查库；
+每个用户可访问的模型集合会缓存下来，模型或访问控制变化时整体失效。
+配置了Redis时失效通过共享的代数计数器通知所有worker和副本；否则多worker部署只能依赖TTL，默认缩短。
+"""
+
+import logging
+import os
+import threading
+import time
+
+from open_webui.models.groups import Groups
+from open_webui.models.models import Models
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+log = logging.getLogger(__name__)
+
+MODEL_ACCESS_CACHE_TTL = float(os.environ.get("MODEL_ACCESS_CACHE_TTL", "300"))
+# 多个worker且没有Redis广播失效时，其他worker的缓存只能等过期，改用较短的TTL
+MODEL_ACCESS_CACHE_UNSHARED_TTL = float(os.environ.get("MODEL_ACCESS_CACHE_UNSHARED_TTL", "10"))
+UVICORN_WORKERS = int(os.environ.get("UVICORN_WORKERS", "1"))
+# 两次读取Redis共享代数的最短间隔，其他进程的失效最多延迟这么久生效
+MODEL_ACCESS_SYNC_INTERVAL = float(os.environ.get("MODEL_ACCESS_SYNC_INTERVAL", "1"))
+MODEL_ACCESS_GENERATION_KEY = "open-webui:model_access:generation"
+
+# 这些接口的写操作会改变模型记录、组成员或用户角色，成功后需要清空缓存
+INVALIDATING_PATHS = (
+    "/api/v1/models",
+    "/api/v1/groups",
+    "/api/v1/users",
+    "/api/v1/evaluations/config",
+)
+
+
+def can_read(user_id, group_ids, access_control):
+    """与open_webui的has_access读权限规则一致，但使用预先取出的组，不再逐个查库"""
+    if access_control is None:
+        return True
+    permission = access_control.get("read", {})
+    return user_id in permission.get("user_ids", []) or bool(
+        group_ids.intersection(permission.get("group_ids", []))
+    )
+
+
+def lookup_model_infos():
+    """一次查询取出所有模型记录，按id建立索引"""
+    return {model.id: model for model in Models.get_all_models()}
+
+
+class ModelAccessCache:
+    """按用户缓存可访问的模型id
+
+    缓存记录当时检查过的模型id，出现新模型时重新计算；
+    模型或访问控制修改后调用invalidate()，另有TTL兜底。
+    传入redis_url时invalidate()同时递增Redis中的代数，其他进程读到新代数后清空本地缓存。
+    filter()与invalidate()可能访问数据库或Redis，在异步接口中应放到线程中调用。
+    """
+
+    def __init__(self, ttl=None, redis_url=None, sync_interval=MODEL_ACCESS_SYNC_INTERVAL):
+        self._redis = None
+        if redis_url:
+            if redis is None:
+                raise RuntimeError("使用Redis广播缓存失效需要安装redis包")
+            self._redis = redis.Redis.from_url(redis_url, socket_timeout=1)
+        if ttl is None:
+            ttl = MODEL_ACCESS_CACHE_TTL
+            if self._redis is None and UVICORN_WORKERS > 1:
+                ttl = min(ttl, MODEL_ACCESS_CACHE_UNSHARED_TTL)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._generation = 0
+        self._shared_generation = None
+        self.sync_interval = sync_interval
+        self._synced = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def invalidate(self):
+        self._clear()
+        self.invalidations += 1
+        if self._redis is not None:
+            try:
+                self._redis.incr(MODEL_ACCESS_GENERATION_KEY)
+            except redis.RedisError as e:
+                log.warning(f"广播模型访问缓存失效失败: {e}")
+
+    def _sync(self):
+        """读取共享代数，其他进程失效过时清空本地缓存；Redis不可用时返回False，本次不使用缓存"""
+        if self._redis is None:
+            return True
+        now = time.monotonic()
+        if self._synced is not None and now - self._synced < self.sync_interval:
+            return True
+        try:
+            shared = self._redis.get(MODEL_ACCESS_GENERATION_KEY)
+        except redis.RedisError as e:
+            log.warning(f"读取模型访问缓存代数失败: {e}")
+            self._synced = None
+            self._clear()
+            return False
+        self._synced = now
+        if shared != self._shared_generation:
+            self._clear()
+            self._shared_generation = shared
+        return True
+
+    def _compute(self, models, user):
+        group_ids = {group.id for group in Groups.get_groups_by_member_id(user.id)}
+        model_infos = lookup_model_infos()
+
+        allowed = set()
+        for model in models:
+            if model.get("arena"):
+                access_control = (
+                    model.get("info", {}).get("meta", {}).get("access_control", {})
+                )
+                if can_read(user.id, group_ids, access_control):
+                    allowed.add(model["id"])
+                continue
+
+            model_info = model_infos.get(model["id"])
+            if model_info and (
+                user.id == model_info.user_id
+                or can_read(user.id, group_ids, model_info.access_control)
+            ):
+                allowed.add(model["id"])
+        return allowed
+
+    def filter(self, models, user):
+        """返回用户有读权限的模型，保持原有顺序"""
+        ids = {model["id"] for model in models}
+        shared = self._sync()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user.id)
+            generation = self._generation
+        if shared and entry and entry[0] > now and ids <= entry[1]:
+            self.hits += 1
+            allowed = entry[2]
+        else:
+            self.misses += 1
+            allowed = self._compute(models, user)
+            with self._lock:
+                # 计算期间缓存被清空过，结果可能已过时，不写回
+                if shared and generation == self._generation:
+                    self._entries[user.id] = (now + self.ttl, frozenset(ids), allowed)
+
+        return [model for model in models if model["id"] in allowed]
+
+    def stats(self):
+        return {
+            "ttl_s": self.ttl,
+            "shared": self._redis is not None,
+            "users": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+def merge_tags(model):
+    """合并模型元数据与连接配置中的标签，去重并保持顺序"""
+    model_tags = [
+        tag.get("name") for tag in model.get("info", {}).get("meta", {}).get("tags", [])
+    ]
+    tags = [tag.get("name") for tag in model.get("tags", [])]
+    model["tags"] = [{"name": tag} for tag in dict.fromkeys(model_tags + tags)]
+    return model
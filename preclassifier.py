@@ -0,0 +1,238 @@
+"""巡检前的本地预分类
+
+大部分巡检画面没有缺陷，却都要完整调用一次视觉模型才得到“未发现异常情况”。
+这里用NumPy实现的轻量模型（颜色、纹理与边缘特征上的逻辑回归）在CPU上先判断一遍，
+确信无缺陷时直接给出结论，只有不确定或疑似有缺陷的图片才交给视觉模型。
+
+模型由批量标注（auto_label.py）生成的标注文件训练：
+    python preclassifier.py train ./images
+
+默认模型路径位于Open WebUI的数据目录（DATA_DIR）下，可用PRECLASSIFIER_MODEL覆盖。
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import threading
+import time
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from open_webui.config import DATA_DIR
+
+from auto_label import iter_images, labels_path_for
+from chat_images import decode_data_uri
+from defect_report import COMBINED_SCENE
+from road_prompts import SCENE_LABELS
+
+PRECLASSIFIER_MODEL = os.environ.get(
+    "PRECLASSIFIER_MODEL", os.path.join(DATA_DIR, "preclassifier.npz")
+)
+# 判定为无缺陷的概率至少达到该值才跳过视觉模型
+PRECLASSIFIER_THRESHOLD = float(os.environ.get("PRECLASSIFIER_THRESHOLD", "0.95"))
+
+FEATURE_SIZE = (256, 192)
+
+# 可由预分类直接给出结论的提示词场景
+PRECLASSIFIED_SCENES = (*SCENE_LABELS, COMBINED_SCENE)
+
+
+def image_features(data):
+    """提取颜色直方图、梯度与下半幅（路面区域）的纹理特征"""
+    img = Image.open(io.BytesIO(data))
+    img.draft("RGB", FEATURE_SIZE)
+    img = ImageOps.exif_transpose(img).convert("RGB").resize(FEATURE_SIZE)
+    hsv = np.asarray(img.convert("HSV"), dtype=np.float32) / 255
+    gray = np.asarray(img.convert("L"), dtype=np.float32) / 255
+
+    h, s, v = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+    features = [
+        np.histogram(h, bins=8, range=(0, 1))[0],
+        np.histogram(s, bins=4, range=(0, 1))[0],
+        np.histogram(v, bins=4, range=(0, 1))[0],
+    ]
+    features = [f / h.size for f in features]
+
+    gy, gx = np.gradient(gray)
+    magnitude = np.hypot(gx, gy)
+    laplacian = (
+        np.roll(gray, 1, 0) + np.roll(gray, -1, 0) + np.roll(gray, 1, 1) + np.roll(gray, -1, 1) - 4 * gray
+    )
+    stats = [magnitude.mean(), magnitude.std(), (magnitude > 0.1).mean(), laplacian.var()]
+
+    # 路面通常在画面下半部分：坑槽偏暗、标线为白色或黄色、抛洒物带来额外的边缘
+    bottom = slice(gray.shape[0] // 2, None)
+    b_mag = magnitude[bottom]
+    b_s, b_v, b_h = s[bottom], v[bottom], h[bottom]
+    angle = np.arctan2(gy[bottom], gx[bottom])
+    orientation = np.histogram(angle, bins=8, range=(-np.pi, np.pi), weights=b_mag)[0]
+    orientation = orientation / (orientation.sum() or 1)
+    stats += [
+        b_mag.mean(),
+        b_mag.std(),
+        (b_mag > 0.1).mean(),
+        (b_v < 0.2).mean(),
+        ((b_v > 0.75) & (b_s < 0.2)).mean(),
+        ((b_h > 0.1) & (b_h < 0.18) & (b_s > 0.4)).mean(),
+        b_v.std(),
+    ]
+    return np.concatenate(features + [np.asarray(stats, dtype=np.float32), orientation]).astype(np.float32)
+
+
+def clean_answer(scene):
+    """跳过视觉模型时返回的结论，格式与对应提示词要求的输出一致"""
+    if scene == COMBINED_SCENE:
+        return json.dumps({"defects": []})
+    return f"经过仔细分析，未发现图片中有{SCENE_LABELS[scene]}。"
+
+
+def sigmoid(z):
+    return 1 / (1 + np.exp(-np.clip(z, -30, 30)))
+
+
+class PreClassifier:
+    """缺陷概率的逻辑回归模型，附带命中统计"""
+
+    def __init__(self, weights, bias, mean, std, threshold=PRECLASSIFIER_THRESHOLD):
+        self.weights = weights
+        self.bias = float(bias)
+        self.mean = mean
+        self.std = std
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.skipped = 0
+        self.failed = 0
+        self.classify_seconds = 0.0
+
+    @classmethod
+    def load(cls, path=PRECLASSIFIER_MODEL, threshold=PRECLASSIFIER_THRESHOLD):
+        """模型文件不存在时返回None，此时不做预分类"""
+        if not path or not os.path.exists(path):
+            return None
+        model = np.load(path)
+        return cls(model["weights"], model["bias"], model["mean"], model["std"], threshold)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        np.savez(path, weights=self.weights, bias=self.bias, mean=self.mean, std=self.std)
+
+    def defect_probability(self, features):
+        x = (np.atleast_2d(features) - self.mean) / self.std
+        return sigmoid(x @ self.weights + self.bias)
+
+    def is_clean(self, data):
+        return float(self.defect_probability(image_features(data))[0]) <= 1 - self.threshold
+
+    def _check(self, urls):
+        return all(self.is_clean(decode_data_uri(url)) for url in urls)
+
+    async def check(self, urls):
+        """所有图片都确信无缺陷时返回True；无法判断时返回False交给视觉模型"""
+        start = time.perf_counter()
+        try:
+            clean = bool(urls) and await asyncio.to_thread(self._check, urls)
+        except Exception:
+            clean = None
+        with self._lock:
+            self.failed += clean is None
+            self.checked += 1
+            self.skipped += bool(clean)
+            self.classify_seconds += time.perf_counter() - start
+        return bool(clean)
+
+    def stats(self):
+        return {
+            "threshold": self.threshold,
+            "checked": self.checked,
+            "skipped": self.skipped,
+            "escalated": self.checked - self.skipped,
+            "failed": self.failed,
+            # 每次跳过省下一次视觉模型调用
+            "calls_saved": self.skipped,
+            "skip_rate": round(self.skipped / self.checked, 4) if self.checked else None,
+            "mean_classify_ms": round(self.classify_seconds / self.checked * 1000, 2)
+            if self.checked
+            else None,
+        }
+
+
+def load_dataset(inputs):
+    """读取批量标注的结果：任一类别发现缺陷即为正样本"""
+    features, labels = [], []
+    for path in inputs:
+        records = {}
+        with open(labels_path_for(path), "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    records[record["image"]] = any(label["found"] for label in record["labels"].values())
+                except (ValueError, KeyError, AttributeError):
+                    continue
+        for name, data in iter_images(path):
+            if name not in records:
+                continue
+            try:
+                features.append(image_features(data))
+            except Exception as e:
+                print(f"特征提取失败: {name} {str(e)}")
+                continue
+            labels.append(records[name])
+    return np.asarray(features, dtype=np.float32), np.asarray(labels, dtype=np.float32)
+
+
+def train(features, labels, l2=1e-3, lr=0.1, epochs=3000):
+    """带类别权重与L2正则的逻辑回归，全量梯度下降"""
+    mean = features.mean(axis=0)
+    std = features.std(axis=0) + 1e-6
+    x = (features - mean) / std
+    positive = labels.mean()
+    # 缺陷样本通常较少，按类别频率加权
+    sample_weight = np.where(labels == 1, 0.5 / max(positive, 1e-6), 0.5 / max(1 - positive, 1e-6))
+    weights = np.zeros(x.shape[1], dtype=np.float64)
+    bias = 0.0
+    for _ in range(epochs):
+        error = (sigmoid(x @ weights + bias) - labels) * sample_weight
+        weights -= lr * (x.T @ error / len(x) + l2 * weights)
+        bias -= lr * error.mean()
+    return PreClassifier(weights, bias, mean, std)
+
+
+def evaluate(model, features, labels, thresholds=(0.8, 0.9, 0.95, 0.98, 0.99)):
+    """各阈值下可跳过的比例，以及被跳过的图片中实际有缺陷的数量"""
+    probability = model.defect_probability(features)
+    report = []
+    for threshold in thresholds:
+        skipped = probability <= 1 - threshold
+        report.append({
+            "threshold": threshold,
+            "skip_rate": round(float(skipped.mean()), 4),
+            "missed_defects": int((skipped & (labels == 1)).sum()),
+            "defects": int(labels.sum()),
+        })
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="训练巡检预分类模型")
+    parser.add_argument("command", choices=["train"])
+    parser.add_argument("inputs", nargs="+", help="已标注的图片目录或tar/zip归档分片")
+    parser.add_argument("--out", default=PRECLASSIFIER_MODEL)
+    parser.add_argument("--holdout", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    features, labels = load_dataset(args.inputs)
+    if len(labels) < 10 or labels.min() == labels.max():
+        raise SystemExit("标注样本不足，或只有一个类别")
+    order = np.random.RandomState(args.seed).permutation(len(labels))
+    split = int(len(order) * (1 - args.holdout))
+    model = train(features[order[:split]], labels[order[:split]])
+    print(json.dumps(evaluate(model, features[order[split:]], labels[order[split:]]), ensure_ascii=False))
+
+    # 验证后用全部样本重新训练并保存
+    train(features, labels).save(args.out)
+    print(f"已保存: {args.out}")
@@ -0,0 +1,212 @@
+"""系统提示词的放置方式与提示词预填充统计
+
+旧做法每轮按最后一条用户消息重新选择模板并插入到开头，多轮对话中系统提示词随轮次变化，
+还会叠加在已有的系统消息之上，Ollama、llama.cpp的前缀缓存因此失效，每轮都要重新预填充整段长提示词。
+
+stable模式下：
+- 对话的模板在第一次路由到巡检场景后固定，之后各轮不再变化；
+- 所有系统消息合并为开头的一条，重复内容只保留一份；
+- 相同输入得到逐字节相同的前缀。
+
+stable模式会改变多轮对话的路由结果（后续轮次沿用第一次路由到的模板），默认仍为legacy，
+需设置PROMPT_ASSEMBLY_MODE=stable启用。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from starlette.responses import StreamingResponse
+
+log = logging.getLogger(__name__)
+
+PROMPT_ASSEMBLY_MODES = ("stable", "legacy")
+PROMPT_ASSEMBLY_MODE = os.environ.get("PROMPT_ASSEMBLY_MODE", "legacy")
+# 固定模板的对话数上限，超出后淘汰最久未使用的对话
+MAX_PINNED_CHATS = int(os.environ.get("PROMPT_MAX_PINNED_CHATS", "10000"))
+
+
+class PromptAssembler:
+    def __init__(self, router, get_text, mode=PROMPT_ASSEMBLY_MODE, max_chats=MAX_PINNED_CHATS):
+        if mode not in PROMPT_ASSEMBLY_MODES:
+            raise ValueError(f"未知的提示词放置方式: {mode}")
+        self.router = router
+        self.get_text = get_text
+        self.mode = mode
+        self.max_chats = max_chats
+        self._lock = threading.Lock()
+        # 对话id -> (场景, 上一轮前缀的摘要)
+        self._chats = OrderedDict()
+        self.assembled = 0
+        self.prefix_changes = 0
+        self.deduped = 0
+
+    def _scene_for(self, chat_id, user_texts):
+        # 历史消息不会改变，按顺序取第一个命中的场景，同一对话的结果天然稳定
+        scene = self.router.route_first(user_texts)
+        if not chat_id:
+            return scene
+        with self._lock:
+            pinned = self._chats.get(chat_id)
+        # 已固定的模板优先；只有仍是默认模板时，才在首次提到巡检场景后切换一次
+        if pinned and (pinned[0] != self.router.routes.default or scene == pinned[0]):
+            return pinned[0]
+        return scene
+
+    def _remember(self, chat_id, scene, prefix):
+        digest = hashlib.sha1(prefix.encode("utf-8")).hexdigest()
+        with self._lock:
+            previous = self._chats.pop(chat_id, None)
+            if previous and previous[1] != digest:
+                self.prefix_changes += 1
+            self._chats[chat_id] = (scene, digest)
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+
+    def assemble(self, messages, chat_id=None):
+        """在messages开头放置系统提示词（原地修改），返回所用的场景"""
+        user_texts = [
+            self.get_text(message.get("content", ""))
+            for message in messages
+            if message.get("role") == "user"
+        ]
+        self.assembled += 1
+
+        if self.mode == "legacy":
+            scene, system_prompt = self.router.select(user_texts[-1] if user_texts else "")
+            messages.insert(0, system_prompt)
+            return scene
+
+        scene = self._scene_for(chat_id, user_texts)
+        system_prompt = self.router.template(scene)
+        parts = [system_prompt["content"]]
+        rest = []
+        for message in messages:
+            content = message.get("content")
+            if message.get("role") != "system" or not isinstance(content, str):
+                rest.append(message)
+            elif content.strip() and content not in parts:
+                parts.append(content)
+            else:
+                self.deduped += 1
+        system_prompt["content"] = "\n\n".join(parts)
+        messages[:] = [system_prompt, *rest]
+
+        if chat_id:
+            self._remember(chat_id, scene, system_prompt["content"])
+        return scene
+
+    def metrics(self):
+        return {
+            "mode": self.mode,
+            "assembled": self.assembled,
+            "pinned_chats": len(self._chats),
+            # 同一对话前后两轮系统提示词不同的次数，stable模式下应接近0
+            "prefix_changes": self.prefix_changes,
+            "deduped_system_messages": self.deduped,
+        }
+
+
+def usage_of(data):
+    """从OpenAI格式的响应或分片中取出预填充相关的用量，兼容Ollama与llama.cpp的字段"""
+    usage = data.get("usage") or {}
+    timings = data.get("timings") or {}
+    prompt_tokens = usage.get("prompt_eval_count", usage.get("prompt_tokens", timings.get("prompt_n")))
+    if prompt_tokens is None:
+        return None
+    if "prompt_eval_duration" in usage:
+        # Ollama以纳秒为单位
+        prompt_ms = usage["prompt_eval_duration"] / 1e6
+    else:
+        prompt_ms = timings.get("prompt_ms")
+    return {
+        "prompt_tokens": prompt_tokens,
+        "prompt_ms": prompt_ms,
+        # llama.cpp报告命中前缀缓存的token数
+        "cached_tokens": timings.get("cache_n", (usage.get("prompt_tokens_details") or {}).get("cached_tokens")),
+    }
+
+
+class PromptEvalMetrics:
+    """首token延迟与提示词预填充量的统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.streamed = 0
+        self.ttft_seconds = 0.0
+        self.with_usage = 0
+        self.prompt_tokens = 0
+        self.prompt_ms = 0.0
+        self.prompt_ms_samples = 0
+        self.cached_tokens = 0
+
+    def _add_usage(self, usage):
+        if usage is None:
+            return
+        with self._lock:
+            self.with_usage += 1
+            self.prompt_tokens += usage["prompt_tokens"] or 0
+            if usage["prompt_ms"] is not None:
+                self.prompt_ms += usage["prompt_ms"]
+                self.prompt_ms_samples += 1
+            self.cached_tokens += usage["cached_tokens"] or 0
+
+    def observe(self, response, started):
+        """不改变响应内容，记录首token时间与最终的用量；started为请求开始的perf_counter"""
+        with self._lock:
+            self.requests += 1
+        if isinstance(response, dict):
+            self._add_usage(usage_of(response))
+            return response
+        if not isinstance(response, StreamingResponse) or "text/event-stream" not in (
+            response.headers.get("Content-Type") or ""
+        ):
+            return response
+
+        original = response.body_iterator
+
+        async def body():
+            first = None
+            usage = None
+            buffer = ""
+            async for chunk in original:
+                yield chunk
+                buffer += chunk.decode("utf-8", "ignore") if isinstance(chunk, bytes) else chunk
+                lines = buffer.split("\n")
+                buffer = lines.pop()
+                for line in lines:
+                    if not line.startswith("data:") or line[5:].strip() == "[DONE]":
+                        continue
+                    try:
+                        data = json.loads(line[5:])
+                    except ValueError:
+                        continue
+                    if first is None:
+                        choices = data.get("choices") or [{}]
+                        if (choices[0].get("delta") or {}).get("content"):
+                            first = time.perf_counter() - started
+                    usage = usage_of(data) or usage
+            with self._lock:
+                if first is not None:
+                    self.streamed += 1
+                    self.ttft_seconds += first
+            self._add_usage(usage)
+
+        response.body_iterator = body()
+        return response
+
+    def metrics(self):
+        return {
+            "requests": self.requests,
+            "mean_ttft_ms": round(self.ttft_seconds / self.streamed * 1000, 1) if self.streamed else None,
+            "mean_prompt_tokens": round(self.prompt_tokens / self.with_usage, 1) if self.with_usage else None,
+            "mean_prompt_eval_ms": round(self.prompt_ms / self.prompt_ms_samples, 1)
+            if self.prompt_ms_samples
+            else None,
+            "cached_prompt_tokens": self.cached_tokens,
+        }
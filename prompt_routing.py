@@ -0,0 +1,168 @@
+"""按用户输入的关键词选择系统提示词
+
+模板与路由规则在启动时编译一次：所有关键词合并为一个正则，单次扫描输入即可完成路由，
+增加场景不会增加每次请求的匹配轮数。配置文件变化时自动重新加载。
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+
+from road_prompts import PROMPT_TEMPLATES, SCENE_KEYWORDS
+
+log = logging.getLogger(__name__)
+
+DEFAULT_SCENE = "general"
+
+
+class CompiledRoutes:
+    """一次编译好的模板与关键词匹配器，创建后不再修改，便于整体替换"""
+
+    def __init__(self, templates, routes, default=DEFAULT_SCENE):
+        if default not in templates:
+            raise ValueError(f"默认场景没有对应的模板: {default}")
+        self.templates = templates
+        self.default = default
+        # 关键词 -> (优先级, 场景)
+        self.keywords = {}
+        for priority, (scene, keywords) in enumerate(routes):
+            if scene not in templates:
+                raise ValueError(f"场景没有对应的模板: {scene}")
+            for keyword in keywords:
+                self.keywords.setdefault(keyword.lower(), (priority, scene))
+
+        # 长词优先，避免短同义词抢先匹配
+        alternatives = sorted(self.keywords, key=len, reverse=True)
+        self.pattern = (
+            re.compile("|".join(re.escape(k) for k in alternatives), re.IGNORECASE)
+            if alternatives
+            else None
+        )
+
+    def route(self, text):
+        if self.pattern is None:
+            return self.default
+        best = None
+        for match in self.pattern.finditer(text):
+            hit = self.keywords[match.group(0).lower()]
+            if best is None or hit < best:
+                best = hit
+                # 已命中最高优先级的场景，无需继续扫描
+                if hit[0] == 0:
+                    break
+        return best[1] if best else self.default
+
+
+def load_routes(path):
+    """从JSON配置加载模板与路由规则
+
+    格式：{"templates": {场景: 提示词}, "routes": [{"scene": 场景, "keywords": [...]}], "default": "general"}
+    配置中未出现的内置模板仍然保留；给出routes时替换内置的路由规则。
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+
+    templates = dict(PROMPT_TEMPLATES)
+    for scene, content in config.get("templates", {}).items():
+        if isinstance(content, str):
+            content = {"role": "system", "content": content}
+        templates[scene] = content
+
+    routes = [(route["scene"], route["keywords"]) for route in config.get("routes", [])]
+    return CompiledRoutes(templates, routes or SCENE_KEYWORDS, config.get("default", DEFAULT_SCENE))
+
+
+class PromptRouter:
+    """提示词路由：编译好的规则、可选的配置热加载与命中统计"""
+
+    def __init__(self, config_path=None, reload_interval=5.0):
+        self.config_path = config_path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked = 0.0
+        self.hits = Counter()
+        self.route_seconds = 0.0
+        self.reloads = 0
+        self.routes = CompiledRoutes(PROMPT_TEMPLATES, SCENE_KEYWORDS)
+        if config_path:
+            self.reload()
+
+    def reload(self):
+        """重新加载配置；配置无效时保留当前规则"""
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self.config_path)
+                routes = load_routes(self.config_path)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                log.warning(f"Failed to load prompt routes from {self.config_path}: {e}")
+                return False
+            self.routes = routes
+            self._mtime = mtime
+            self.reloads += 1
+            log.info(f"Loaded prompt routes from {self.config_path}")
+            return True
+
+    def _maybe_reload(self):
+        # 每隔reload_interval秒才检查一次文件修改时间
+        now = time.monotonic()
+        if not self.config_path or now - self._checked < self.reload_interval:
+            return
+        self._checked = now
+        try:
+            mtime = os.path.getmtime(self.config_path)
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.reload()
+
+    def route(self, text):
+        return self.route_first([text])
+
+    def route_first(self, texts):
+        """按顺序路由多段文本，返回第一个非默认场景；整段对话只计一次命中"""
+        self._maybe_reload()
+        start = time.perf_counter()
+        routes = self.routes
+        scene = routes.default
+        for text in texts:
+            scene = routes.route(text if isinstance(text, str) else str(text))
+            if scene != routes.default:
+                break
+        self.route_seconds += time.perf_counter() - start
+        self.hits[scene] += 1
+        return scene
+
+    def template(self, scene):
+        """场景对应的系统提示词消息（副本），场景不存在时使用默认场景"""
+        routes = self.routes
+        return dict(routes.templates.get(scene) or routes.templates[routes.default])
+
+    def select(self, text):
+        """返回(场景, 系统提示词消息副本)"""
+        routes = self.routes
+        scene = self.route(text)
+        if scene not in routes.templates:
+            scene = routes.default
+        return scene, dict(routes.templates[scene])
+
+    def prompt(self, text):
+        """返回匹配场景的系统提示词消息（副本）"""
+        return self.select(text)[1]
+
+    def metrics(self):
+        total = sum(self.hits.values())
+        return {
+            "total": total,
+            "hits": dict(self.hits),
+            "hit_rate": {scene: round(count / total, 4) for scene, count in self.hits.items()} if total else {},
+            "mean_route_us": round(self.route_seconds / total * 1e6, 2) if total else None,
+            "scenes": sorted(self.routes.templates),
+            "keywords": len(self.routes.keywords),
+            "config_path": self.config_path,
+            "reloads": self.reloads,
+        }
@@ -0,0 +1,722 @@
+"""道路巡检批量接口
+
+一次提交整段路线的图片（图片列表、上传的归档或行车记录仪视频），按缺陷类别并发送入巡检模型，
+逐张以NDJSON或SSE流式返回结果。不创建对话记录，最后一行返回整体吞吐统计。
+"""
+
+import asyncio
+import base64
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from typing import Optional
+
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Request, UploadFile
+from pydantic import BaseModel
+from starlette.background import BackgroundTask
+from starlette.responses import JSONResponse, StreamingResponse
+
+from open_webui.utils.auth import get_verified_user
+from open_webui.utils.chat import generate_chat_completion
+from open_webui.utils.models import check_model_access, get_all_models
+from open_webui.env import BYPASS_MODEL_ACCESS_CONTROL
+
+from auto_label import ARCHIVE_EXTENSIONS, NOT_FOUND_MARK, data_uri, iter_images
+from chat_images import decode_data_uri
+from defect_report import COMBINED_SCENE, parse_defects, repair_message
+from preclassifier import clean_answer
+from road_prompts import SCENE_LABELS
+from tiling import TILE_OVERLAP, TILE_SIZE, make_tiles, merge_defects, to_image_bbox
+from video_inspection import VIDEO_EXTENSIONS, KeyframeExtractor
+
+log = logging.getLogger(__name__)
+
+MAX_BATCH_IMAGES = int(os.environ.get("INSPECTION_MAX_BATCH_IMAGES", "2000"))
+MAX_BATCH_CONCURRENCY = int(os.environ.get("INSPECTION_MAX_CONCURRENCY", "16"))
+# 上传的归档或视频的大小上限
+MAX_UPLOAD_MB = int(os.environ.get("INSPECTION_MAX_UPLOAD_MB", "1024"))
+# 接受文件上传的接口，相对路由前缀
+UPLOAD_PATHS = ("/batch/upload", "/video")
+
+
+class BatchRequest(BaseModel):
+    model: str
+    # 缺陷类别，all为一次调用检查所有类别的综合模式
+    category: str = "pao"
+    # data URI或模型服务可直接访问的图片URL
+    images: list[str]
+    names: Optional[list[str]] = None
+    concurrency: int = 4
+    retries: int = 2
+    format: str = "ndjson"
+    # 综合模式下同时按单类别提示词各调用一次，对比调用次数与延迟
+    compare: bool = False
+    json_mode: bool = True
+    # 综合模式下把大图切块分别分析，compare为True时与整图单次调用对比
+    tile: bool = False
+    tile_size: int = TILE_SIZE
+    tile_overlap: float = TILE_OVERLAP
+
+    def check(self):
+        """校验批量请求，无效时抛出ValueError"""
+        if self.category not in SCENE_LABELS and self.category != COMBINED_SCENE:
+            raise ValueError(f"未知的缺陷类别: {self.category}")
+        if not self.images:
+            raise ValueError("需要提供图片")
+        if len(self.images) > MAX_BATCH_IMAGES:
+            raise ValueError(f"单批最多{MAX_BATCH_IMAGES}张图片")
+        if self.names is not None and len(self.names) != len(self.images):
+            raise ValueError("图片名称与图片数量不一致")
+        if not 1 <= self.concurrency <= MAX_BATCH_CONCURRENCY:
+            raise ValueError(f"并发数需在1到{MAX_BATCH_CONCURRENCY}之间")
+        if not 0 <= self.retries <= 5:
+            raise ValueError("重试次数需在0到5之间")
+        if self.format not in ("ndjson", "sse"):
+            raise ValueError("不支持的输出格式")
+        if self.compare and self.category != COMBINED_SCENE:
+            raise ValueError("对比模式需要使用综合类别all")
+        if self.tile:
+            if self.category != COMBINED_SCENE:
+                raise ValueError("分块分析需要使用综合类别all")
+            if not 256 <= self.tile_size <= 4096:
+                raise ValueError("分块尺寸需在256到4096之间")
+            if not 0 <= self.tile_overlap <= 0.5:
+                raise ValueError("分块重叠比例需在0到0.5之间")
+
+
+def is_retryable(e):
+    status_code = getattr(e, "status_code", None)
+    if status_code is not None:
+        return status_code == 429 or status_code >= 500
+    # 连接错误、超时等没有状态码的异常
+    return isinstance(e, (OSError, asyncio.TimeoutError))
+
+
+def answer_text(response):
+    if isinstance(response, dict):
+        return response["choices"][0]["message"]["content"]
+    raise ValueError("模型返回了非预期的响应")
+
+
+# 各模式发送的用户问题；单类别问题中带有场景关键词，与对话接口的路由一致
+QUESTIONS = {scene: f"请识别图片中的{label}" for scene, label in SCENE_LABELS.items()}
+QUESTIONS[COMBINED_SCENE] = "请对图片进行综合巡检，检查抛洒物、标志线损坏和坑槽，按格式输出JSON"
+
+
+class BatchInspection:
+    """一批图片的并发巡检，结果按完成顺序产出
+
+    category为all时使用综合提示词，一次调用返回所有类别的结构化结果；
+    compare为True时每张图片同时按三个单类别提示词各调用一次，用于对比调用次数与延迟。
+    """
+
+    def __init__(
+        self,
+        request,
+        user,
+        model_id,
+        category,
+        concurrency=4,
+        retries=2,
+        compare=False,
+        json_mode=True,
+        tile_size=None,
+        tile_overlap=TILE_OVERLAP,
+    ):
+        self.request = request
+        self.user = user
+        self.model_id = model_id
+        self.category = category
+        self.concurrency = concurrency
+        self.retries = retries
+        self.compare = compare
+        self.json_mode = json_mode
+        # 设置后按该尺寸分块分析
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        # 分块后单张图片会并发多个请求，模型调用总数仍受concurrency限制
+        self._slots = asyncio.Semaphore(concurrency)
+        state = request.app.state
+        self.prompt_router = state.PROMPT_ROUTER
+        self.preprocessor = state.CHAT_IMAGE_PREPROCESSOR
+        self.cache = state.INSPECTION_CACHE
+        self.preclassifier = state.PRECLASSIFIER
+        self.admission = state.ADMISSION
+
+        self.images = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.cached = 0
+        self.found = 0
+        self.retried = 0
+        self.calls = 0
+        self.invalid_json = 0
+        self.preclassified = 0
+        self.model_seconds = 0.0
+        self.bytes_saved = 0
+        self.input_error = None
+        # 输入来源的统计（如视频解码与抽帧），返回dict的可调用对象
+        self.source_stats = None
+        # 对比模式：模式 -> [图片数, 调用次数, 耗时]，以及结论一致的图片数
+        self.comparison = {}
+        self.agreed = 0
+        self.tiles = 0
+        self.skipped_tiles = 0
+
+    def build_messages(self, category, image_url):
+        templates = self.prompt_router.routes.templates
+        return [
+            dict(templates[category]),
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": QUESTIONS[category]},
+                    {"type": "image_url", "image_url": {"url": image_url}},
+                ],
+            },
+        ]
+
+    async def ask(self, messages, json_mode=False):
+        form_data = {"model": self.model_id, "messages": messages, "stream": False}
+        if json_mode:
+            form_data["response_format"] = {"type": "json_object"}
+        attempt = 0
+        while True:
+            self.calls += 1
+            start = time.monotonic()
+            try:
+                # 与对话请求共用模型槽位，以批量优先级排队
+                async with self._slots, self.admission.slot(self.model_id, self.user.id, "batch"):
+                    # 直接调用模型，不经过对话接口的消息持久化
+                    response = await generate_chat_completion(self.request, form_data, self.user)
+            except Exception as e:
+                self.model_seconds += time.monotonic() - start
+                attempt += 1
+                if attempt > self.retries or not is_retryable(e):
+                    raise
+                self.retried += 1
+                # 排队已满时按准入控制给出的时间重试
+                delay = getattr(e, "retry_after", None) or min(2 ** attempt, 30) + random.random()
+                await asyncio.sleep(delay)
+                continue
+            self.model_seconds += time.monotonic() - start
+            # 因长度截断的回答照常使用，但不写入缓存
+            return answer_text(response), attempt + 1, response["choices"][0].get("finish_reason") == "stop"
+
+    async def analyze(self, category, image_url, use_cache=True):
+        """按一个提示词分析图片，返回结果与调用次数"""
+        start = time.monotonic()
+        messages = self.build_messages(category, image_url)
+        json_mode = self.json_mode and category == COMBINED_SCENE
+        cache_key = (
+            await self.cache.make_key(
+                self.model_id,
+                category,
+                QUESTIONS[category],
+                messages,
+                {"response_format": {"type": "json_object"}} if json_mode else None,
+            )
+            if use_cache
+            else None
+        )
+        answer = await self.cache.get(cache_key) if cache_key else None
+        result = {"calls": 0}
+        complete = True
+        if answer is not None:
+            result["cached"] = True
+        elif use_cache and self.preclassifier and await self.preclassifier.check([image_url]):
+            # 预分类确信无缺陷，不调用视觉模型；对比模式下不使用
+            answer = clean_answer(category)
+            result["preclassified"] = True
+            self.preclassified += 1
+        else:
+            answer, result["calls"], complete = await self.ask(messages, json_mode)
+
+        if category == COMBINED_SCENE:
+            try:
+                defects = parse_defects(answer)
+            except ValueError as e:
+                # 纠正一次：带上原输出和错误原因重新请求
+                self.invalid_json += 1
+                messages += [{"role": "assistant", "content": answer}, repair_message(e)]
+                answer, calls, complete = await self.ask(messages, self.json_mode)
+                result["calls"] += calls
+                defects = parse_defects(answer)
+            result.update({"found": bool(defects), "defects": defects})
+        else:
+            result.update({"found": NOT_FOUND_MARK not in answer, "answer": answer.strip()})
+
+        if cache_key and complete and not result.get("cached") and not result.get("preclassified"):
+            await self.cache.put(cache_key, answer)
+        result["elapsed_ms"] = round((time.monotonic() - start) * 1000, 1)
+        return result
+
+    def record_comparison(self, mode, baseline, calls, seconds, agree):
+        for name, mode_calls, mode_seconds in (
+            (mode, calls[0], seconds[0]),
+            (baseline, calls[1], seconds[1]),
+        ):
+            totals = self.comparison.setdefault(name, [0, 0, 0.0])
+            totals[0] += 1
+            totals[1] += mode_calls
+            totals[2] += mode_seconds
+        self.agreed += agree
+
+    async def compare_separate(self, image_url, combined):
+        """对同一张图片按三个单类别提示词各调用一次，记录调用次数、延迟与结论是否一致"""
+        start = time.monotonic()
+        scenes = list(SCENE_LABELS)
+        results = await asyncio.gather(*(self.analyze(scene, image_url, use_cache=False) for scene in scenes))
+        elapsed = time.monotonic() - start
+        found = {SCENE_LABELS[scene] for scene, result in zip(scenes, results) if result["found"]}
+        agree = found == {defect["type"] for defect in combined["defects"]}
+        calls = sum(result["calls"] for result in results)
+
+        self.record_comparison(
+            "combined", "separate", (combined["calls"], calls), (combined["elapsed_ms"] / 1000, elapsed), agree
+        )
+        return {
+            "separate": {"calls": calls, "elapsed_ms": round(elapsed * 1000, 1), "found": sorted(found)},
+            "agree": agree,
+        }
+
+    async def analyze_tiled(self, image_url):
+        """切块并发分析，结果换算到整图坐标后合并"""
+        start = time.monotonic()
+        if not image_url.startswith("data:image/"):
+            raise ValueError("分块分析只支持内联图片")
+        size, tiles, skipped = await asyncio.to_thread(
+            make_tiles, decode_data_uri(image_url), self.tile_size, self.tile_overlap
+        )
+        self.tiles += len(tiles)
+        self.skipped_tiles += skipped
+
+        # 预分类模型和缓存都按整幅画面建立，块图不使用，避免局部画面被误判或与整图回答互相命中
+        results = await asyncio.gather(
+            *(
+                self.analyze(
+                    COMBINED_SCENE, f"data:image/jpeg;base64,{base64.b64encode(data).decode()}", use_cache=False
+                )
+                for _, data in tiles
+            )
+        )
+        defects = []
+        for tile_index, ((box, _), result) in enumerate(zip(tiles, results)):
+            for defect in result["defects"]:
+                defect["bbox"] = to_image_bbox(box, defect.get("bbox"), size)
+                # 块内看不到整条道路，模型给出的车道不可靠；位置由merge_defects按整图坐标重新生成
+                defect["lane"] = "未知"
+                defect["tiles"] = [tile_index]
+                defects.append(defect)
+        defects = merge_defects(defects)
+        return {
+            "calls": sum(result["calls"] for result in results),
+            "found": bool(defects),
+            "defects": defects,
+            "tiles": [list(box) for box, _ in tiles],
+            "skipped_tiles": skipped,
+            "elapsed_ms": round((time.monotonic() - start) * 1000, 1),
+        }
+
+    async def compare_full(self, image_url, tiled):
+        """与整图单次调用对比延迟与发现的缺陷数"""
+        messages = self.build_messages(COMBINED_SCENE, image_url)
+        await self.preprocessor.process(messages, self.model_id)
+        full = await self.analyze(COMBINED_SCENE, messages[1]["content"][1]["image_url"]["url"], use_cache=False)
+        agree = {d["type"] for d in full["defects"]} == {d["type"] for d in tiled["defects"]}
+        self.record_comparison(
+            "tiled",
+            "full_image",
+            (tiled["calls"], full["calls"]),
+            (tiled["elapsed_ms"] / 1000, full["elapsed_ms"] / 1000),
+            agree,
+        )
+        return {
+            "full_image": {
+                "calls": full["calls"],
+                "elapsed_ms": full["elapsed_ms"],
+                "defects": len(full["defects"]),
+            },
+            "agree": agree,
+        }
+
+    async def inspect(self, index, name, image_url, meta=None):
+        start = time.monotonic()
+        result = {"index": index, "image": name, "category": self.category, **(meta or {})}
+        try:
+            if self.tile_size:
+                # 分块使用原图，各块自身不超过分块尺寸，无需再缩放
+                analysis = await self.analyze_tiled(image_url)
+                if self.compare:
+                    result["comparison"] = await self.compare_full(image_url, analysis)
+                self.succeeded += 1
+                self.found += analysis["found"]
+                result.update(analysis)
+                result["elapsed_ms"] = round((time.monotonic() - start) * 1000, 1)
+                return result
+
+            # 图片只缩放一次，各提示词共用
+            messages = self.build_messages(self.category, image_url)
+            report = await self.preprocessor.process(messages, self.model_id)
+            if report:
+                self.bytes_saved += report["bytes_saved"]
+            image_url = messages[1]["content"][1]["image_url"]["url"]
+
+            comparing = self.compare and self.category == COMBINED_SCENE
+            analysis = await self.analyze(self.category, image_url, use_cache=not comparing)
+            if comparing:
+                result["comparison"] = await self.compare_separate(image_url, analysis)
+            if analysis.get("cached"):
+                self.cached += 1
+            self.succeeded += 1
+            self.found += analysis["found"]
+            result.update(analysis)
+        except Exception as e:
+            self.failed += 1
+            result["error"] = str(getattr(e, "detail", None) or e) or type(e).__name__
+        result["elapsed_ms"] = round((time.monotonic() - start) * 1000, 1)
+        return result
+
+    async def run(self, inputs):
+        """inputs为产出(名称, 图片URL, 附加信息)的异步迭代器；按完成顺序产出每张图片的结果"""
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        results = asyncio.Queue()
+
+        async def produce():
+            index = 0
+            try:
+                async for name, image_url, meta in inputs:
+                    await queue.put((index, name, image_url, meta))
+                    index += 1
+            except Exception as e:
+                # 归档损坏等输入错误：已读取的图片照常完成，错误写入统计
+                log.warning(f"Failed to read batch inspection input: {e}")
+                self.input_error = str(e)
+            finally:
+                await inputs.aclose()
+            for _ in range(self.concurrency):
+                await queue.put(None)
+
+        async def work():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                self.images += 1
+                await results.put(await self.inspect(*item))
+            await results.put(None)
+
+        started = time.monotonic()
+        tasks = [asyncio.create_task(produce())]
+        tasks += [asyncio.create_task(work()) for _ in range(self.concurrency)]
+        try:
+            finished = 0
+            while finished < self.concurrency:
+                result = await results.get()
+                if result is None:
+                    finished += 1
+                    continue
+                yield result
+        finally:
+            # 客户端断开时停止剩余请求
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        yield {"summary": self.stats(time.monotonic() - started)}
+
+    def stats(self, elapsed):
+        stats = {
+            "model": self.model_id,
+            "category": self.category,
+            "images": self.images,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "found": self.found,
+            "cached": self.cached,
+            "retried": self.retried,
+            "model_calls": self.calls,
+            "calls_per_image": round(self.calls / self.images, 2) if self.images else None,
+            "invalid_json": self.invalid_json,
+            # 预分类直接给出结论、省下的模型调用
+            "preclassified": self.preclassified,
+            "bytes_saved": self.bytes_saved,
+            "elapsed_s": round(elapsed, 2),
+            "images_per_min": round(self.images / elapsed * 60, 2) if elapsed else None,
+            "mean_model_s": round(self.model_seconds / self.calls, 2) if self.calls else None,
+            "error": self.input_error,
+        }
+        if self.source_stats is not None:
+            stats["source"] = self.source_stats()
+        if self.tile_size:
+            stats["tiles"] = self.tiles
+            stats["skipped_tiles"] = self.skipped_tiles
+        if self.comparison:
+            stats["comparison"] = {
+                mode: {
+                    "calls_per_image": round(calls / images, 2),
+                    "mean_latency_ms": round(seconds / images * 1000, 1),
+                }
+                for mode, (images, calls, seconds) in self.comparison.items()
+            }
+            compared = next(iter(self.comparison.values()))[0]
+            stats["comparison"]["agreement"] = round(self.agreed / compared, 4)
+        return stats
+
+
+async def prepare(request, user, model_id):
+    """与对话接口一致的模型存在性与访问权限检查"""
+    if not request.app.state.MODELS:
+        await get_all_models(request, user=user)
+    model = request.app.state.MODELS.get(model_id)
+    if model is None:
+        raise HTTPException(status_code=404, detail="模型不存在")
+    if not BYPASS_MODEL_ACCESS_CONTROL and user.role == "user":
+        try:
+            check_model_access(user, model)
+        except Exception:
+            raise HTTPException(status_code=403, detail="没有该模型的访问权限")
+
+
+def stream(results, fmt, upload_path=None):
+    """流式输出结果；upload_path为本次上传的临时文件，输出结束、出错或客户端断开后删除"""
+
+    async def body():
+        try:
+            async for result in results:
+                line = json.dumps(result, ensure_ascii=False)
+                yield f"data: {line}\n\n" if fmt == "sse" else line + "\n"
+        finally:
+            if upload_path:
+                remove_upload(upload_path)
+
+    media_type = "text/event-stream" if fmt == "sse" else "application/x-ndjson"
+    # 响应体未开始迭代客户端就断开时，由后台任务兜底删除
+    background = BackgroundTask(remove_upload, upload_path) if upload_path else None
+    return StreamingResponse(body(), media_type=media_type, background=background)
+
+
+def upload_rejection(request):
+    """上传接口的请求体在进入接口前就会被完整解析，需在中间件中按Content-Length提前拒绝；可接受时返回None"""
+    length = request.headers.get("content-length")
+    if length is None or not length.isdigit():
+        return JSONResponse(status_code=411, content={"detail": "上传需要提供Content-Length"})
+    if int(length) > MAX_UPLOAD_MB * 1024 * 1024:
+        return JSONResponse(status_code=413, content={"detail": f"上传文件不能超过{MAX_UPLOAD_MB}MB"})
+    return None
+
+
+def remove_upload(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def copy_limited(src, dst, limit):
+    copied = 0
+    while True:
+        chunk = src.read(1024 * 1024)
+        if not chunk:
+            return
+        copied += len(chunk)
+        if copied > limit:
+            raise HTTPException(status_code=413, detail=f"上传文件不能超过{MAX_UPLOAD_MB}MB")
+        dst.write(chunk)
+
+
+async def save_upload(file, suffix):
+    """上传内容写入临时文件，返回路径；超过大小上限时删除临时文件并返回413"""
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            await asyncio.to_thread(copy_limited, file.file, f, MAX_UPLOAD_MB * 1024 * 1024)
+    except BaseException:
+        remove_upload(path)
+        raise
+    return path
+
+
+async def iter_in_thread(iterate, maxsize=8):
+    """在线程中运行同步迭代，逐项交给事件循环；提前结束时读取线程随之退出"""
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=maxsize)
+    done = object()
+    stopped = threading.Event()
+
+    def read():
+        items = iterate()
+        try:
+            for item in items:
+                if stopped.is_set():
+                    break
+                asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+        finally:
+            # 及时关闭生成器，释放其持有的文件或解码器
+            items.close()
+            asyncio.run_coroutine_threadsafe(queue.put(done), loop).result()
+
+    reader = loop.run_in_executor(None, read)
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            yield item
+        # 读取线程中的异常在这里抛出
+        await reader
+    finally:
+        # 清空队列，避免读取线程阻塞在put上
+        stopped.set()
+        while not queue.empty():
+            queue.get_nowait()
+
+
+router = APIRouter()
+
+
+@router.post("/batch")
+async def inspect_batch(request: Request, form_data: BatchRequest, user=Depends(get_verified_user)):
+    try:
+        form_data.check()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await prepare(request, user, form_data.model)
+
+    names = form_data.names or [str(i) for i in range(len(form_data.images))]
+
+    async def inputs():
+        for name, image in zip(names, form_data.images):
+            yield name, image, None
+
+    batch = BatchInspection(
+        request,
+        user,
+        form_data.model,
+        form_data.category,
+        form_data.concurrency,
+        form_data.retries,
+        form_data.compare,
+        form_data.json_mode,
+        form_data.tile_size if form_data.tile else None,
+        form_data.tile_overlap,
+    )
+    return stream(batch.run(inputs()), form_data.format)
+
+
+@router.post("/batch/upload")
+async def inspect_archive(
+    request: Request,
+    file: UploadFile = File(...),
+    model: str = Form(...),
+    category: str = Form("pao"),
+    concurrency: int = Form(4),
+    retries: int = Form(2),
+    format: str = Form("ndjson"),
+    compare: bool = Form(False),
+    json_mode: bool = Form(True),
+    tile: bool = Form(False),
+    tile_size: int = Form(TILE_SIZE),
+    tile_overlap: float = Form(TILE_OVERLAP),
+    user=Depends(get_verified_user),
+):
+    filename = file.filename or ""
+    ext = next((ext for ext in ARCHIVE_EXTENSIONS if filename.lower().endswith(ext)), None)
+    if ext is None:
+        raise HTTPException(status_code=400, detail="仅支持tar或zip归档")
+    try:
+        # 图片列表在归档中，这里用占位项通过其余参数的校验
+        BatchRequest(
+            model=model, category=category, images=[""], concurrency=concurrency,
+            retries=retries, format=format, compare=compare, json_mode=json_mode,
+            tile=tile, tile_size=tile_size, tile_overlap=tile_overlap,
+        ).check()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await prepare(request, user, model)
+
+    # 归档写入临时文件后在线程中逐个读取，不整体解压
+    path = await save_upload(file, ext)
+
+    def read_archive():
+        for count, (name, data) in enumerate(iter_images(path)):
+            if count >= MAX_BATCH_IMAGES:
+                break
+            yield name, data_uri(name, data), None
+
+    async def inputs():
+        async for item in iter_in_thread(read_archive, concurrency * 2):
+            yield item
+
+    batch = BatchInspection(
+        request,
+        user,
+        model,
+        category,
+        concurrency,
+        retries,
+        compare,
+        json_mode,
+        tile_size if tile else None,
+        tile_overlap,
+    )
+    return stream(batch.run(inputs()), format, path)
+
+
+@router.post("/video")
+async def inspect_video(
+    request: Request,
+    file: UploadFile = File(...),
+    model: str = Form(...),
+    # 视频默认使用综合模式，每个关键帧只调用一次模型
+    category: str = Form(COMBINED_SCENE),
+    concurrency: int = Form(4),
+    retries: int = Form(2),
+    format: str = Form("ndjson"),
+    json_mode: bool = Form(True),
+    interval: float = Form(1.0),
+    min_interval: float = Form(0.25),
+    max_interval: float = Form(5.0),
+    distance: int = Form(8),
+    max_keyframes: int = Form(MAX_BATCH_IMAGES),
+    user=Depends(get_verified_user),
+):
+    filename = file.filename or ""
+    ext = next((ext for ext in VIDEO_EXTENSIONS if filename.lower().endswith(ext)), None)
+    if ext is None:
+        raise HTTPException(status_code=400, detail="不支持的视频格式")
+    try:
+        BatchRequest(
+            model=model, category=category, images=[""], concurrency=concurrency,
+            retries=retries, format=format, json_mode=json_mode,
+        ).check()
+        extractor = KeyframeExtractor(
+            interval=interval,
+            min_interval=min_interval,
+            max_interval=max_interval,
+            distance=distance,
+            max_side=request.app.state.CHAT_IMAGE_PREPROCESSOR.max_side_for(model) or 1536,
+            max_keyframes=min(max_keyframes, MAX_BATCH_IMAGES),
+        )
+    except (ValueError, RuntimeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await prepare(request, user, model)
+
+    path = await save_upload(file, ext)
+
+    def read_keyframes():
+        for keyframe in extractor.extract(path):
+            url = f"data:image/jpeg;base64,{base64.b64encode(keyframe.data).decode()}"
+            yield f"{keyframe.timestamp:.2f}s", url, keyframe.describe()
+
+    async def inputs():
+        # 解码在线程中进行，队列有界，解码速度不会超过巡检速度太多
+        async for item in iter_in_thread(read_keyframes, concurrency * 2):
+            yield item
+
+    batch = BatchInspection(request, user, model, category, concurrency, retries, json_mode=json_mode)
+    batch.source_stats = extractor.stats
+    return stream(batch.run(inputs()), format, path)
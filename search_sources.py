@@ -0,0 +1,144 @@
+import json
+import time
+from abc import ABC, abstractmethod
+from urllib.parse import quote_plus
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.common.action_chains import ActionChains
+from selenium.common.exceptions import StaleElementReferenceException, TimeoutException
+
+
+class SearchSource(ABC):
+    """图片搜索来源适配器：搜索、收集结果、提取大图地址"""
+
+    name = None
+    result_selector = None
+    preview_selector = None
+
+    @abstractmethod
+    def search(self, browser, query):
+        """打开搜索页并提交关键词"""
+
+    def harvest(self, browser, min_count, max_scroll_attempts=20):
+        """滚动页面，直到结果数量超过min_count，返回结果元素列表"""
+        scroll_attempt = 0
+        while True:
+            results = browser.find_elements(By.CSS_SELECTOR, self.result_selector)
+            if len(results) > min_count or scroll_attempt >= max_scroll_attempts:
+                return results
+            browser.execute_script("window.scrollBy(0, 2000)")
+            time.sleep(1.5)
+            scroll_attempt += 1
+
+    @abstractmethod
+    def extract_url(self, browser, result):
+        """返回结果对应的大图地址，失败时返回None"""
+
+    def thumbnail_src(self, result):
+        """缩略图地址，供增量模式计算pHash"""
+        return result.get_attribute("src")
+
+    def is_too_small(self, result):
+        width = result.get_attribute("width")
+        height = result.get_attribute("height")
+        return not width or not height or int(width) <= 50 or int(height) <= 50
+
+
+class GoogleImagesSource(SearchSource):
+    """Google图片：点击缩略图后从预览面板读取大图地址"""
+
+    name = "google"
+    result_selector = "img.YQ4gaf"
+    preview_selector = "img[jsname='kn3ccd']"
+
+    def __init__(self, search_url="https://www.google.com/imghp", preview_timeout=3, retries=3):
+        self.search_url = search_url
+        self.preview_timeout = preview_timeout
+        self.retries = retries
+
+    def search(self, browser, query):
+        browser.get(self.search_url)
+        search_box = WebDriverWait(browser, 15).until(
+            EC.presence_of_element_located((By.NAME, "q"))
+        )
+        search_box.send_keys(query)
+        search_box.submit()
+        time.sleep(2)
+        WebDriverWait(browser, 10).until(
+            EC.presence_of_all_elements_located((By.CSS_SELECTOR, self.result_selector))
+        )
+
+    def extract_url(self, browser, result):
+        retries = self.retries
+        while retries > 0:
+            try:
+                ActionChains(browser).move_to_element(result).click().perform()
+                time.sleep(1)
+
+                high_res_img = WebDriverWait(browser, self.preview_timeout).until(
+                    EC.presence_of_element_located((By.CSS_SELECTOR, self.preview_selector))
+                )
+                return high_res_img.get_attribute("src")
+
+            except StaleElementReferenceException:
+                retries -= 1
+                if retries == 0:
+                    print("达到最大重试次数")
+                time.sleep(1)
+            except TimeoutException:
+                return None
+        return None
+
+
+class BingImagesSource(SearchSource):
+    """Bing图片：结果链接的m属性中直接带有原图地址，无需点击"""
+
+    name = "bing"
+    result_selector = "a.iusc"
+    # 直接读取结果链接中的原图地址，不打开详情面板，没有需要清理的预览图
+    preview_selector = None
+
+    def __init__(self, search_url="https://www.bing.com/images/search"):
+        self.search_url = search_url
+
+    def search(self, browser, query):
+        browser.get(f"{self.search_url}?q={quote_plus(query)}")
+        WebDriverWait(browser, 15).until(
+            EC.presence_of_all_elements_located((By.CSS_SELECTOR, self.result_selector))
+        )
+
+    def extract_url(self, browser, result):
+        try:
+            return json.loads(result.get_attribute("m") or "{}").get("murl")
+        except (ValueError, StaleElementReferenceException):
+            return None
+
+    def thumbnail_src(self, result):
+        try:
+            thumb = json.loads(result.get_attribute("m") or "{}").get("turl")
+        except ValueError:
+            thumb = None
+        return thumb
+
+    def is_too_small(self, result):
+        return False
+
+
+SOURCES = {
+    GoogleImagesSource.name: GoogleImagesSource,
+    BingImagesSource.name: BingImagesSource,
+}
+
+
+def make_sources(names, **options):
+    """按名称创建适配器，options按来源名称传入构造参数，例如google={"search_url": ...}"""
+    unknown = [name for name in names if name not in SOURCES]
+    if unknown:
+        raise ValueError(f"未知的搜索来源: {', '.join(unknown)}")
+    # 浏览器、提前结束与维护状态都按来源名称区分，同名来源会互相覆盖
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"重复的搜索来源: {', '.join(duplicates)}")
+    return [SOURCES[name](**options.get(name, {})) for name in names]
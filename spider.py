@@ -1,28 +1,65 @@
 from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.action_chains import ActionChains
-from selenium.common.exceptions import StaleElementReferenceException, TimeoutException
 import time
 import requests
 import os
 import base64
+import binascii
+import functools
 import hashlib
 from PIL import Image
 import io
 import numpy as np
 import threading
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future, ThreadPoolExecutor
 import imagehash
 import json
 
+from hash_store import CompactHashSet
+from content_index import get_content_index
+from crawl_concurrency import AIMDController
+from image_quality import QualityGate, make_preview
+from image_normalize import ImageNormalizer
+from crawl_incremental import EarlyStop, KnownResults, thumbnail_phash
+from browser_maintenance import BrowserMaintainer
+from search_sources import GoogleImagesSource
+from crawl_profiling import CrawlProfiler
+
 CHECKPOINT_FILE = "./temp/crawl_checkpoint.json"
+SEARCH_URL = "https://www.google.com/imghp"
+CHROME_ARGUMENTS = ["--disable-infobars", "--disable-dev-shm-usage"]
 processed_hashes = None
+rejected_hashes = None
 image_lock = threading.Lock()
 checkpoint = None
 hash_lock = threading.Lock()
 phash_set = set()
+concurrency = None
+quality_gate = None
+normalizer = None
+profiler = CrawlProfiler()
+
+# 下载并发上下限，实际并发由AIMD控制器动态调整
+MIN_DOWNLOAD_WORKERS = 2
+MAX_DOWNLOAD_WORKERS = 16
+
+# 保存前的质量过滤阈值
+QUALITY_THRESHOLDS = {
+    "min_sharpness": 30.0,
+    "min_side": 200,
+    "max_aspect": 3.5,
+    "min_entropy": 3.0,
+    "min_contrast": 8.0,
+}
+
+# 可选的转码归一化，设为None时按原始数据保存
+# 例如 {"max_side": 2048, "fmt": "JPEG", "quality": 85, "workers": 2}
+NORMALIZE_OPTIONS = None
+
+# 增量模式下连续遇到多少个已知结果即停止
+INCREMENTAL_STOP_AFTER = 20
+
+# 长时间爬取的浏览器维护：每处理多少张清理一次DOM，浏览器进程内存超过多少MB重启会话
+BROWSER_MAINTENANCE = {"prune_every": 50, "memory_limit_mb": 2048}
 
 def load_checkpoint():
     """加载上次的爬取进度"""
@@ -30,20 +67,28 @@ def load_checkpoint():
         with open(CHECKPOINT_FILE, 'r') as f:
             data = json.load(f)
             return {
-                "processed_hashes": set(data["processed_hashes"]),
-                "last_index": data["last_index"]
+                "processed_hashes": CompactHashSet(data["processed_hashes"]),
+                # 质量不合格或无法解码的内容，之后不再下载与解码
+                "rejected_hashes": CompactHashSet(data.get("rejected_hashes", [])),
+                "last_index": data["last_index"],
+                # 旧检查点只有Google的last_index
+                "source_index": data.get("source_index", {"google": data["last_index"]})
             }
     return {
-        "processed_hashes": set(),
-        "last_index": 0
+        "processed_hashes": CompactHashSet(),
+        "rejected_hashes": CompactHashSet(),
+        "last_index": 0,
+        "source_index": {}
     }
 
 def save_checkpoint(checkpoint):
     """保存当前进度"""
-    with open(CHECKPOINT_FILE, 'w') as f:
+    with profiler.span("checkpoint"), open(CHECKPOINT_FILE, 'w') as f:
         json.dump({
             "processed_hashes": list(checkpoint["processed_hashes"]),
-            "last_index": checkpoint["last_index"]
+            "rejected_hashes": list(checkpoint["rejected_hashes"]),
+            "last_index": checkpoint["source_index"].get("google", checkpoint["last_index"]),
+            "source_index": checkpoint["source_index"]
         }, f)
 
 
@@ -68,9 +113,80 @@ def is_duplicate(img_pil):
         return False
 
 
-def download_image(savepath, img_url):
+def fetch_image(img_url, headers, timeout=15):
+    """下载图片，并把延迟、错误与限流情况反馈给并发控制器"""
+    with concurrency.slot(), profiler.span("fetch"):
+        start = time.monotonic()
+        try:
+            response = requests.get(img_url, headers=headers, timeout=timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            status = getattr(e.response, "status_code", None)
+            concurrency.record(time.monotonic() - start, ok=False, throttled=status in (429, 503))
+            raise
+        concurrency.record(time.monotonic() - start, nbytes=len(response.content))
+        return response.content
+
+
+def place_known_content(savepath, current_hash, img_url=None):
+    """内容已被其他任务保存时，直接链接到当前目录"""
+    content_index = get_content_index()
+    placed = content_index.place(current_hash, savepath)
+    if placed is None:
+        return False
+    content_index.record_url(img_url, current_hash)
+    with hash_lock:
+        processed_hashes.add(current_hash)
+        save_checkpoint(checkpoint)
+    print(f"复用已有内容: {placed}")
+    return True
+
+
+def reject_content(current_hash, img_url):
+    """记住被拒绝的内容；URL登记到全局索引，下次无需再下载"""
+    get_content_index().record_url(img_url, current_hash)
+    with hash_lock:
+        rejected_hashes.add(current_hash)
+        save_checkpoint(checkpoint)
+
+
+def mark_saved(current_hash, filename, img_url):
+    """文件写入完成后登记到全局索引并更新检查点"""
+    get_content_index().register(current_hash, filename, img_url)
+    with hash_lock:
+        processed_hashes.add(current_hash)
+        save_checkpoint(checkpoint)
+
+
+def download_image(savepath, img_url, on_stored=None):
+    """on_stored在内容确实已保存（或此前已有）后调用，失败或被拒绝时不调用"""
+    with profiler.span("download"):
+        stored = _download_image(savepath, img_url)
+    if on_stored is None or not stored:
+        return
+    if isinstance(stored, Future):
+        # 转码写入在后台完成，写入成功后再回调
+        stored.add_done_callback(lambda future: future.exception() is None and on_stored())
+    else:
+        on_stored()
+
+
+def _download_image(savepath, img_url):
+    """返回True表示内容已保存或此前已有，转码写入时返回其Future"""
     # 下载图片数据
     try:
+        # 全局索引中已知的URL无需再次下载
+        with profiler.span("index"):
+            known_hash = get_content_index().lookup_url(img_url)
+        if known_hash is not None:
+            with hash_lock:
+                if known_hash in processed_hashes:
+                    return True
+                if known_hash in rejected_hashes:
+                    return False
+            if place_known_content(savepath, known_hash):
+                return True
+
         headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
         }
@@ -84,9 +200,7 @@ def download_image(savepath, img_url):
                 return
         else:
             try:
-                response = requests.get(img_url, headers=headers, timeout=15)
-                response.raise_for_status()
-                img_data = response.content
+                img_data = fetch_image(img_url, headers)
             except Exception as e:
                 print(f"下载失败: {str(e)}")
                 return
@@ -101,131 +215,257 @@ def download_image(savepath, img_url):
         with hash_lock:
             if current_hash in processed_hashes:
                 print(f"重复哈希: {current_hash[:8]}...")
-                return
+                return True
+            if current_hash in rejected_hashes:
+                return False
 
+        if place_known_content(savepath, current_hash, img_url):
+            return True
 
         # 验证图片完整性
         try:
-            img_pil = Image.open(io.BytesIO(img_data))
-            img_pil.verify()
-            img_pil = Image.open(io.BytesIO(img_data))  # 重新打开
+            with profiler.span("decode"):
+                img_pil = Image.open(io.BytesIO(img_data))
+                img_pil.verify()
+                img_pil = Image.open(io.BytesIO(img_data))  # 重新打开
         except Exception as e:
             print(f"图片验证失败: {str(e)}")
+            reject_content(current_hash, img_url)
             return
 
+        # 解码一次缩小的灰度图，供相似性检查与质量评分共用
+        original_size = img_pil.size
+        with profiler.span("preview"):
+            preview = make_preview(img_pil)
+
         # 相似性检查
-        if is_duplicate(img_pil):
+        with profiler.span("phash"):
+            duplicate = is_duplicate(preview)
+        if duplicate:
             print(f"发现相似图片")
+            return True
+
+        # 质量检查
+        with profiler.span("quality"):
+            reason, scores = quality_gate.check(preview, original_size)
+        if reason is not None:
+            print(f"质量不合格({reason}): {scores}")
+            reject_content(current_hash, img_url)
             return
 
         # 保存图片
-        filename = f"{savepath}/{current_hash}.jpg"
-        with open(filename, "wb") as f:
-            f.write(img_data)
+        if normalizer is not None:
+            # 转码在独立线程池中完成，写入后再以原始MD5登记到全局索引并更新检查点
+            filename = f"{savepath}/{current_hash}"
+            stored = normalizer.submit(
+                img_data, savepath, current_hash,
+                on_saved=lambda path: mark_saved(current_hash, path, img_url),
+            )
+        else:
+            filename = f"{savepath}/{current_hash}.jpg"
+            with profiler.span("write"):
+                with open(filename, "wb") as f:
+                    f.write(img_data)
+            mark_saved(current_hash, filename, img_url)
+            stored = True
 
-        with hash_lock:
-            processed_hashes.add(current_hash)
-            checkpoint["processed_hashes"].add(current_hash)
-            save_checkpoint(checkpoint)
-        with image_lock:
-            phash_set.add(calculate_phash(img_pil))
+        with profiler.span("phash"), image_lock:
+            phash_set.add(calculate_phash(preview))
 
         print(f"成功保存: {filename}")
+        return stored
     except Exception as e:
         print(f"下载失败: {str(e)}")
+        return False
 
 
-def spider(savepath, search_word):
-
-    global processed_hashes, checkpoint
-
+def open_browser():
     options = webdriver.ChromeOptions()
-    options.add_argument("--disable-infobars")
-    options.add_argument("--disable-dev-shm-usage")
+    for argument in CHROME_ARGUMENTS:
+        options.add_argument(argument)
     browser = webdriver.Chrome(options=options)
     browser.set_window_size(1500, 1000)
-    browser.get("https://www.google.com/imghp")
+    return browser
+
+
+def crawl_source(source, savepath, search_word, executor, incremental, known_results, stop_after_known):
+    """在独立浏览器中爬取一个来源，下载任务提交到共享的下载线程池"""
+    with profiler.span(source.name):
+        return _crawl_source(source, savepath, search_word, executor, incremental, known_results, stop_after_known)
+
+
+def _crawl_source(source, savepath, search_word, executor, incremental, known_results, stop_after_known):
+    with profiler.span("open_browser"):
+        browser = open_browser()
+    with profiler.span("search"):
+        source.search(browser, search_word)
+
+    with hash_lock:
+        last_index = checkpoint["source_index"].get(source.name, 0)
+    # 增量模式只关心结果列表开头的新内容
+    start_index = 0 if incremental else last_index
+    early_stop = EarlyStop(stop_after_known)
+    maintainer = BrowserMaintainer(
+        thumbnail_selector=source.result_selector,
+        preview_selector=source.preview_selector,
+        **BROWSER_MAINTENANCE,
+    )
+
+    with profiler.span("harvest"):
+        thumbnails = source.harvest(browser, start_index)
+    print(f"[{source.name}] 找到 {len(thumbnails)} 张缩略图，从索引 {start_index} 开始处理")
+
+    current_index = start_index
+    while current_index < len(thumbnails):
+        # 定期清理已处理的节点；内存超限时重启会话，从当前位置继续
+        with profiler.span("maintain"):
+            restart = maintainer.maintain(browser)
+        if restart:
+            print(f"[{source.name}] 浏览器内存超过 {maintainer.memory_limit_mb}MB，重启会话")
+            with profiler.span("restart"):
+                try:
+                    browser.quit()
+                except:
+                    pass
+                browser = open_browser()
+                source.search(browser, search_word)
+                thumbnails = source.harvest(browser, current_index)
+            maintainer.restarted()
+            if current_index >= len(thumbnails):
+                break
+
+        thumbnail = thumbnails[current_index]
+        current_index += 1
+        print(f"[{source.name}] 正在处理第 {current_index}/{len(thumbnails)} 张缩略图")
 
-    search_box = browser.find_element(By.NAME, "q")
-    search_box.send_keys(search_word) 
-    search_box.submit()
-    time.sleep(2)
+        try:
+            if source.is_too_small(thumbnail):
+                continue
+
+            # 缩略图已见过时无需点击预览
+            thumb_phash = None
+            if incremental:
+                with profiler.span("thumbnail_phash"):
+                    thumb_phash = thumbnail_phash(source.thumbnail_src(thumbnail))
+                if known_results.is_known_thumbnail(thumb_phash):
+                    if early_stop.mark(True):
+                        break
+                    continue
 
-    checkpoint = load_checkpoint()
+            with profiler.span("extract_url"):
+                img_url = source.extract_url(browser, thumbnail)
+            if not img_url:
+                continue
+
+            on_stored = None
+            if incremental:
+                known = known_results.is_known_url(img_url)
+                if early_stop.mark(known):
+                    break
+                if known:
+                    continue
+                # 下载成功后才记为已知，失败或被拒绝的结果下次仍会尝试
+                on_stored = functools.partial(known_results.add, img_url, thumb_phash)
 
-    print(1)
-    print(checkpoint)
+            executor.submit(download_image, savepath, img_url, on_stored)
+            if not incremental:
+                with hash_lock:
+                    checkpoint["source_index"][source.name] = current_index - 1
+                    save_checkpoint(checkpoint)
 
-    processed_hashes = set(checkpoint["processed_hashes"])
-    last_index = checkpoint["last_index"]
+        except Exception as e:
+            print(f"[{source.name}] 缩略图处理异常: {str(e)}")
 
-    print(last_index)
+        finally:
+            maintainer.processed(thumbnail)
 
-    max_scroll_attempts = 20
-    scroll_attempt = 0
-    while True:
-        WebDriverWait(browser, 10).until(
-            EC.presence_of_all_elements_located((By.CSS_SELECTOR, "img.YQ4gaf"))
-        )
-        thumbnails = browser.find_elements(By.CSS_SELECTOR, "img.YQ4gaf")
+    try:
+        browser.quit()
+    except:
+        pass
 
-        if len(thumbnails) > last_index or scroll_attempt >= max_scroll_attempts:
-            break
+    return {
+        "browser": maintainer.stats(),
+        "incremental": {
+            "known": early_stop.known,
+            "new": early_stop.new,
+            "stopped_early": early_stop.should_stop(),
+        } if incremental else None,
+    }
 
-        browser.execute_script("window.scrollBy(0, 2000)")
-        time.sleep(1.5)
-        scroll_attempt += 1
 
-    print(f"找到 {len(thumbnails)} 张缩略图，从索引 {last_index} 开始处理")
+def spider(savepath, search_word, incremental=False, stop_after_known=INCREMENTAL_STOP_AFTER,
+           search_url=SEARCH_URL, sources=None, profile=None):
+    """爬取搜索结果
 
-    if not os.path.exists(savepath):
-        os.makedirs(savepath)
+    sources为多个来源适配器时并发爬取，共用同一个去重与下载流程；
+    incremental为True时从结果开头检查，连续遇到已知结果后提前结束；
+    profile为"spans"、"cprofile"或"stack"时记录各阶段耗时，报告写入savepath。
+    """
 
+    global processed_hashes, rejected_hashes, checkpoint, concurrency, quality_gate, normalizer, profiler
 
-    with ThreadPoolExecutor(max_workers=4) as executor:
-        for offset, thumbnail in enumerate(thumbnails[last_index:]):
-            current_index = last_index + offset
-            print(f"正在处理第 {current_index + 1}/{len(thumbnails)} 张缩略图")
+    profiler = CrawlProfiler(profile)
+    profiler.start()
 
-            try:
-                width = thumbnail.get_attribute("width")
-                height = thumbnail.get_attribute("height")
-                if not width or not height or int(width) <= 50 or int(height) <= 50:
-                    continue
+    if sources is None:
+        sources = [GoogleImagesSource(search_url)]
 
-                retries = 3
-                while retries > 0:
-                    try:
-                        ActionChains(browser).move_to_element(thumbnail).click().perform()
-                        time.sleep(1)
-
-                        high_res_img = WebDriverWait(browser, 3).until(
-                            EC.presence_of_element_located((By.CSS_SELECTOR, "img[jsname='kn3ccd']"))
-                        )
-                        img_url = high_res_img.get_attribute("src")
-
-                        if img_url:
-                            executor.submit(download_image, savepath, img_url)
-                            with hash_lock:
-                                checkpoint["last_index"] = current_index
-                                save_checkpoint(checkpoint)
-                        break
+    checkpoint = load_checkpoint()
 
-                    except StaleElementReferenceException:
-                        retries -= 1
-                        if retries == 0:
-                            print("达到最大重试次数")
-                        time.sleep(1)
-                    except TimeoutException:
-                        break
+    # 检查点与去重共用同一个哈希集合实例
+    processed_hashes = checkpoint["processed_hashes"]
+    rejected_hashes = checkpoint["rejected_hashes"]
+    print(f"已加载 {len(processed_hashes)} 个哈希，占用 {processed_hashes.memory_footprint()} 字节")
 
-            except Exception as e:
-                print(f"缩略图处理异常: {str(e)}")
+    known_results = KnownResults(savepath) if incremental else None
 
-    try:
-        browser.quit()
-    except:
-        pass
+    if not os.path.exists(savepath):
+        os.makedirs(savepath)
+
+
+    concurrency = AIMDController(min_limit=MIN_DOWNLOAD_WORKERS, max_limit=MAX_DOWNLOAD_WORKERS)
+    quality_gate = QualityGate(**QUALITY_THRESHOLDS)
+    normalizer = ImageNormalizer(**NORMALIZE_OPTIONS) if NORMALIZE_OPTIONS else None
+    source_metrics = {}
+    with ThreadPoolExecutor(max_workers=MAX_DOWNLOAD_WORKERS) as executor:
+        with ThreadPoolExecutor(max_workers=len(sources)) as fanout:
+            futures = {
+                source.name: fanout.submit(
+                    crawl_source, source, savepath, search_word, executor,
+                    incremental, known_results, stop_after_known,
+                )
+                for source in sources
+            }
+            for name, future in futures.items():
+                try:
+                    source_metrics[name] = future.result()
+                except Exception as e:
+                    print(f"[{name}] 来源爬取失败: {str(e)}")
+                    source_metrics[name] = {"error": str(e)}
+
+    metrics = {
+        "concurrency": concurrency.metrics(),
+        "quality": quality_gate.stats(),
+        "sources": source_metrics,
+    }
+    # 转码完成时才回调登记已知结果，等全部写入后再保存
+    if normalizer is not None:
+        normalizer.shutdown(wait=True)
+        metrics["normalize"] = normalizer.stats()
+        print(f"转码节省 {metrics['normalize']['bytes_saved']} 字节")
+    if incremental:
+        known_results.save()
+    print(f"下载并发上限: {metrics['concurrency']['limit']}，调整记录 {len(metrics['concurrency']['history'])} 条")
+    print(f"质量过滤: {metrics['quality']}")
+    for name, stats in source_metrics.items():
+        print(f"[{name}] {stats}")
+    if profiler.enabled:
+        profiler.stop()
+        paths = profiler.dump(savepath)
+        metrics["profile"] = profiler.report()["stages"]
+        print(f"性能分析报告: {paths}")
+    return metrics
 
 
 if __name__ == "__main__":
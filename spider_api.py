@@ -1,36 +1,51 @@
-from flask import Flask, request, jsonify
+from fastapi import APIRouter, FastAPI, HTTPException
+from pydantic import BaseModel
 from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.action_chains import ActionChains
-from selenium.common.exceptions import StaleElementReferenceException, TimeoutException
+from typing import Optional
+from contextlib import asynccontextmanager
+import asyncio
+import aiohttp
 import time
-import requests
 import os
 import base64
 import hashlib
 from PIL import Image
 import io
-import threading
-from concurrent.futures import ThreadPoolExecutor
-import imagehash
 import json
+import uuid
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from hash_store import CompactHashSet
+from content_index import get_content_index
+from crawl_concurrency import AIMDController
+from image_quality import QualityGate, make_preview
+from image_normalize import ImageNormalizer
+from crawl_incremental import EarlyStop, KnownResults, thumbnail_phash
+from browser_maintenance import MAINTENANCE_OPTIONS, BrowserMaintainer
+from search_sources import make_sources
+from crawl_coordination import index_range_units, make_coordinator, node_id, url_units
+from crawl_profiling import PROCESS_WIDE_MODES, PROFILE_MODES, CrawlProfiler
 
-app = Flask(__name__)
+SEARCH_URL = "https://www.google.com/imghp"
 
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"}
 
-# 全局状态管理
-class CrawlerState:
-    def __init__(self):
-        self.save_dir = None
-        self.browser = None
-        self.checkpoint_path = None
-        self.is_running = False
-        self.lock = threading.Lock()
+# Selenium调用是阻塞的，所有任务共用一个有界线程池
+SELENIUM_WORKERS = int(os.environ.get("CRAWL_SELENIUM_WORKERS", "8"))
+selenium_executor = ThreadPoolExecutor(max_workers=SELENIUM_WORKERS, thread_name_prefix="selenium")
 
+# 保留的已结束任务数量
+MAX_FINISHED_JOBS = 50
 
-state = CrawlerState()
+
+async def run_blocking(fn, *args):
+    """在Selenium线程池中执行阻塞调用，保留当前协程的分析上下文"""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(selenium_executor, functools.partial(ctx.run, fn, *args))
 
 
 def init_browser():
@@ -38,7 +53,9 @@ def init_browser():
     options.add_argument("--disable-infobars")
     options.add_argument("--disable-dev-shm-usage")
     options.add_argument("--headless")  # 无头模式
-    return webdriver.Chrome(options=options)
+    browser = webdriver.Chrome(options=options)
+    browser.set_window_size(1500, 1000)
+    return browser
 
 
 def load_checkpoint(save_dir):
@@ -47,12 +64,18 @@ def load_checkpoint(save_dir):
         with open(checkpoint_path, 'r') as f:
             data = json.load(f)
             return {
-                "processed_hashes": set(data["processed_hashes"]),
-                "last_index": data["last_index"]
+                "processed_hashes": CompactHashSet(data["processed_hashes"]),
+                # 质量不合格或无法解码的内容，之后不再下载与解码
+                "rejected_hashes": CompactHashSet(data.get("rejected_hashes", [])),
+                "last_index": data["last_index"],
+                # 旧检查点只有Google的last_index
+                "source_index": data.get("source_index", {"google": data["last_index"]})
             }
     return {
-        "processed_hashes": set(),
-        "last_index": 0
+        "processed_hashes": CompactHashSet(),
+        "rejected_hashes": CompactHashSet(),
+        "last_index": 0,
+        "source_index": {}
     }
 
 
@@ -62,154 +85,671 @@ def save_checkpoint(save_dir, checkpoint):
     with open(checkpoint_path, 'w') as f:
         json.dump({
             "processed_hashes": list(checkpoint["processed_hashes"]),
-            "last_index": checkpoint["last_index"]
+            "rejected_hashes": list(checkpoint["rejected_hashes"]),
+            "last_index": checkpoint["source_index"].get("google", checkpoint["last_index"]),
+            "source_index": checkpoint["source_index"]
         }, f)
 
 
-def crawler_task(save_dir):
-    with state.lock:
+def inspect_image(img_data, quality_gate, profiler):
+    """验证图片并做质量检查，在线程中执行；图片损坏时抛出异常"""
+    with profiler.span("decode"):
+        img_pil = Image.open(io.BytesIO(img_data))
+        img_pil.verify()
+        img_pil = Image.open(io.BytesIO(img_data))
+
+    # 复用同一次解码的缩小灰度图
+    with profiler.span("preview"):
+        preview = make_preview(img_pil)
+    with profiler.span("quality"):
+        return quality_gate.check(preview, img_pil.size)
+
+
+def write_image(img_data, save_dir, current_hash, img_url, content_index):
+    filename = os.path.join(save_dir, f"{current_hash}.jpg")
+    with open(filename, "wb") as f:
+        f.write(img_data)
+    content_index.register(current_hash, filename, img_url)
+    return filename
+
+
+class CrawlOptions(BaseModel):
+    save_dir: str
+    search_word: str = "car accident"
+    sources: list[str] = ["google"]
+    min_workers: int = 2
+    max_workers: int = 16
+    quality: Optional[dict] = None
+    normalize: Optional[dict] = None
+    incremental: bool = False
+    stop_after_known: int = 20
+    maintenance: Optional[dict] = None
+    coordinator: Optional[str] = None
+    max_results: int = 500
+    unit_size: int = 50
+    lease_ttl: int = 300
+    profile: Optional[str] = None
+
+    def check(self):
+        """校验任务配置，无效时抛出ValueError"""
+        if not self.save_dir:
+            raise ValueError("需要提供保存路径")
+
+        if not self.sources:
+            raise ValueError("需要至少一个搜索来源")
+        make_sources(self.sources)
+
+        if not 1 <= self.min_workers <= self.max_workers:
+            raise ValueError("并发上下限配置无效")
+
+        if self.normalize:
+            # 未知的参数名或无效的取值在启动前报错；线程池在提交任务前不会创建线程
+            try:
+                ImageNormalizer(**self.normalize).shutdown(wait=False)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"转码配置无效: {str(e)}")
+
         try:
-            state.browser = init_browser()
-            state.browser.set_window_size(1500, 1000)
-            state.browser.get("https://www.google.com/imghp")
+            QualityGate(**(self.quality or {}))
+        except TypeError:
+            raise ValueError("质量阈值配置无效")
 
-            # 搜索流程
-            search_box = WebDriverWait(state.browser, 15).until(
-                EC.presence_of_element_located((By.NAME, "q"))
+        unknown = [key for key in (self.maintenance or {}) if key not in MAINTENANCE_OPTIONS]
+        if unknown:
+            raise ValueError(f"未知的浏览器维护参数: {', '.join(unknown)}")
+        try:
+            BrowserMaintainer(**(self.maintenance or {}))
+        except TypeError:
+            raise ValueError("浏览器维护配置无效")
+
+        if self.coordinator:
+            try:
+                make_coordinator(self.coordinator)
+            except (ValueError, RuntimeError) as e:
+                raise ValueError(f"协调后端配置无效: {str(e)}")
+        if self.max_results < 1 or self.unit_size < 1 or self.lease_ttl < 1:
+            raise ValueError("工作单元配置无效")
+
+        if self.profile not in PROFILE_MODES:
+            raise ValueError(f"不支持的分析模式: {self.profile}")
+
+
+class FrontierRequest(BaseModel):
+    urls: list[str]
+    coordinator: Optional[str] = None
+
+
+class CrawlJob:
+    """一次爬取任务：浏览器操作在有界线程池中执行，下载与去重在事件循环中完成"""
+
+    def __init__(self, options, search_url=SEARCH_URL):
+        self.id = uuid.uuid4().hex
+        self.options = options
+        self.save_dir = options.save_dir
+        self.search_url = search_url
+        self.status = "pending"
+        self.error = None
+        self.started = None
+        self.finished = None
+        self.task = None
+
+        self.profiler = CrawlProfiler(options.profile)
+        self.concurrency = AIMDController(min_limit=options.min_workers, max_limit=options.max_workers)
+        self.quality_gate = QualityGate(**(options.quality or {}))
+        self.normalizer = None
+        self.coordinator = None
+        self.browsers = {}
+        self.early_stops = {}
+        self.maintainers = {}
+
+        self._downloads = set()
+        # 正在处理中的MD5，避免同一内容被并发的下载重复处理
+        self._claimed = set()
+        self._checkpoint_lock = None
+        self._checkpoint_dirty = False
+
+    @property
+    def is_running(self):
+        return self.status in ("pending", "running")
+
+    async def run(self):
+        opts = self.options
+        self.status = "running"
+        self.started = time.time()
+        self.profiler.start()
+        try:
+            self.normalizer = ImageNormalizer(**opts.normalize) if opts.normalize else None
+            if opts.coordinator:
+                self.coordinator = await asyncio.to_thread(make_coordinator, opts.coordinator)
+            adapters = make_sources(
+                opts.sources, google={"search_url": self.search_url, "preview_timeout": 10}
             )
-            search_box.send_keys("car accident")
-            search_box.submit()
-            time.sleep(3)
-
-            # 加载检查点
-            checkpoint = load_checkpoint(save_dir)
-            processed_hashes = checkpoint["processed_hashes"]
-            last_index = checkpoint["last_index"]
-
-            # 滚动加载
-            max_scroll_attempts = 20
-            scroll_attempt = 0
-            while True:
-                thumbnails = state.browser.find_elements(By.CSS_SELECTOR, "img.YQ4gaf")
-                if len(thumbnails) > last_index + 5 or scroll_attempt >= max_scroll_attempts:
+
+            # 加载检查点；增量模式下第一次写文件可能早于保存检查点，先创建目录
+            await asyncio.to_thread(os.makedirs, self.save_dir, exist_ok=True)
+            self.checkpoint = await asyncio.to_thread(load_checkpoint, self.save_dir)
+            self.processed_hashes = self.checkpoint["processed_hashes"]
+            self.rejected_hashes = self.checkpoint["rejected_hashes"]
+            print(f"已加载 {len(self.processed_hashes)} 个哈希，占用 {self.processed_hashes.memory_footprint()} 字节")
+
+            # 增量模式从结果开头检查，连续遇到已知结果后提前结束
+            self.known_results = KnownResults(self.save_dir) if opts.incremental else None
+            self.content_index = get_content_index()
+            self._checkpoint_lock = asyncio.Lock()
+
+            # 多节点协调：按索引区间租用工作单元，去重键在所有节点间共享
+            self.owner = node_id()
+            if self.coordinator is not None:
+                for source in adapters:
+                    await asyncio.to_thread(
+                        self.coordinator.add_units,
+                        index_range_units(opts.search_word, source.name, opts.max_results, opts.unit_size),
+                    )
+
+            timeout = aiohttp.ClientTimeout(total=20)
+            async with aiohttp.ClientSession(timeout=timeout, headers=HEADERS, trust_env=True) as session:
+                self.session = session
+
+                # 多个来源并发爬取，共用去重与下载流程
+                crawls = {source.name: self.crawl_source(source) for source in adapters}
+                if self.coordinator is not None:
+                    crawls["url"] = self.crawl_frontier()
+                results = await asyncio.gather(*crawls.values(), return_exceptions=True)
+                for name, result in zip(crawls, results):
+                    if isinstance(result, Exception):
+                        print(f"[{name}] 来源爬取失败: {str(result)}")
+
+                while self._downloads:
+                    await asyncio.gather(*list(self._downloads), return_exceptions=True)
+
+            if opts.incremental:
+                await asyncio.to_thread(self.known_results.save)
+            self.status = "finished"
+
+        except asyncio.CancelledError:
+            self.status = "cancelled"
+            raise
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+            print(f"爬取任务失败: {str(e)}")
+        finally:
+            for download in list(self._downloads):
+                download.cancel()
+            if self.normalizer is not None:
+                await asyncio.to_thread(self.normalizer.shutdown, True)
+            for browser in self.browsers.values():
+                try:
+                    await run_blocking(browser.quit)
+                except Exception:
+                    pass
+            if self.profiler.enabled:
+                self.profiler.stop()
+                paths = await asyncio.to_thread(self.profiler.dump, self.save_dir)
+                print(f"性能分析报告: {paths}")
+            self.finished = time.time()
+
+    def spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._downloads.add(task)
+        task.add_done_callback(self._downloads.discard)
+        return task
+
+    async def save_checkpoint(self):
+        # 写入期间的多次保存请求合并为一次
+        self._checkpoint_dirty = True
+        if self._checkpoint_lock.locked():
+            return
+        async with self._checkpoint_lock:
+            while self._checkpoint_dirty:
+                self._checkpoint_dirty = False
+                # 在事件循环中生成快照，写文件放到线程中
+                snapshot = dict(
+                    self.checkpoint,
+                    processed_hashes=list(self.processed_hashes),
+                    rejected_hashes=list(self.rejected_hashes),
+                    source_index=dict(self.checkpoint["source_index"]),
+                )
+                with self.profiler.span("checkpoint"):
+                    await asyncio.to_thread(save_checkpoint, self.save_dir, snapshot)
+
+    async def fetch_image(self, img_url):
+        # 下载并把延迟、错误与限流情况反馈给并发控制器
+        async with self.concurrency.async_slot():
+            with self.profiler.span("fetch"):
+                start = time.monotonic()
+                try:
+                    async with self.session.get(img_url) as response:
+                        response.raise_for_status()
+                        data = await response.read()
+                except aiohttp.ClientResponseError as e:
+                    self.concurrency.record(time.monotonic() - start, ok=False, throttled=e.status in (429, 503))
+                    raise
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    self.concurrency.record(time.monotonic() - start, ok=False)
+                    raise
+                self.concurrency.record(time.monotonic() - start, nbytes=len(data))
+                return data
+
+    async def place_known_content(self, current_hash, img_url=None):
+        # 内容已被其他任务保存时，直接链接到当前目录
+        placed = await asyncio.to_thread(self.content_index.place, current_hash, self.save_dir)
+        if placed is None:
+            return False
+        await asyncio.to_thread(self.content_index.record_url, img_url, current_hash)
+        self.processed_hashes.add(current_hash)
+        await self.share_content(current_hash)
+        await self.save_checkpoint()
+        return True
+
+    async def share_content(self, current_hash):
+        # 内容确实保存后才写入共享去重键；拒绝、写入失败或节点中途退出时其他节点仍可保存
+        if self.coordinator is not None:
+            await asyncio.to_thread(self.coordinator.check_and_insert, f"md5:{current_hash}")
+
+    async def reject_content(self, current_hash, img_url):
+        # 记住被拒绝的内容；URL登记到全局索引，下次无需再下载
+        await asyncio.to_thread(self.content_index.record_url, img_url, current_hash)
+        self.rejected_hashes.add(current_hash)
+        await self.save_checkpoint()
+
+    async def download_image(self, img_url):
+        """返回内容是否已保存（或此前已有），失败或被拒绝时返回False"""
+        with self.profiler.span("download"):
+            try:
+                return bool(await self._download_image(img_url))
+            except Exception as e:
+                print(f"下载失败: {str(e)}")
+                return False
+
+    async def _download_image(self, img_url):
+        with self.profiler.span("index"):
+            known_hash = await asyncio.to_thread(self.content_index.lookup_url, img_url)
+        if known_hash is not None:
+            if known_hash in self.processed_hashes:
+                return True
+            if known_hash in self.rejected_hashes:
+                return False
+            if await self.place_known_content(known_hash):
+                return True
+
+        if img_url.startswith("data:image"):
+            header, data = img_url.split(",", 1)
+            img_data = base64.b64decode(data)
+        else:
+            img_data = await self.fetch_image(img_url)
+
+        if len(img_data) < 2048:
+            return
+
+        current_hash = hashlib.md5(img_data).hexdigest()
+        # 检查与登记之间没有await，同一内容只会被一个协程处理
+        if current_hash in self.processed_hashes:
+            return True
+        if current_hash in self.rejected_hashes or current_hash in self._claimed:
+            return False
+        self._claimed.add(current_hash)
+        try:
+            return await self._store_image(img_data, current_hash, img_url)
+        finally:
+            self._claimed.discard(current_hash)
+
+    async def _store_image(self, img_data, current_hash, img_url):
+        # 其他节点已保存的内容直接跳过；两个节点同时处理同一内容时可能各保存一份
+        if self.coordinator is not None:
+            if await asyncio.to_thread(self.coordinator.has_key, f"md5:{current_hash}"):
+                return True
+        if await self.place_known_content(current_hash, img_url):
+            return True
+
+        # 解码与质量检查是CPU密集的，放到线程中
+        try:
+            reason, scores = await asyncio.to_thread(inspect_image, img_data, self.quality_gate, self.profiler)
+        except Exception:
+            await self.reject_content(current_hash, img_url)
+            raise
+        if reason is not None:
+            await self.reject_content(current_hash, img_url)
+            return False
+
+        # 保存文件，开启转码时在独立线程池中完成；写入成功后才更新检查点
+        if self.normalizer is not None:
+            content_index = self.content_index
+            with self.profiler.span("write"):
+                await asyncio.wrap_future(self.normalizer.submit(
+                    img_data, self.save_dir, current_hash,
+                    on_saved=lambda path: content_index.register(current_hash, path, img_url),
+                ))
+        else:
+            with self.profiler.span("write"):
+                await asyncio.to_thread(
+                    write_image, img_data, self.save_dir, current_hash, img_url, self.content_index
+                )
+
+        # 更新检查点
+        self.processed_hashes.add(current_hash)
+        await self.share_content(current_hash)
+        await self.save_checkpoint()
+        return True
+
+    async def fetch_result(self, img_url, thumb_phash=None):
+        # 下载成功后才记为已知，失败或被拒绝的结果下次增量爬取时仍会尝试
+        if await self.download_image(img_url) and self.options.incremental:
+            self.known_results.add(img_url, thumb_phash)
+
+    async def crawl_source(self, source):
+        with self.profiler.span(source.name):
+            await self._crawl_source(source)
+
+    async def _crawl_source(self, source):
+        # 每个来源使用独立浏览器，下载任务在事件循环中并发执行
+        opts = self.options
+        with self.profiler.span("open_browser"):
+            browser = self.browsers[source.name] = await run_blocking(init_browser)
+        query = opts.search_word
+        with self.profiler.span("search"):
+            await run_blocking(source.search, browser, query)
+
+        early_stop = self.early_stops[source.name] = EarlyStop(opts.stop_after_known)
+        self.maintainers[source.name] = BrowserMaintainer(
+            thumbnail_selector=source.result_selector,
+            preview_selector=source.preview_selector,
+            **(opts.maintenance or {}),
+        )
+
+        if self.coordinator is None:
+            last_index = self.checkpoint["source_index"].get(source.name, 0)
+            await self.crawl_range(source, query, 0 if opts.incremental else last_index)
+            return
+
+        # 协调模式下进度保存在共享前沿中，本地检查点的索引不再使用
+        while not early_stop.should_stop():
+            unit = await asyncio.to_thread(self.coordinator.lease, self.owner, opts.lease_ttl, source.name)
+            if unit is None:
+                break
+            if unit["query"] != query:
+                query = unit["query"]
+                with self.profiler.span("search"):
+                    await run_blocking(source.search, self.browsers[source.name], query)
+                self.maintainers[source.name].new_page()
+            downloads = await self.crawl_range(source, query, unit["start"], unit["end"], unit["id"])
+            if downloads is not None:
+                # 单元内的下载全部结束后才标记完成，浏览器继续处理下一个单元
+                self.spawn(self.finish_unit(unit["id"], downloads))
+
+    async def finish_unit(self, unit_id, downloads):
+        """等待单元内的下载结束并续租，之后标记完成；续租失败说明单元已被其他节点接管"""
+        ttl = self.options.lease_ttl
+        pending = set(downloads)
+        while pending:
+            _, pending = await asyncio.wait(pending, timeout=ttl / 3)
+            if pending and not await asyncio.to_thread(self.coordinator.renew, unit_id, self.owner, ttl):
+                print(f"租约已失效: {unit_id}")
+                return
+        await asyncio.to_thread(self.coordinator.complete, unit_id, self.owner)
+
+    async def crawl_range(self, source, query, start_index, end_index=None, unit_id=None):
+        """处理[start_index, end_index)区间的结果，返回其中启动的下载任务；租约失效时返回None"""
+        opts = self.options
+        browser = self.browsers[source.name]
+        early_stop = self.early_stops[source.name]
+        maintainer = self.maintainers[source.name]
+
+        # 之前的单元已处理的结果卡片可能已被清理出页面：区间内有被清理的结果时重新打开搜索页，
+        # 否则从索引中扣除区间之前被清理的数量
+        if maintainer.pruned_between(start_index, end_index):
+            with self.profiler.span("search"):
+                await run_blocking(source.search, browser, query)
+            maintainer.new_page()
+        offset = start_index - maintainer.position(start_index)
+
+        # 滚动加载
+        with self.profiler.span("harvest"):
+            thumbnails = await run_blocking(source.harvest, browser, (end_index or start_index + 5) - offset)
+        print(f"[{source.name}] 找到 {len(thumbnails)} 张缩略图，从索引 {start_index} 开始处理")
+
+        last_renew = time.monotonic()
+        downloads = []
+        current_index = start_index
+        while current_index < min(len(thumbnails) + offset, end_index or len(thumbnails) + offset):
+            # 租约过了三分之一就续租，续租失败说明单元已被其他节点接管
+            if unit_id is not None and time.monotonic() - last_renew > opts.lease_ttl / 3:
+                if not await asyncio.to_thread(self.coordinator.renew, unit_id, self.owner, opts.lease_ttl):
+                    print(f"[{source.name}] 租约已失效: {unit_id}")
+                    return None
+                last_renew = time.monotonic()
+
+            # 定期清理已处理的DOM节点；内存超限时重启会话，从当前位置继续
+            with self.profiler.span("maintain"):
+                restart = await run_blocking(maintainer.maintain, browser)
+            if restart:
+                print(f"[{source.name}] 浏览器内存超过 {maintainer.memory_limit_mb}MB，重启会话")
+                with self.profiler.span("restart"):
+                    await run_blocking(browser.quit)
+                    browser = self.browsers[source.name] = await run_blocking(init_browser)
+                    await run_blocking(source.search, browser, query)
+                    thumbnails = await run_blocking(source.harvest, browser, current_index)
+                maintainer.restarted()
+                offset = 0
+                if current_index >= len(thumbnails):
                     break
-                state.browser.execute_script("window.scrollBy(0, 2000)")
-                time.sleep(2)
-                scroll_attempt += 1
 
-            print(f"找到 {len(thumbnails)} 张缩略图，从索引 {last_index} 开始处理")
+            thumbnail = thumbnails[current_index - offset]
+            current_index += 1
+            try:
+                if int(await run_blocking(thumbnail.get_attribute, "naturalWidth") or 100) < 100:
+                    continue
+
+                thumb_phash = None
+                if opts.incremental:
+                    with self.profiler.span("thumbnail_phash"):
+                        src = await run_blocking(source.thumbnail_src, thumbnail)
+                        thumb_phash = await asyncio.to_thread(thumbnail_phash, src)
+                    if self.known_results.is_known_thumbnail(thumb_phash):
+                        if early_stop.mark(True):
+                            break
+                        continue
+
+                with self.profiler.span("extract_url"):
+                    img_url = await run_blocking(source.extract_url, browser, thumbnail)
+                if not img_url:
+                    continue
+
+                if opts.incremental:
+                    known = self.known_results.is_known_url(img_url)
+                    if early_stop.mark(known):
+                        break
+                    if known:
+                        continue
+
+                downloads.append(self.spawn(self.fetch_result(img_url, thumb_phash)))
+                if not opts.incremental and unit_id is None:
+                    self.checkpoint["source_index"][source.name] = current_index - 1
+                    await self.save_checkpoint()
+
+            except Exception as e:
+                print(f"[{source.name}] 处理异常: {str(e)}")
+
+            finally:
+                maintainer.processed(thumbnail, current_index - 1)
+        return downloads
+
+    async def crawl_frontier(self):
+        """下载其他节点或接口提交的前沿URL
+
+        同时持有的租约不超过下载并发上限，下载结束一个再租下一个；
+        等待中的租约定期续租，避免租约在排队时过期被其他节点重复领取。
+        """
+        opts = self.options
+        active = {}
+        exhausted = False
+        last_renew = time.monotonic()
+        while True:
+            while not exhausted and len(active) < opts.max_workers:
+                unit = await asyncio.to_thread(self.coordinator.lease, self.owner, opts.lease_ttl, "url")
+                if unit is None:
+                    exhausted = True
+                    break
+                active[self.spawn(self.download_image(unit["url"]))] = unit["id"]
+            if not active:
+                return
+
+            done, _ = await asyncio.wait(active, timeout=opts.lease_ttl / 3, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                await asyncio.to_thread(self.coordinator.complete, active.pop(task), self.owner)
+
+            if time.monotonic() - last_renew > opts.lease_ttl / 3:
+                for task, unit_id in list(active.items()):
+                    if not await asyncio.to_thread(self.coordinator.renew, unit_id, self.owner, opts.lease_ttl):
+                        # 已被其他节点接管，不再由本节点标记完成
+                        print(f"[url] 租约已失效: {unit_id}")
+                        del active[task]
+                last_renew = time.monotonic()
+
+    async def describe(self):
+        coordination = None
+        if self.coordinator is not None:
+            coordination = await asyncio.to_thread(self.coordinator.stats)
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "save_dir": self.save_dir,
+            "search_word": self.options.search_word,
+            "error": self.error,
+            "started": self.started,
+            "finished": self.finished,
+            "metrics": {
+                "concurrency": self.concurrency.metrics(),
+                "quality": self.quality_gate.stats(),
+                "normalize": self.normalizer.stats() if self.normalizer else None,
+                "downloads_pending": len(self._downloads),
+                "sources": {
+                    name: {
+                        "incremental": {
+                            "known": early_stop.known,
+                            "new": early_stop.new,
+                            "stopped_early": early_stop.should_stop()
+                        },
+                        "browser": self.maintainers[name].stats() if name in self.maintainers else None
+                    }
+                    for name, early_stop in self.early_stops.items()
+                },
+                "coordination": coordination,
+                "profile": self.profiler.report()["stages"] if self.profiler.enabled else None
+            }
+        }
 
-            # 线程安全控制
-            hash_lock = threading.Lock()
-            image_lock = threading.Lock()
-            phash_set = set()
 
-            def download_image(img_url):
-                try:
-                    headers = {
-                        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"}
-
-                    if img_url.startswith("data:image"):
-                        header, data = img_url.split(",", 1)
-                        img_data = base64.b64decode(data)
-                    else:
-                        response = requests.get(img_url, headers=headers, timeout=20)
-                        response.raise_for_status()
-                        img_data = response.content
-
-                    if len(img_data) < 2048:
-                        return
-
-                    current_hash = hashlib.md5(img_data).hexdigest()
-                    with hash_lock:
-                        if current_hash in processed_hashes:
-                            return
-
-                    img_pil = Image.open(io.BytesIO(img_data))
-                    img_pil.verify()
-                    img_pil = Image.open(io.BytesIO(img_data))
-
-                    # 保存文件
-                    filename = os.path.join(save_dir, f"{current_hash}.jpg")
-                    with open(filename, "wb") as f:
-                        f.write(img_data)
-
-                    # 更新检查点
-                    with hash_lock:
-                        processed_hashes.add(current_hash)
-                        new_checkpoint = {
-                            "processed_hashes": processed_hashes,
-                            "last_index": checkpoint["last_index"]
-                        }
-                        save_checkpoint(save_dir, new_checkpoint)
-
-                except Exception as e:
-                    print(f"下载失败: {str(e)}")
-
-            # 处理缩略图
-            with ThreadPoolExecutor(max_workers=4) as executor:
-                for offset, thumbnail in enumerate(thumbnails[last_index:]):
-                    current_index = last_index + offset
-                    try:
-                        if int(thumbnail.get_attribute("naturalWidth")) < 100:
-                            continue
-
-                        retries = 3
-                        while retries > 0:
-                            try:
-                                ActionChains(state.browser).move_to_element(thumbnail).click().perform()
-                                time.sleep(1)
-
-                                high_res_img = WebDriverWait(state.browser, 10).until(
-                                    EC.presence_of_element_located((By.CSS_SELECTOR, "img[jsname='kn3ccd']"))
-                                )
-                                img_url = high_res_img.get_attribute("src")
-
-                                if img_url:
-                                    executor.submit(download_image, img_url)
-                                    with hash_lock:
-                                        new_checkpoint["last_index"] = current_index
-                                        save_checkpoint(save_dir, new_checkpoint)
-                                break
-                            except StaleElementReferenceException:
-                                retries -= 1
-                                time.sleep(2)
-                            except TimeoutException:
-                                break
-
-                    except Exception as e:
-                        print(f"处理异常: {str(e)}")
+jobs = {}
 
-        finally:
-            if state.browser:
-                state.browser.quit()
-            state.is_running = False
 
+def start_job(options, search_url=SEARCH_URL):
+    """在当前事件循环中启动任务，并清理过多的已结束任务"""
+    finished = [job_id for job_id, job in jobs.items() if not job.is_running]
+    for job_id in finished[:max(len(finished) - MAX_FINISHED_JOBS + 1, 0)]:
+        del jobs[job_id]
 
-@app.route('/start', methods=['POST'])
-def start_crawl():
-    if state.is_running:
-        return jsonify({"status": "error", "message": "已有任务在运行"}), 400
+    job = CrawlJob(options, search_url)
+    jobs[job.id] = job
+    job.task = asyncio.create_task(job.run())
+    return job
 
-    data = request.json
-    save_dir = data.get('save_dir')
 
-    if not save_dir:
-        return jsonify({"status": "error", "message": "需要提供保存路径"}), 400
+async def shutdown_jobs():
+    tasks = [job.task for job in jobs.values() if job.task is not None and not job.task.done()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
 
-    state.save_dir = save_dir
-    state.is_running = True
-    threading.Thread(target=crawler_task, args=(save_dir,)).start()
-    return jsonify({"status": "success", "message": "任务已启动"})
 
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
 
-@app.route('/status', methods=['GET'])
-def get_status():
-    return jsonify({
-        "is_running": state.is_running,
-        "save_dir": state.save_dir
-    })
+
+router = APIRouter()
+
+
+@router.post("/start")
+async def start_crawl(options: CrawlOptions):
+    try:
+        await asyncio.to_thread(options.check)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # 同一目录共用检查点文件，只允许一个任务
+    save_dir = os.path.abspath(options.save_dir)
+    if any(job.is_running and os.path.abspath(job.save_dir) == save_dir for job in jobs.values()):
+        raise HTTPException(status_code=400, detail="该目录已有任务在运行")
+    # cProfile同一线程只能挂一个，栈采样的结果也会混入其他任务，不允许同时进行
+    if options.profile in PROCESS_WIDE_MODES and any(
+        job.is_running and job.options.profile in PROCESS_WIDE_MODES for job in jobs.values()
+    ):
+        raise HTTPException(status_code=400, detail="已有任务在进行cprofile或stack分析")
+
+    job = start_job(options)
+    return {"status": "success", "message": "任务已启动", "job_id": job.id}
+
+
+@router.get("/status")
+async def get_status():
+    return {
+        "is_running": any(job.is_running for job in jobs.values()),
+        "jobs": [await job.describe() for job in list(jobs.values())],
+    }
+
+
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    return await get_job(job_id).describe()
+
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    job = get_job(job_id)
+    if not job.is_running:
+        raise HTTPException(status_code=400, detail="任务已结束")
+    job.task.cancel()
+    return {"status": "success", "message": "任务已取消"}
+
+
+@router.post("/frontier")
+async def add_frontier(form_data: FrontierRequest):
+    # 向共享前沿提交待下载的图片URL，由任一节点领取
+    coordinator = form_data.coordinator or os.environ.get("CRAWL_COORDINATOR")
+    urls = [url for url in form_data.urls if url]
+    if not coordinator:
+        raise HTTPException(status_code=400, detail="需要提供协调后端")
+    if not urls:
+        raise HTTPException(status_code=400, detail="需要提供URL列表")
+    try:
+        await asyncio.to_thread(lambda: make_coordinator(coordinator).add_units(url_units(urls)))
+    except (ValueError, RuntimeError) as e:
+        raise HTTPException(status_code=400, detail=f"协调后端配置无效: {str(e)}")
+    return {"status": "success", "message": f"已提交 {len(urls)} 个URL"}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await shutdown_jobs()
+
+
+# 独立运行时使用；也可以通过 app.include_router(router) 挂载到已有的FastAPI应用
+app = FastAPI(lifespan=lifespan)
+app.include_router(router)
+
+
+def crawler_task(save_dir, search_url=SEARCH_URL, **options):
+    """同步运行一次爬取任务并返回，供脚本与基准测试使用"""
+    job = CrawlJob(CrawlOptions(save_dir=save_dir, **options), search_url)
+    asyncio.run(job.run())
+    return job
 
 
 if __name__ == '__main__':
-    app.run(port=5000, threaded=True)
\ No newline at end of file
+    import uvicorn
+
+    uvicorn.run(app, port=5000)
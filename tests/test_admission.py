@@ -0,0 +1,176 @@
+import asyncio
+
+import pytest
+from starlette.responses import StreamingResponse
+
+from admission import AdmissionController, QueueFull
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_unlimited_model_has_no_lane():
+    controller = AdmissionController(max_concurrency=2, max_concurrency_by_model={"big": 0})
+
+    async def main():
+        assert await controller.acquire("big", "u1") is None
+        assert controller.stats()["models"] == {}
+
+    run(main())
+
+
+def test_users_are_served_round_robin():
+    controller = AdmissionController(max_concurrency=1, interactive_reserved=0)
+    order = []
+
+    async def request(user, ticket_list):
+        ticket = await controller.acquire("m", user)
+        order.append(user)
+        ticket_list.append(ticket)
+
+    async def main():
+        tickets = []
+        first = await controller.acquire("m", "busy")
+        waiters = [asyncio.create_task(request(user, tickets)) for user in ("busy", "busy", "busy", "other")]
+        await settle()
+        first.release()
+        for _ in waiters:
+            await settle()
+            tickets[-1].release()
+        await asyncio.gather(*waiters)
+
+    run(main())
+    # 另一个用户不必等到busy的请求全部处理完
+    assert order == ["busy", "other", "busy", "busy"]
+
+
+def test_interactive_goes_before_batch_and_batch_keeps_reserve():
+    controller = AdmissionController(max_concurrency=2, interactive_reserved=1)
+    order = []
+
+    async def request(priority):
+        ticket = await controller.acquire("m", priority, priority)
+        order.append(priority)
+        return ticket
+
+    async def main():
+        batch = await controller.acquire("m", "b", "batch")
+        # 保留的槽位只给交互请求
+        queued_batch = asyncio.create_task(request("batch"))
+        await settle()
+        assert not queued_batch.done()
+        interactive = await controller.acquire("m", "i", "interactive")
+        queued_interactive = asyncio.create_task(request("interactive"))
+        await settle()
+
+        interactive.release()
+        await settle()
+        assert order == ["interactive"]
+        batch.release()
+        await settle()
+        assert order == ["interactive", "batch"]
+        for task in (queued_batch, queued_interactive):
+            (await task).release()
+
+    run(main())
+
+
+def test_full_queue_rejects_immediately():
+    controller = AdmissionController(max_concurrency=1, max_queue=1, interactive_reserved=0)
+
+    async def main():
+        ticket = await controller.acquire("m", "u1")
+        waiter = asyncio.create_task(controller.acquire("m", "u2"))
+        await settle()
+        with pytest.raises(QueueFull) as e:
+            await controller.acquire("m", "u3")
+        assert e.value.status_code == 429
+        assert e.value.retry_after >= 1
+        ticket.release()
+        (await waiter).release()
+        assert controller.stats()["models"]["m"]["rejected"] == 1
+
+    run(main())
+
+
+def test_wait_timeout_leaves_queue():
+    controller = AdmissionController(max_concurrency=1, max_wait=0.05, interactive_reserved=0)
+
+    async def main():
+        ticket = await controller.acquire("m", "u1")
+        with pytest.raises(QueueFull):
+            await controller.acquire("m", "u2")
+        stats = controller.stats()["models"]["m"]
+        assert stats["timed_out"] == 1
+        assert stats["queued"] == {"interactive": 0, "batch": 0}
+        ticket.release()
+        assert controller.lane("m").active == {"interactive": 0, "batch": 0}
+
+    run(main())
+
+
+def test_cancelled_waiter_does_not_take_slot():
+    controller = AdmissionController(max_concurrency=1, interactive_reserved=0)
+
+    async def main():
+        ticket = await controller.acquire("m", "u1")
+        waiter = asyncio.create_task(controller.acquire("m", "u2"))
+        await settle()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        ticket.release()
+        lane = controller.lane("m")
+        assert lane.queued == 0
+        assert lane.active == {"interactive": 0, "batch": 0}
+
+    run(main())
+
+
+def test_release_is_idempotent_and_slot_releases():
+    controller = AdmissionController(max_concurrency=1, interactive_reserved=0)
+
+    async def main():
+        ticket = await controller.acquire("m", "u1")
+        ticket.release()
+        ticket.release()
+        assert controller.lane("m").active["interactive"] == 0
+        with pytest.raises(RuntimeError):
+            async with controller.slot("m", "u1"):
+                raise RuntimeError
+        assert controller.lane("m").active["batch"] == 0
+
+    run(main())
+
+
+def test_hold_releases_streaming_ticket_after_body_or_in_background():
+    controller = AdmissionController(max_concurrency=2, interactive_reserved=0)
+
+    async def chunks():
+        yield b"a"
+        yield b"b"
+
+    async def main():
+        lane = controller.lane("m")
+        ticket = await controller.acquire("m", "u1")
+        response = controller.hold(StreamingResponse(chunks()), ticket)
+        assert lane.active["interactive"] == 1
+        assert [chunk async for chunk in response.body_iterator] == [b"a", b"b"]
+        assert lane.active["interactive"] == 0
+
+        # 输出从未开始时，后台任务归还槽位
+        ticket = await controller.acquire("m", "u1")
+        response = controller.hold(StreamingResponse(chunks()), ticket)
+        await response.background()
+        assert lane.active["interactive"] == 0
+
+        ticket = await controller.acquire("m", "u1")
+        controller.hold({"choices": []}, ticket)
+        assert lane.active["interactive"] == 0
+
+    run(main())
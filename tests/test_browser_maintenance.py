@@ -0,0 +1,38 @@
+from browser_maintenance import PRUNE_PREVIEWS_JS, PRUNE_THUMBNAILS_JS, BrowserMaintainer
+from search_sources import BingImagesSource, GoogleImagesSource
+
+
+class RecordingBrowser:
+    def __init__(self):
+        self.scripts = []
+
+    def execute_script(self, script, *args):
+        self.scripts.append((script, args))
+        return list(range(len(args[0]))) if script == PRUNE_THUMBNAILS_JS else 0
+
+    def execute_cdp_cmd(self, *args):
+        raise RuntimeError("no cdp")
+
+
+def maintain(source):
+    browser = RecordingBrowser()
+    maintainer = BrowserMaintainer(
+        prune_every=2, thumbnail_selector=source.result_selector, preview_selector=source.preview_selector
+    )
+    maintainer.processed(object(), 0)
+    assert not maintainer.maintain(browser)
+    assert browser.scripts == []
+    maintainer.processed(object(), 1)
+    assert not maintainer.maintain(browser)
+    assert maintainer.pruned == [0, 1]
+    return browser.scripts
+
+
+def test_preview_pruning_skips_result_thumbnails():
+    scripts = maintain(GoogleImagesSource)
+    assert scripts[1] == (PRUNE_PREVIEWS_JS, ("img[jsname='kn3ccd']", "img.YQ4gaf"))
+
+
+def test_sources_without_preview_pane_prune_only_results():
+    scripts = maintain(BingImagesSource)
+    assert [script for script, _ in scripts] == [PRUNE_THUMBNAILS_JS]
@@ -0,0 +1,84 @@
+import json
+
+import pytest
+
+from chat_history import HistoryCompactor, payload_bytes, summarize_reply
+
+
+def get_text(content):
+    return content if isinstance(content, str) else ""
+
+
+def user(text, images=0):
+    image = {"type": "image_url", "image_url": {"url": "data:image/jpeg;base64," + "A" * 1000}}
+    return {"role": "user", "content": [{"type": "text", "text": text}] + [dict(image) for _ in range(images)]}
+
+
+def conversation():
+    return [
+        {"role": "system", "content": "路面巡检"},
+        user("有没有坑槽", 1),
+        {"role": "assistant", "content": "在图片右侧车道上发现一处坑槽。"},
+        user("这张呢", 2),
+        {"role": "assistant", "content": '{"defects": []}'},
+        user("再看这张", 1),
+    ]
+
+
+def images(message):
+    return sum(1 for part in message["content"] if part.get("type") == "image_url")
+
+
+def test_payload_bytes_counts_string_bytes():
+    messages = conversation()
+    strings = json.dumps(messages, ensure_ascii=False)
+    assert payload_bytes(messages) <= len(strings.encode("utf-8"))
+    assert payload_bytes("坑槽") == 6
+    assert payload_bytes({"a": ["ab", None, 3]}) == 2
+
+
+def test_summary_policy_keeps_latest_images():
+    messages = conversation()
+    original = messages[1]
+    report = HistoryCompactor(get_text, policy="summary", keep_images=1).compact(messages)
+
+    assert [images(m) for m in messages if m["role"] == "user"] == [0, 0, 1]
+    assert messages[1]["content"][0]["text"] == "[第1轮上传的1张图片已省略] 当时的分析结论：在图片右侧车道上发现一处坑槽。"
+    assert messages[3]["content"][0]["text"] == "[第2轮上传的2张图片已省略] 当时的分析结论：未发现缺陷"
+    # 原消息对象不被修改
+    assert images(original) == 1
+    assert report["images_removed"] == 3
+    assert report["bytes_out"] < report["bytes_in"]
+
+
+def test_reference_policy_omits_summary():
+    messages = conversation()
+    HistoryCompactor(get_text, policy="reference", keep_images=2).compact(messages)
+    assert messages[1]["content"][0]["text"] == "[第1轮上传的1张图片已省略]"
+    assert images(messages[3]) == 2
+
+
+def test_nothing_to_compact():
+    compactor = HistoryCompactor(get_text, keep_images=3)
+    assert compactor.compact(conversation()) is None
+    assert HistoryCompactor(get_text, policy="keep", keep_images=0).compact(conversation()) is None
+    assert compactor.stats()["requests"] == 0
+
+
+def test_stats_accumulate():
+    compactor = HistoryCompactor(get_text, keep_images=1)
+    compactor.compact(conversation())
+    compactor.compact(conversation())
+    stats = compactor.stats()
+    assert stats["requests"] == 2
+    assert stats["images_removed"] == 6
+    assert stats["bytes_saved"] > 0
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        HistoryCompactor(get_text, policy="drop")
+
+
+def test_summarize_reply_truncates_text():
+    assert summarize_reply("很长的回答" * 100, limit=10) == "很长的回答很长的回答…"
@@ -0,0 +1,88 @@
+import asyncio
+import threading
+
+import pytest
+
+from crawl_concurrency import AIMDController
+
+
+def fill(controller, latency, count=None, **kwargs):
+    for _ in range(count or controller.window):
+        controller.record(latency, **kwargs)
+
+
+def test_invalid_limits():
+    with pytest.raises(ValueError):
+        AIMDController(min_limit=4, max_limit=2)
+
+
+def test_additive_increase_up_to_max():
+    controller = AIMDController(min_limit=1, max_limit=6, initial=4, window=4)
+    fill(controller, 0.1)
+    assert controller.limit == 5
+    fill(controller, 0.1)
+    fill(controller, 0.1)
+    assert controller.limit == 6
+
+
+def test_multiplicative_decrease_on_throttle_errors_and_latency():
+    controller = AIMDController(min_limit=1, max_limit=16, initial=7, window=4)
+    # 第一个窗口确定基准延迟
+    fill(controller, 0.1)
+    assert controller.limit == 8
+    fill(controller, 0.1, throttled=True, ok=False)
+    assert controller.limit == 4
+    fill(controller, 0.1, ok=False)
+    assert controller.limit == 2
+    fill(controller, 1.0)
+    assert controller.limit == 1
+    assert [reason for _, _, reason in controller.history] == ["init", "increase", "throttled", "errors", "latency"]
+
+
+def test_limit_never_below_min():
+    controller = AIMDController(min_limit=2, max_limit=8, initial=2, window=2)
+    fill(controller, 0.1, ok=False)
+    assert controller.limit == 2
+
+
+def test_threads_never_exceed_limit():
+    controller = AIMDController(min_limit=1, max_limit=2, initial=2)
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def work():
+        with controller.slot():
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            threading.Event().wait(0.01)
+            with lock:
+                active.pop()
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(peak) == 2
+    assert controller.metrics()["in_flight"] == 0
+
+
+def test_async_waiters_wake_on_release():
+    controller = AIMDController(min_limit=1, max_limit=1, initial=1)
+
+    async def main():
+        await controller.acquire_async()
+        waiter = asyncio.create_task(controller.acquire_async())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        # 线程中释放也能唤醒协程等待者
+        await asyncio.to_thread(controller.release)
+        await asyncio.wait_for(waiter, 1)
+        controller.release()
+        async with controller.async_slot():
+            assert controller.metrics()["in_flight"] == 1
+        assert controller.metrics()["in_flight"] == 0
+
+    asyncio.run(main())
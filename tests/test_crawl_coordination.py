@@ -0,0 +1,69 @@
+import time
+
+import pytest
+
+from crawl_coordination import Coordinator, SQLiteCoordinator, index_range_units, url_units
+
+
+@pytest.fixture
+def coordinator(tmp_path):
+    return SQLiteCoordinator(str(tmp_path / "coord.sqlite3"))
+
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        Coordinator()
+
+
+def test_index_range_units_cover_total():
+    units = index_range_units("裂缝", "bing", 25, 10)
+    assert [(u["start"], u["end"]) for u in units] == [(0, 10), (10, 20), (20, 25)]
+    assert units[0]["id"] == "bing|裂缝|0"
+
+
+def test_add_units_is_idempotent(coordinator):
+    units = url_units(["http://a/1.jpg", "http://a/2.jpg"])
+    coordinator.add_units(units)
+    coordinator.add_units(units)
+    assert coordinator.stats()["units"] == {"pending": 2}
+
+
+def test_lease_by_source_and_exhaustion(coordinator):
+    coordinator.add_units(index_range_units("q", "bing", 10, 10) + url_units(["http://a/1.jpg"]))
+    unit = coordinator.lease("n1", 60, "url")
+    assert unit["url"] == "http://a/1.jpg"
+    assert coordinator.lease("n1", 60, "url") is None
+    assert coordinator.lease("n1", 60)["source"] == "bing"
+    assert coordinator.lease("n1", 60) is None
+
+
+def test_renew_and_complete_require_owner(coordinator):
+    coordinator.add_units(url_units(["http://a/1.jpg"]))
+    unit = coordinator.lease("n1", 60)
+    assert coordinator.renew(unit["id"], "n1", 60)
+    assert not coordinator.renew(unit["id"], "n2", 60)
+
+    coordinator.complete(unit["id"], "n2")
+    assert coordinator.stats()["units"] == {"leased": 1}
+    coordinator.complete(unit["id"], "n1")
+    assert coordinator.stats()["units"] == {"done": 1}
+    assert not coordinator.renew(unit["id"], "n1", 60)
+
+
+def test_expired_lease_is_taken_over(coordinator):
+    coordinator.add_units(url_units(["http://a/1.jpg"]))
+    unit = coordinator.lease("n1", 0.05)
+    assert coordinator.lease("n2", 60) is None
+    time.sleep(0.1)
+    assert coordinator.stats()["expired_leases"] == 1
+    assert coordinator.lease("n2", 60)["id"] == unit["id"]
+    # 原持有者已失去租约，不能续租
+    assert not coordinator.renew(unit["id"], "n1", 60)
+
+
+def test_dedup_keys(coordinator):
+    assert not coordinator.has_key("md5:abc")
+    assert coordinator.check_and_insert("md5:abc")
+    assert coordinator.has_key("md5:abc")
+    assert not coordinator.check_and_insert("md5:abc")
+    assert coordinator.stats()["dedup_keys"] == 1
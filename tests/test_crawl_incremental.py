@@ -0,0 +1,43 @@
+import imagehash
+import numpy as np
+
+from crawl_incremental import EarlyStop, KnownResults, normalize_url
+
+
+def test_normalize_url():
+    assert (
+        normalize_url("HTTPS://Example.COM:443/a.jpg?b=2&utm_source=x&a=1&fbclid=y#frag")
+        == "https://example.com/a.jpg?a=1&b=2"
+    )
+    assert normalize_url("http://example.com:8080") == "http://example.com:8080/"
+    assert normalize_url("http://example.com/a?ved=1") == normalize_url("http://example.com/a")
+    assert normalize_url("data:image/png;base64,AAAA") is None
+    assert normalize_url("") is None
+
+
+def test_known_results_persist(tmp_path):
+    phash = imagehash.ImageHash(np.zeros((8, 8), dtype=bool))
+    known = KnownResults(str(tmp_path))
+    known.add("https://example.com/a.jpg?utm_medium=x", phash)
+    assert known.is_known_url("https://EXAMPLE.com/a.jpg")
+    known.save()
+
+    reloaded = KnownResults(str(tmp_path))
+    assert reloaded.is_known_url("https://example.com/a.jpg")
+    near = np.zeros((8, 8), dtype=bool)
+    near[0, :3] = True
+    assert reloaded.is_known_thumbnail(imagehash.ImageHash(near))
+    assert not reloaded.is_known_thumbnail(imagehash.ImageHash(~near))
+    assert not reloaded.is_known_thumbnail(None)
+
+
+def test_early_stop_needs_consecutive_known():
+    stop = EarlyStop(3)
+    assert not stop.mark(True)
+    assert not stop.mark(True)
+    assert not stop.mark(False)
+    assert not stop.mark(True)
+    assert not stop.mark(True)
+    assert stop.mark(True)
+    assert (stop.known, stop.new) == (5, 1)
+    assert not EarlyStop(0).mark(True)
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+from defect_report import extract_json, parse_bbox, parse_defects
+
+
+def answer(*defects):
+    return json.dumps({"defects": list(defects)}, ensure_ascii=False)
+
+
+def test_parse_defects_normalizes_fields():
+    text = "```json\n" + answer(
+        {"type": "keng", "lane": "右侧车道", "location": "右下方", "confidence": 85, "bbox": [0.6, 0.7, 1.2, 0.8]},
+        {"type": "抛洒物", "confidence": 0.5},
+    ) + "\n```"
+    first, second = parse_defects(text)
+    assert first == {
+        "type": "坑槽",
+        "lane": "右侧车道",
+        "location": "右下方",
+        "confidence": 0.85,
+        "description": "",
+        "bbox": [0.6, 0.7, 1.0, 0.8],
+    }
+    assert second["lane"] == "未知"
+    assert "bbox" not in second
+
+
+def test_parse_defects_accepts_empty_list_with_surrounding_text():
+    assert parse_defects('结果如下：{"defects": []}') == []
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "未发现缺陷",
+        '{"defects": "无"}',
+        answer({"type": "裂缝", "confidence": 0.5}),
+        answer({"type": "坑槽", "lane": "人行道", "confidence": 0.5}),
+        answer({"type": "坑槽", "confidence": True}),
+        answer({"type": "坑槽", "confidence": 150}),
+        answer({"type": "坑槽", "confidence": 0.5, "bbox": [0.5, 0.5, 0.4, 0.6]}),
+        answer("坑槽"),
+    ],
+)
+def test_parse_defects_rejects_invalid_output(text):
+    with pytest.raises(ValueError):
+        parse_defects(text)
+
+
+def test_extract_json_reports_syntax_error():
+    with pytest.raises(ValueError, match="JSON格式错误"):
+        extract_json('{"defects": [}')
+
+
+def test_parse_bbox():
+    assert parse_bbox([-0.1, 0.25, 0.5, 1.5]) == [0.0, 0.25, 0.5, 1.0]
+    for bbox in ([0.1, 0.2, 0.3], [0.1, 0.2, 0.3, "0.4"], [0, 0, True, 1], [0.5, 0.1, 0.5, 0.2], None):
+        with pytest.raises(ValueError):
+            parse_bbox(bbox)
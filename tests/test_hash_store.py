@@ -0,0 +1,47 @@
+import hashlib
+
+import pytest
+
+from hash_store import CompactHashSet
+
+
+def md5(i):
+    return hashlib.md5(str(i).encode()).hexdigest()
+
+
+def test_add_and_contains():
+    hashes = CompactHashSet()
+    assert hashes.add(md5(1))
+    assert not hashes.add(md5(1))
+    assert md5(1) in hashes
+    assert md5(2) not in hashes
+    # 字节与十六进制字符串等价
+    assert bytes.fromhex(md5(1)) in hashes
+    assert len(hashes) == 1
+
+
+def test_grows_and_round_trips():
+    digests = [md5(i) for i in range(5000)]
+    hashes = CompactHashSet(digests, capacity=16)
+    assert len(hashes) == 5000
+    assert all(d in hashes for d in digests)
+    assert hashes.stats()["capacity"] >= 10000
+    assert sorted(hashes) == sorted(digests)
+    assert sorted(CompactHashSet(list(hashes))) == sorted(digests)
+
+
+def test_zero_digest_is_stored_separately():
+    zero = "0" * 32
+    hashes = CompactHashSet()
+    assert zero not in hashes
+    assert hashes.add(zero)
+    assert not hashes.add(zero)
+    assert zero in hashes
+    assert list(hashes) == [zero]
+
+
+def test_invalid_digests():
+    hashes = CompactHashSet()
+    with pytest.raises(ValueError):
+        hashes.add("abcd")
+    assert "abcd" not in hashes
@@ -0,0 +1,139 @@
+import asyncio
+import base64
+import io
+import json
+
+import pytest
+from PIL import Image
+from starlette.responses import StreamingResponse
+
+from inspection_cache import InspectionCache, completion_response, sampling_options
+
+
+def image_url(color):
+    buf = io.BytesIO()
+    img = Image.new("RGB", (64, 64), color)
+    for x in range(32):
+        img.putpixel((x, x), (255, 255, 255))
+    img.save(buf, "PNG")
+    return "data:image/png;base64," + base64.b64encode(buf.getvalue()).decode()
+
+
+def messages(text="有没有坑槽", system=None, url=None):
+    result = [{"role": "system", "content": system}] if system else []
+    result.append(
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": text},
+                {"type": "image_url", "image_url": {"url": url or image_url((90, 90, 90))}},
+            ],
+        }
+    )
+    return result
+
+
+def make_key(cache, text="有没有坑槽", system=None, options=None):
+    return asyncio.run(cache.make_key("qwen", "keng", text, messages(text, system), options))
+
+
+async def drain(response):
+    return [chunk async for chunk in response.body_iterator]
+
+
+def sse(chunks):
+    async def body():
+        for chunk in chunks:
+            yield chunk
+
+    return StreamingResponse(body(), media_type="text/event-stream")
+
+
+def delta(content, finish_reason=None):
+    data = {"choices": [{"delta": {"content": content}, "finish_reason": finish_reason}]}
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@pytest.fixture
+def cache():
+    return InspectionCache(max_entries=8)
+
+
+def test_key_ignores_text_formatting(cache):
+    assert make_key(cache).bucket == make_key(cache, " 有没有坑槽。").bucket
+
+
+def test_key_includes_system_messages_and_options(cache):
+    base = make_key(cache).bucket
+    assert make_key(cache, system="只回答是或否").bucket != base
+    assert make_key(cache, options={"max_tokens": 16}).bucket != base
+    assert make_key(cache, options={"temperature": 0.2}).bucket != make_key(cache, options={"temperature": 1}).bucket
+
+
+def test_multi_turn_requests_are_not_cached(cache):
+    history = messages() + [{"role": "assistant", "content": "未发现"}] + messages("再看看")
+    assert asyncio.run(cache.make_key("qwen", "keng", "再看看", history)) is None
+
+
+def test_sampling_options_reads_top_level_and_params():
+    form_data = {"temperature": 0.1, "params": {"max_tokens": 64, "seed": None}, "stream": True}
+    assert sampling_options(form_data) == {"temperature": 0.1, "max_tokens": 64}
+
+
+def test_record_stream_caches_stopped_answer(cache):
+    key = make_key(cache)
+    response = asyncio.run(cache.record(key, sse([delta("发现"), delta("坑槽", "stop"), "data: [DONE]\n\n"])))
+    asyncio.run(drain(response))
+    assert asyncio.run(cache.get(key)) == "发现坑槽"
+
+
+def test_record_stream_skips_truncated_answer(cache):
+    key = make_key(cache)
+    response = asyncio.run(cache.record(key, sse([delta("发现"), delta("坑", "length"), "data: [DONE]\n\n"])))
+    chunks = asyncio.run(drain(response))
+    assert len(chunks) == 3
+    assert asyncio.run(cache.get(key)) is None
+
+
+def test_record_stream_skips_disconnected_answer(cache):
+    key = make_key(cache)
+    asyncio.run(drain(asyncio.run(cache.record(key, sse([delta("发现")])))))
+    assert asyncio.run(cache.get(key)) is None
+
+
+def test_record_dict_requires_stop(cache):
+    key = make_key(cache)
+    truncated = completion_response("发现", "qwen", False)
+    truncated["choices"][0]["finish_reason"] = "length"
+    asyncio.run(cache.record(key, truncated))
+    assert asyncio.run(cache.get(key)) is None
+
+    asyncio.run(cache.record(key, completion_response("未发现坑槽", "qwen", False)))
+    assert asyncio.run(cache.get(key)) == "未发现坑槽"
+
+
+def test_similar_image_hits_and_different_image_misses(cache):
+    key = make_key(cache)
+    asyncio.run(cache.put(key, "未发现坑槽"))
+    same = asyncio.run(cache.make_key("qwen", "keng", "有没有坑槽", messages(url=image_url((91, 90, 90)))))
+    assert asyncio.run(cache.get(same)) == "未发现坑槽"
+
+    other = Image.new("RGB", (64, 64))
+    for x in range(64):
+        for y in range(64):
+            other.putpixel((x, y), (255, 255, 255) if (x // 8 + y // 8) % 2 else (0, 0, 0))
+    buf = io.BytesIO()
+    other.save(buf, "PNG")
+    url = "data:image/png;base64," + base64.b64encode(buf.getvalue()).decode()
+    different = asyncio.run(cache.make_key("qwen", "keng", "有没有坑槽", messages(url=url)))
+    assert asyncio.run(cache.get(different)) is None
+
+
+def test_disk_layer_survives_restart(tmp_path):
+    db = str(tmp_path / "cache.sqlite3")
+    first = InspectionCache(db_path=db)
+    key = make_key(first)
+    asyncio.run(first.put(key, "未发现坑槽"))
+    second = InspectionCache(db_path=db)
+    assert asyncio.run(second.get(key)) == "未发现坑槽"
+    assert second.stats()["disk_hits"] == 1
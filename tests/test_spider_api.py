@@ -0,0 +1,143 @@
+import asyncio
+
+import pytest
+
+import spider_api
+from browser_maintenance import PRUNE_THUMBNAILS_JS, BrowserMaintainer
+from crawl_coordination import SQLiteCoordinator
+from search_sources import SearchSource
+
+TOTAL = 20
+
+
+class FakeResult:
+    def __init__(self, index):
+        self.url = f"https://img.example/{index}.jpg"
+
+    def get_attribute(self, name):
+        return "200" if name == "naturalWidth" else None
+
+
+class FakeBrowser:
+    """结果列表即页面DOM；清理脚本把元素从列表中删除"""
+
+    def __init__(self):
+        self.dom = []
+        self.searches = 0
+
+    def execute_script(self, script, *args):
+        if script != PRUNE_THUMBNAILS_JS:
+            return 0
+        removed = [i for i, result in enumerate(args[0]) if result in self.dom]
+        self.dom = [result for result in self.dom if result not in args[0]]
+        return removed
+
+    def execute_cdp_cmd(self, *args):
+        raise RuntimeError("no cdp")
+
+    def quit(self):
+        pass
+
+
+class FakeSource(SearchSource):
+    name = "fake"
+    result_selector = "img.result"
+    preview_selector = "img.preview"
+
+    def search(self, browser, query):
+        browser.dom = [FakeResult(i) for i in range(TOTAL)]
+        browser.searches += 1
+
+    def harvest(self, browser, min_count, max_scroll_attempts=20):
+        return list(browser.dom)
+
+    def extract_url(self, browser, result):
+        return result.url
+
+
+def run_units(tmp_path, monkeypatch, done_elsewhere=()):
+    browser = FakeBrowser()
+    monkeypatch.setattr(spider_api, "init_browser", lambda: browser)
+    options = spider_api.CrawlOptions(
+        save_dir=str(tmp_path), unit_size=5, max_results=TOTAL, maintenance={"prune_every": 5}
+    )
+    job = spider_api.CrawlJob(options)
+    job.coordinator = SQLiteCoordinator(str(tmp_path / "coord.sqlite3"))
+    job.owner = "me"
+    job.known_results = None
+    fetched = []
+
+    async def fetch_result(img_url, thumb_phash=None):
+        fetched.append(img_url)
+        return True
+
+    job.fetch_result = fetch_result
+    units = spider_api.index_range_units(options.search_word, FakeSource.name, TOTAL, options.unit_size)
+    job.coordinator.add_units(units)
+    for start in done_elsewhere:
+        unit = job.coordinator.lease("other", 60, FakeSource.name)
+        assert unit["start"] == start
+        job.coordinator.complete(unit["id"], "other")
+
+    async def main():
+        await job._crawl_source(FakeSource())
+        while job._downloads:
+            await asyncio.gather(*list(job._downloads))
+
+    asyncio.run(main())
+    return fetched, job, browser
+
+
+def test_units_after_pruning_map_to_their_own_results(tmp_path, monkeypatch):
+    fetched, job, browser = run_units(tmp_path, monkeypatch)
+    assert fetched == [FakeResult(i).url for i in range(TOTAL)]
+    assert job.maintainers["fake"].thumbnails_removed >= 10
+    assert job.coordinator.stats()["units"] == {"done": TOTAL // 5}
+    assert browser.searches == 1
+
+
+def test_units_skipped_by_other_nodes(tmp_path, monkeypatch):
+    fetched, job, _ = run_units(tmp_path, monkeypatch, done_elsewhere=(0,))
+    assert fetched == [FakeResult(i).url for i in range(5, TOTAL)]
+
+
+def test_maintainer_position_and_reopen_check():
+    maintainer = BrowserMaintainer()
+    maintainer.pruned = [0, 1, 2, 5]
+    assert maintainer.position(3) == 0
+    assert maintainer.position(6) == 2
+    assert maintainer.position(5) is None
+    assert maintainer.pruned_between(4, 6)
+    assert not maintainer.pruned_between(6, 10)
+    assert maintainer.pruned_between(3)
+    maintainer.restarted()
+    assert maintainer.position(6) == 6
+
+
+def test_released_unit_that_was_pruned_reopens_search(tmp_path, monkeypatch):
+    browser = FakeBrowser()
+    source = FakeSource()
+    source.search(browser, "q")
+    job = spider_api.CrawlJob(spider_api.CrawlOptions(save_dir=str(tmp_path)))
+    job.browsers["fake"] = browser
+    job.early_stops["fake"] = spider_api.EarlyStop(0)
+    job.maintainers["fake"] = maintainer = BrowserMaintainer(prune_every=1)
+    job.known_results = None
+    fetched = []
+
+    async def fetch_result(img_url, thumb_phash=None):
+        fetched.append(img_url)
+
+    job.fetch_result = fetch_result
+
+    async def main():
+        await job.crawl_range(source, "q", 0, 3, "u0")
+        await job.crawl_range(source, "q", 5, 7, "u1")
+        # 单元0过期后被重新租回，其结果已被清理
+        await job.crawl_range(source, "q", 0, 3, "u0")
+        await asyncio.gather(*list(job._downloads))
+
+    asyncio.run(main())
+    urls = [FakeResult(i).url for i in (0, 1, 2, 5, 6, 0, 1, 2)]
+    assert fetched == urls
+    assert browser.searches == 2
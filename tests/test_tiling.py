@@ -0,0 +1,50 @@
+from tiling import describe_position, merge_defects, tile_boxes, to_image_bbox
+
+
+def defect(defect_type, bbox, confidence, tile):
+    return {"type": defect_type, "bbox": bbox, "confidence": confidence, "lane": "未知", "tiles": [tile]}
+
+
+def test_small_image_is_one_tile():
+    assert tile_boxes(800, 600, 1024) == [(0, 0, 800, 600)]
+
+
+def test_tiles_cover_image_with_overlap():
+    boxes = tile_boxes(3000, 1500, 1024, 0.2)
+    xs = sorted({box[0] for box in boxes})
+    ys = sorted({box[1] for box in boxes})
+    assert xs[0] == 0 and max(box[2] for box in boxes) == 3000
+    assert ys == [0, 476]
+    assert all(box[2] - box[0] == 1024 and box[3] - box[1] == 1024 for box in boxes)
+    # 相邻块至少重叠20%
+    assert all(b - a <= 1024 * 0.8 for a, b in zip(xs, xs[1:]))
+    assert len(boxes) == len(xs) * len(ys)
+
+
+def test_to_image_bbox():
+    assert to_image_bbox((1000, 0, 2000, 1000), [0.5, 0.5, 1.0, 1.0], (2000, 1000)) == [0.75, 0.5, 1.0, 1.0]
+    assert to_image_bbox((0, 0, 1000, 500), None, (2000, 1000)) == [0.0, 0.0, 0.5, 0.5]
+
+
+def test_merge_defects_joins_duplicates_from_overlapping_tiles():
+    merged = merge_defects(
+        [
+            defect("坑槽", [0.40, 0.60, 0.50, 0.70], 0.6, 0),
+            defect("坑槽", [0.42, 0.61, 0.52, 0.71], 0.9, 1),
+            # 重叠区域中只看到一部分
+            defect("坑槽", [0.44, 0.62, 0.46, 0.64], 0.5, 2),
+            defect("抛洒物", [0.42, 0.61, 0.52, 0.71], 0.7, 1),
+            defect("坑槽", [0.05, 0.05, 0.10, 0.10], 0.8, 3),
+        ]
+    )
+    potholes = sorted((d for d in merged if d["type"] == "坑槽"), key=lambda d: d["bbox"])
+    assert len(merged) == 3
+    assert potholes[1]["confidence"] == 0.9
+    assert potholes[1]["bbox"] == [0.40, 0.60, 0.52, 0.71]
+    assert sorted(potholes[1]["tiles"]) == [0, 1, 2]
+    assert potholes[0]["location"] == describe_position([0.05, 0.05, 0.10, 0.10])
+
+
+def test_describe_position():
+    assert describe_position([0.0, 0.8, 0.2, 1.0]) == "图片左侧，距离图片底部约四分之一处"
+    assert describe_position([0.4, 0.0, 0.6, 0.2]) == "图片中央，距离图片底部约三分之二处"
@@ -0,0 +1,124 @@
+"""高分辨率路面图片的分块分析
+
+视觉模型会在内部把大图缩小，小坑槽和细的标线裂缝因此丢失。这里把大图切成互相重叠的块，
+跳过不含路面的块（天空、植被等），各块分别分析后再把结果换算回整图坐标并合并去重。
+"""
+
+import io
+
+import numpy as np
+from PIL import Image, ImageOps
+
+TILE_SIZE = 1024
+TILE_OVERLAP = 0.2
+# 路面像素占比低于该值的块不送入模型
+MIN_ROAD_FRACTION = 0.2
+
+
+def tile_boxes(width, height, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+    """按重叠比例均匀铺满整图的块坐标(x1, y1, x2, y2)"""
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        step = tile_size * (1 - overlap)
+        count = int(np.ceil((length - tile_size) / step)) + 1
+        # 均分剩余长度，最后一块与图片边缘对齐
+        return [round(i * (length - tile_size) / (count - 1)) for i in range(count)]
+
+    return [
+        (x, y, min(x + tile_size, width), min(y + tile_size, height))
+        for y in starts(height)
+        for x in starts(width)
+    ]
+
+
+def road_fraction(tile):
+    """粗略估计路面像素占比：沥青、水泥路面饱和度低、亮度适中，天空偏亮偏蓝，植被饱和度高"""
+    hsv = np.asarray(tile.convert("HSV").resize((64, 64)), dtype=np.int16)
+    saturation, value = hsv[..., 1], hsv[..., 2]
+    road = (saturation < 60) & (value > 35) & (value < 215)
+    return float(road.mean())
+
+
+def make_tiles(data, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, min_road=MIN_ROAD_FRACTION, quality=90):
+    """返回(整图尺寸, [(块坐标, JPEG数据)], 跳过的块数)"""
+    img = ImageOps.exif_transpose(Image.open(io.BytesIO(data))).convert("RGB")
+    tiles = []
+    skipped = 0
+    for box in tile_boxes(img.width, img.height, tile_size, overlap):
+        tile = img.crop(box)
+        if min_road and road_fraction(tile) < min_road:
+            skipped += 1
+            continue
+        out = io.BytesIO()
+        tile.save(out, "JPEG", quality=quality)
+        tiles.append((box, out.getvalue()))
+    return img.size, tiles, skipped
+
+
+def to_image_bbox(tile_box, bbox, size):
+    """块内归一化坐标换算为整图归一化坐标；没有外接框时以整块作为位置"""
+    x1, y1, x2, y2 = tile_box
+    width, height = size
+    if bbox is None:
+        bbox = [0.0, 0.0, 1.0, 1.0]
+    return [
+        round((x1 + bbox[0] * (x2 - x1)) / width, 4),
+        round((y1 + bbox[1] * (y2 - y1)) / height, 4),
+        round((x1 + bbox[2] * (x2 - x1)) / width, 4),
+        round((y1 + bbox[3] * (y2 - y1)) / height, 4),
+    ]
+
+
+def iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    if inter == 0:
+        return 0.0
+    area = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / area
+
+
+def contains(a, b, ratio=0.8):
+    """b的大部分面积落在a内；重叠区域中只被部分看到的同一缺陷常见这种情况"""
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    return inter >= ratio * (b[2] - b[0]) * (b[3] - b[1])
+
+
+def describe_position(bbox):
+    """按整图外接框生成与单图提示词一致的位置描述"""
+    cx = (bbox[0] + bbox[2]) / 2
+    horizontal = "左侧" if cx < 1 / 3 else "右侧" if cx > 2 / 3 else "中央"
+    from_bottom = 1 - (bbox[1] + bbox[3]) / 2
+    if from_bottom < 0.3:
+        distance = "约四分之一处"
+    elif from_bottom < 0.42:
+        distance = "约三分之一处"
+    elif from_bottom < 0.6:
+        distance = "约一半处"
+    else:
+        distance = "约三分之二处"
+    return f"图片{horizontal}，距离图片底部{distance}"
+
+
+def merge_defects(defects, threshold=0.3):
+    """合并相邻块重复报告的同一缺陷，保留置信度最高的描述，外接框取并集"""
+    merged = []
+    for defect in sorted(defects, key=lambda d: d["confidence"], reverse=True):
+        for kept in merged:
+            if kept["type"] != defect["type"]:
+                continue
+            a, b = kept["bbox"], defect["bbox"]
+            if iou(a, b) >= threshold or contains(a, b) or contains(b, a):
+                kept["bbox"] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                kept["tiles"] += defect["tiles"]
+                break
+        else:
+            merged.append(dict(defect))
+    for defect in merged:
+        defect["location"] = describe_position(defect["bbox"])
+    return merged
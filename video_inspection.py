@@ -0,0 +1,165 @@
+"""行车记录仪视频的关键帧提取
+
+视频按帧流式解码，采样间隔随画面变化自适应：画面变化快时加密采样，
+停车、匀速直行等画面变化慢时拉长间隔。与上一关键帧pHash距离过近的采样帧丢弃，
+每个关键帧记录其代表的时间段，巡检结果据此对应回视频时间。
+"""
+
+import time
+
+import imagehash
+from PIL import Image
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".avi", ".mkv", ".ts", ".flv")
+
+
+class Keyframe:
+    def __init__(self, index, timestamp, phash, data):
+        self.index = index
+        self.timestamp = timestamp
+        # 该关键帧代表的时间段，直到下一个关键帧之前的最后一个采样点
+        self.end = timestamp
+        self.phash = phash
+        self.data = data
+
+    def describe(self):
+        return {
+            "frame": self.index,
+            "timestamp": round(self.timestamp, 2),
+            "start": round(self.timestamp, 2),
+            "end": round(self.end, 2),
+        }
+
+
+class KeyframeExtractor:
+    """自适应采样并按pHash去重，产出Keyframe"""
+
+    def __init__(
+        self,
+        interval=1.0,
+        min_interval=0.25,
+        max_interval=5.0,
+        distance=8,
+        max_side=1536,
+        quality=85,
+        max_keyframes=2000,
+    ):
+        if cv2 is None:
+            raise RuntimeError("处理视频需要安装opencv-python-headless包")
+        if not 0 < min_interval <= interval <= max_interval:
+            raise ValueError("采样间隔配置无效")
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        # 与上一关键帧的距离小于该值视为重复画面；超过两倍时认为画面变化快
+        self.distance = distance
+        self.max_side = max_side
+        self.quality = quality
+        self.max_keyframes = max_keyframes
+
+        self.duration = None
+        self.fps = None
+        self.frames = 0
+        self.sampled = 0
+        self.duplicates = 0
+        self.keyframes = 0
+        self.decode_seconds = 0.0
+
+    @staticmethod
+    def frame_phash(frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(gray, (64, 64), interpolation=cv2.INTER_AREA)
+        return imagehash.phash(Image.fromarray(small))
+
+    def encode(self, frame):
+        height, width = frame.shape[:2]
+        scale = self.max_side / max(height, width)
+        if scale < 1:
+            frame = cv2.resize(
+                frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA
+            )
+        ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            raise ValueError("关键帧编码失败")
+        return buffer.tobytes()
+
+    def extract(self, path):
+        """逐帧读取视频，按采样与去重规则产出关键帧；可在任意位置停止迭代"""
+        capture = cv2.VideoCapture(path)
+        if not capture.isOpened():
+            raise ValueError(f"无法打开视频: {path}")
+        try:
+            # 部分录像的帧率信息缺失，按常见的30帧估算
+            self.fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+            frame_count = capture.get(cv2.CAP_PROP_FRAME_COUNT)
+            self.duration = frame_count / self.fps if frame_count > 0 else None
+
+            interval = self.interval
+            next_sample = 0.0
+            last_sample = None
+            pending = None
+            index = -1
+            while True:
+                start = time.perf_counter()
+                index += 1
+                timestamp = index / self.fps
+                if timestamp < next_sample:
+                    # 跳过的帧只取出不转换
+                    ok = capture.grab()
+                    self.decode_seconds += time.perf_counter() - start
+                    if not ok:
+                        break
+                    self.frames += 1
+                    continue
+                ok, frame = capture.read()
+                self.decode_seconds += time.perf_counter() - start
+                if not ok:
+                    break
+                self.frames += 1
+                self.sampled += 1
+
+                phash = self.frame_phash(frame)
+                if last_sample is not None:
+                    change = phash - last_sample
+                    if change >= self.distance * 2:
+                        interval = max(self.min_interval, interval / 2)
+                    elif change < self.distance:
+                        interval = min(self.max_interval, interval * 1.5)
+                last_sample = phash
+                next_sample = timestamp + interval
+
+                if pending is not None and phash - pending.phash < self.distance:
+                    self.duplicates += 1
+                    pending.end = timestamp
+                    continue
+
+                # 新画面：先交出上一个关键帧，其时间段此时才确定
+                if pending is not None:
+                    yield pending
+                if self.keyframes >= self.max_keyframes:
+                    pending = None
+                    break
+                self.keyframes += 1
+                pending = Keyframe(index, timestamp, phash, self.encode(frame))
+
+            if pending is not None:
+                yield pending
+        finally:
+            capture.release()
+
+    def stats(self):
+        return {
+            "duration_s": round(self.duration, 2) if self.duration else None,
+            "fps": round(self.fps, 2) if self.fps else None,
+            "frames": self.frames,
+            "sampled": self.sampled,
+            "duplicates": self.duplicates,
+            "keyframes": self.keyframes,
+            "keyframes_per_min": round(self.keyframes / self.duration * 60, 2) if self.duration else None,
+            "decode_s": round(self.decode_seconds, 2),
+        }